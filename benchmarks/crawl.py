@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""Measure the end-to-end throughput of a crawl against a replay of recorded pages.
+
+Starts `scrapy serve` on a local port, replaying fixtures (see `scrapy record`)
+or an HTTP cache under their original paths, with the given latency, errors,
+rejections and bandwidth cap. Then runs the spiders against it, chained in one
+process with `scrapy chain` (or `scrapy crawl` for a single spider), and
+reports the wall and CPU time of the crawl and the items scraped per second by
+every stage. Pages missing from the recording are answered with a 404, and
+counted by the server.
+
+With --profile, the crawl runs under cProfile: the profile is written to a file,
+for snakeviz or pstats, and the functions with the most own time are printed.
+
+Record a corpus for a full chain by crawling with the fixture recorder first:
+  scrapy chain competitions clubs players appearances -a parents=samples/confederations.json \\
+      -s FIXTURES_RECORD_DIR=benchmarks/replay -s FIXTURES_RECORD_PER_VARIANT=0
+
+Usage:
+  python benchmarks/crawl.py --fixtures benchmarks/replay
+  python benchmarks/crawl.py --fixtures benchmarks/replay --latency 0.2 --error-rate 0.01 \\
+      -s CONCURRENT_REQUESTS=64 -s THROTTLE_ENABLED=True -s THROTTLE_TARGET_RPS=50 --profile /tmp/crawl.prof
+  python benchmarks/crawl.py --cache .scrapy/httpcache --spiders competitions clubs
+"""
+import argparse
+import os
+import pstats
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"The replay server exited with status {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit(f"The replay server did not listen on port {port} within {timeout:.0f}s")
+
+
+def count_lines(file_name) -> int:
+    if not os.path.exists(file_name):
+        return 0
+    with open(file_name, 'rb') as f:
+        return sum(1 for line in f if line.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--fixtures', help="fixtures directory to replay")
+    source.add_argument('--cache', help="HTTP cache directory to replay")
+    parser.add_argument('--spiders', nargs='+', default=['competitions', 'clubs', 'players', 'appearances'],
+                        help="spiders crawled, each one fed by the previous one (default: %(default)s)")
+    parser.add_argument('--parents', default=os.path.join(ROOT, 'samples', 'confederations.json'),
+                        help="parents of the first spider (default: samples/confederations.json)")
+    parser.add_argument('-a', dest='spargs', action='append', default=[], metavar='[STAGE.]NAME=VALUE',
+                        help="spider argument, as with scrapy chain (may be repeated)")
+    parser.add_argument('-s', dest='settings', action='append', default=[], metavar='NAME=VALUE',
+                        help="crawl setting, e.g. CONCURRENT_REQUESTS=32 (may be repeated)")
+    parser.add_argument('--port', type=int, default=0, help="port of the replay server (default: a free port)")
+    parser.add_argument('--rps', type=float, default=0, help="server rate limit, 0 for none (default: %(default)s)")
+    parser.add_argument('--latency', type=float, default=0.0, help="server latency, in seconds")
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help="random latency added, in seconds")
+    parser.add_argument('--reject-rate', type=float, default=0.0, help="fraction of requests rejected with a 429")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with a 500")
+    parser.add_argument('--bandwidth', type=float, default=0, help="server bandwidth cap in KB/s, 0 for none")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the injected latency and errors")
+    parser.add_argument('--profile', metavar='FILE', help="run the crawl under cProfile and write the profile to FILE")
+    parser.add_argument('--top', type=int, default=25, help="functions printed from the profile (default: %(default)s)")
+    args = parser.parse_args()
+
+    port = args.port or free_port()
+    server_command = [
+        sys.executable, '-m', 'scrapy', 'serve', '--port', str(port), '--rps', str(args.rps),
+        '--latency', str(args.latency), '--latency-jitter', str(args.latency_jitter),
+        '--reject-rate', str(args.reject_rate), '--error-rate', str(args.error_rate),
+        '--bandwidth', str(args.bandwidth), '--seed', str(args.seed), '-L', 'INFO',
+    ]
+    if args.fixtures:
+        server_command += ['--fixtures', os.path.abspath(args.fixtures)]
+    else:
+        server_command += ['--cache', os.path.abspath(args.cache)]
+
+    with tempfile.TemporaryDirectory(prefix='tfmkt-crawl-') as directory:
+        server_log = open(os.path.join(directory, 'server.log'), 'w')
+        server = subprocess.Popen(server_command, cwd=ROOT, stdout=server_log, stderr=subprocess.STDOUT)
+        try:
+            wait_for_port(port, server)
+
+            outputs = {spider: os.path.join(directory, f'{spider}.json') for spider in args.spiders}
+            if len(args.spiders) > 1:
+                crawl_command = ['chain', *args.spiders, '-a', f'parents={os.path.abspath(args.parents)}']
+                for spider, output in outputs.items():
+                    crawl_command += ['-o', f'{spider}={output}']
+            else:
+                spider = args.spiders[0]
+                crawl_command = ['crawl', spider, '-a', f'parents={os.path.abspath(args.parents)}',
+                                 '-s', f'FEED_URI={outputs[spider]}']
+            crawl_command += ['-a', f'base_url=http://127.0.0.1:{port}', '-s', 'HTTPCACHE_ENABLED=False']
+            for sparg in args.spargs:
+                crawl_command += ['-a', sparg]
+            for setting in args.settings:
+                crawl_command += ['-s', setting]
+
+            python = [sys.executable]
+            if args.profile:
+                python += ['-m', 'cProfile', '-o', os.path.abspath(args.profile)]
+            crawl_log = os.path.join(directory, 'crawl.log')
+            before = resource.getrusage(resource.RUSAGE_CHILDREN)
+            started = time.perf_counter()
+            with open(crawl_log, 'w') as log:
+                crawl = subprocess.run(python + ['-m', 'scrapy'] + crawl_command, cwd=ROOT,
+                                       stdout=subprocess.DEVNULL, stderr=log)
+            elapsed = time.perf_counter() - started
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            if crawl.returncode:
+                with open(crawl_log) as log:
+                    sys.stderr.write(log.read()[-4000:])
+                sys.exit(f"The crawl exited with status {crawl.returncode}")
+
+            cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+            total = 0
+            print(f"{'stage':<16}{'items':>10}{'items/s':>12}")
+            for spider, output in outputs.items():
+                items = count_lines(output)
+                total += items
+                print(f"{spider:<16}{items:>10}{items / elapsed:>12.1f}")
+            print(f"{'total':<16}{total:>10}{total / elapsed:>12.1f}")
+            print(f"\nwall {elapsed:.2f}s, CPU {cpu:.2f}s ({cpu / elapsed * 100:.0f}% of a core)")
+        finally:
+            server.terminate()
+            server.wait()
+            server_log.close()
+            with open(os.path.join(directory, 'server.log')) as f:
+                summary = [line.strip() for line in f if 'Accepted' in line]
+            if summary:
+                print(f"server: {summary[-1].split('] ', 1)[-1]}")
+
+    if args.profile:
+        print(f"\nProfile written to {args.profile}, top functions by own time:")
+        pstats.Stats(args.profile).sort_stats('tottime').print_stats(args.top)
+
+
+if __name__ == '__main__':
+    main()
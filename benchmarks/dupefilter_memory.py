@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""Compare the memory used by request dupefilters.
+
+Feeds the same N request fingerprints to Scrapy's default RFPDupeFilter and to
+tfmkt.dupefilters.CompactDupeFilter (hash set and Bloom filter stores), each one
+in a fresh process, and reports the memory allocated, the time per request and
+the number of requests wrongly reported as seen. Memory is the one allocated
+by Python, memory-mapped files are reported separately.
+
+Usage:
+  python benchmarks/dupefilter_memory.py --requests 1000000
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from scrapy import Request
+from scrapy.utils.misc import load_object
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+STORES = ['default', 'hashset', 'hashset-spill', 'bloom']
+
+
+def build_dupefilter(store, directory):
+    from scrapy.utils.test import get_crawler
+    from tfmkt import settings as project_settings
+
+    settings = {
+        key: getattr(project_settings, key) for key in dir(project_settings)
+        if key.startswith('DUPEFILTER_') or key.startswith('REQUEST_FINGERPRINTER_')
+    }
+    if store != 'default':
+        settings['DUPEFILTER_CLASS'] = 'tfmkt.dupefilters.CompactDupeFilter'
+        settings['DUPEFILTER_STORE'] = 'bloom' if store == 'bloom' else 'hashset'
+    if store == 'hashset-spill':
+        settings['DUPEFILTER_SPILL_DIR'] = directory
+    crawler = get_crawler(settings_dict=settings)
+    return load_object(crawler.settings['DUPEFILTER_CLASS']).from_crawler(crawler)
+
+
+def feed(dupefilter, count):
+    """Feed `count` distinct requests to a dupefilter, return how many were reported as seen."""
+    return sum(
+        dupefilter.request_seen(Request(f"https://www.transfermarkt.co.uk/profil/spieler/{i}"))
+        for i in range(count)
+    )
+
+
+def run(store, count, queue):
+    with tempfile.TemporaryDirectory() as directory:
+        # timed without tracing allocations, which slows everything down
+        dupefilter = build_dupefilter(store, directory)
+        started = time.perf_counter()
+        wrongly_seen = feed(dupefilter, count)
+        elapsed = time.perf_counter() - started
+        dupefilter.close('finished')
+
+        tracemalloc.start()
+        dupefilter = build_dupefilter(store, directory)
+        feed(dupefilter, count)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        spilled = sum(
+            os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+        )
+        dupefilter.close('finished')
+    queue.put((store, current, peak, spilled, elapsed, wrongly_seen))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1_000_000, help="number of distinct requests (default: %(default)s)")
+    parser.add_argument('--stores', default=','.join(STORES), help="stores to compare (default: %(default)s)")
+    args = parser.parse_args()
+
+    print(f"{'store':<15}{'memory':>12}{'peak':>12}{'on disk':>12}{'bytes/req':>11}{'us/req':>9}{'false +':>9}")
+    for store in args.stores.split(','):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run, args=(store, args.requests, queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            sys.exit(f"Benchmark of the {store} store failed")
+        store, current, peak, spilled, elapsed, wrongly_seen = queue.get()
+        print(
+            f"{store:<15}{current / 2**20:>10.1f}MB{peak / 2**20:>10.1f}MB{spilled / 2**20:>10.1f}MB"
+            f"{current / args.requests:>11.1f}{elapsed / args.requests * 1e6:>9.1f}{wrongly_seen:>9}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""Compare the cost of exporting items with Scrapy's JSON lines exporter and the exporters of tfmkt.exporters.
+
+Exports a stream of `games` and `appearances` items, built by repeating the
+items in samples/games.json and samples/appearances.json, and reports the time
+spent in `export_item` (which runs on the reactor thread during a crawl) and the
+total time, until the last item is written.
+
+The feed is written to /dev/null, or to a pipe drained by a consumer reading at
+most --consumer-rate MB/s, to simulate a slow process downstream of `stdout:`.
+
+Usage:
+  python benchmarks/feed_export.py --items 500000
+  python benchmarks/feed_export.py --items 100000 --consumer-rate 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from scrapy.exporters import JsonLinesItemExporter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tfmkt import exporters  # noqa: E402
+from tfmkt.exporters import CompactJsonLinesItemExporter, FastJsonLinesItemExporter  # noqa: E402
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'samples')
+
+# reads stdin at a limited rate
+CONSUMER = """
+import sys, time
+rate = float(sys.argv[1]) * 2**20
+started = time.perf_counter()
+read = 0
+while True:
+    chunk = sys.stdin.buffer.read(65536)
+    if not chunk:
+        break
+    read += len(chunk)
+    delay = read / rate - (time.perf_counter() - started)
+    if delay > 0:
+        time.sleep(delay)
+"""
+
+
+def sample_items():
+    items = []
+    for file_name in ('games.json', 'appearances.json'):
+        with open(os.path.join(SAMPLES, file_name)) as f:
+            items += [json.loads(line) for line in f if line.strip()]
+    return items
+
+
+def open_sink(consumer_rate):
+    if not consumer_rate:
+        return open(os.devnull, 'wb'), None
+    consumer = subprocess.Popen([sys.executable, '-c', CONSUMER, str(consumer_rate)], stdin=subprocess.PIPE)
+    return consumer.stdin, consumer
+
+
+def run(name, exporter_cls, items, count, consumer_rate):
+    sink, consumer = open_sink(consumer_rate)
+    exporter = exporter_cls(sink)
+    started = time.perf_counter()
+    exporter.start_exporting()
+    exporting = 0.0
+    for i in range(count):
+        # a fresh dict per item, as spiders yield them
+        item = dict(items[i % len(items)])
+        before = time.perf_counter()
+        exporter.export_item(item)
+        exporting += time.perf_counter() - before
+    exporter.finish_exporting()
+    sink.close()
+    if consumer is not None:
+        consumer.wait()
+    total = time.perf_counter() - started
+    print(f"{name:<28}{exporting:>14.2f}s{exporting / count * 1e6:>14.1f}{total:>12.2f}s{count / total:>14,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=500_000, help="number of items exported (default: %(default)s)")
+    parser.add_argument('--consumer-rate', type=float, default=0, help="MB/s read by the consumer, 0 to write to /dev/null")
+    args = parser.parse_args()
+
+    items = sample_items()
+    print(f"{'exporter':<28}{'export_item':>15}{'us/item':>14}{'total':>13}{'items/s':>14}")
+    run('scrapy JsonLinesItemExporter', JsonLinesItemExporter, items, args.items, args.consumer_rate)
+    run('FastJsonLines', FastJsonLinesItemExporter, items, args.items, args.consumer_rate)
+    if exporters.orjson is not None:
+        run('CompactJsonLines (orjson)', CompactJsonLinesItemExporter, items, args.items, args.consumer_rate)
+    orjson, exporters.orjson = exporters.orjson, None
+    run('CompactJsonLines (json)', CompactJsonLinesItemExporter, items, args.items, args.consumer_rate)
+    exporters.orjson = orjson
+
+
+if __name__ == '__main__':
+    main()
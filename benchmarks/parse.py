@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""Measure the parsing performance of the spider callbacks over recorded pages.
+
+Runs every callback below over its fixtures (recorded pages, see
+tfmkt/fixtures.py), offline, and reports for each one the pages parsed per
+second (best of --repeat passes, response construction excluded) and the
+memory allocated per page (peak traced by tracemalloc, in a separate pass).
+
+Results are compared with a stored baseline, and the script exits with status
+1 when a callback got slower or allocates more than --tolerance relative to
+it, or when it yields a different number of items over the same fixtures.
+Baselines depend on the machine and Python version: store one before making a
+change and compare after it, on the same machine.
+
+Usage:
+  python benchmarks/parse.py --save-baseline
+  python benchmarks/parse.py --callback games.parse_game --repeat 10
+  python benchmarks/parse.py --fixtures /data/fixtures --baseline /data/parse_baseline.json
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from scrapy import Request
+from scrapy.utils.misc import load_object
+from scrapy.utils.spider import iterate_spider_output
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tfmkt.fixtures import load_fixtures  # noqa: E402
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+
+# spider name, spider class and callback benchmarked
+CALLBACKS = [
+    ('games_urls', 'tfmkt.spiders.games_urls.GamesUrlsSpider', 'extract_game_urls'),
+    ('games', 'tfmkt.spiders.games.GamesSpider', 'parse_game'),
+    ('game_lineups', 'tfmkt.spiders.game_lineups.GameLineupsSpider', 'parse_lineups'),
+    ('clubs', 'tfmkt.spiders.clubs.ClubsSpider', 'parse_details'),
+    ('players', 'tfmkt.spiders.players.PlayersSpider', 'parse_details'),
+    ('appearances', 'tfmkt.spiders.appearances.AppearancesSpider', 'parse_stats'),
+    ('competitions', 'tfmkt.spiders.competitions.CompetitionsSpider', 'parse_competitions'),
+]
+
+
+def prepare(spidercls, callback_name, fixtures):
+    """A new spider, and the responses and keyword arguments of a pass over the fixtures."""
+    spider = spidercls(entrypoints=[])
+    callback = getattr(spider, callback_name)
+    calls = []
+    for fixture in fixtures:
+        response = fixture.response(callback)
+        calls.append((response, copy.deepcopy(response.request.cb_kwargs)))
+    return callback, calls
+
+
+def parse(callback, response, cb_kwargs):
+    items = requests = 0
+    for element in iterate_spider_output(callback(response, **cb_kwargs)):
+        if isinstance(element, Request):
+            requests += 1
+        else:
+            items += 1
+    return items, requests
+
+
+def timed_pass(spidercls, callback_name, fixtures):
+    callback, calls = prepare(spidercls, callback_name, fixtures)
+    items = requests = 0
+    started = time.perf_counter()
+    for response, cb_kwargs in calls:
+        page_items, page_requests = parse(callback, response, cb_kwargs)
+        items += page_items
+        requests += page_requests
+    return time.perf_counter() - started, items, requests
+
+
+def allocation_pass(spidercls, callback_name, fixtures):
+    """Mean and maximum of the memory peak traced while parsing a page, in bytes."""
+    callback, calls = prepare(spidercls, callback_name, fixtures)
+    peaks = []
+    for response, cb_kwargs in calls:
+        tracemalloc.start()
+        parse(callback, response, cb_kwargs)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return sum(peaks) / len(peaks), max(peaks)
+
+
+def benchmark(spidercls, callback_name, fixtures, repeat):
+    # warm up imports and the XPath compilation caches
+    timed_pass(spidercls, callback_name, fixtures)
+    passes = [timed_pass(spidercls, callback_name, fixtures) for _ in range(repeat)]
+    best, items, requests = min(passes)
+    mean_peak, max_peak = allocation_pass(spidercls, callback_name, fixtures)
+    return {
+        'pages': len(fixtures),
+        'items': items,
+        'requests': requests,
+        'pages_per_second': round(len(fixtures) / best, 2) if best > 0 else None,
+        'ms_per_page': round(best / len(fixtures) * 1000, 3),
+        'peak_kib_per_page': round(mean_peak / 1024, 1),
+        'max_peak_kib': round(max_peak / 1024, 1),
+    }
+
+
+def compare(result, baseline, tolerance):
+    """The regressions of a result relative to its baseline."""
+    regressions = []
+    if baseline.get('pages_per_second') and result['pages_per_second'] is not None \
+            and result['pages_per_second'] < baseline['pages_per_second'] * (1 - tolerance):
+        regressions.append(f"{result['pages_per_second']:.1f} pages/s, baseline {baseline['pages_per_second']:.1f}")
+    if baseline.get('peak_kib_per_page') and result['peak_kib_per_page'] > baseline['peak_kib_per_page'] * (1 + tolerance):
+        regressions.append(f"{result['peak_kib_per_page']:.0f} KiB/page, baseline {baseline['peak_kib_per_page']:.0f}")
+    if result['pages'] == baseline.get('pages') and result['items'] != baseline.get('items'):
+        regressions.append(f"{result['items']} items, baseline {baseline['items']}")
+    return regressions
+
+
+def change(value, baseline_value):
+    if not baseline_value or value is None:
+        return ''
+    return f"{(value / baseline_value - 1) * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fixtures', default=os.path.join(BENCHMARKS, 'fixtures'),
+                        help="fixtures directory (default: benchmarks/fixtures)")
+    parser.add_argument('--callback', action='append', default=[], metavar='SPIDER.CALLBACK',
+                        help="benchmark only this callback, e.g. games.parse_game (may be repeated)")
+    parser.add_argument('--repeat', type=int, default=5, help="timed passes over the fixtures (default: %(default)s)")
+    parser.add_argument('--baseline', default=os.path.join(BENCHMARKS, 'parse_baseline.json'),
+                        help="baseline file (default: benchmarks/parse_baseline.json)")
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="relative slowdown or allocation increase reported as a regression (default: %(default)s)")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('python') != platform.python_version():
+            print(f"Baseline recorded with Python {baseline.get('python')}, running {platform.python_version()}",
+                  file=sys.stderr)
+
+    results = {}
+    regressions = {}
+    if not args.json:
+        print(f"{'callback':<32}{'pages':>7}{'items':>8}{'pages/s':>10}{'change':>9}{'ms/page':>10}{'KiB/page':>10}{'change':>9}")
+    for spider_name, spidercls_path, callback_name in CALLBACKS:
+        name = f'{spider_name}.{callback_name}'
+        if args.callback and name not in args.callback:
+            continue
+        fixtures = load_fixtures(args.fixtures, spider_name, callback_name)
+        if not fixtures:
+            if not args.json:
+                print(f"{name:<32}{'no fixtures':>15}")
+            continue
+        result = results[name] = benchmark(load_object(spidercls_path), callback_name, fixtures, args.repeat)
+        previous = baseline.get('callbacks', {}).get(name, {})
+        regressions[name] = compare(result, previous, args.tolerance) if previous else []
+        if not args.json:
+            print(
+                f"{name:<32}{result['pages']:>7}{result['items']:>8}{result['pages_per_second']:>10.1f}"
+                f"{change(result['pages_per_second'], previous.get('pages_per_second')):>9}"
+                f"{result['ms_per_page']:>10.2f}{result['peak_kib_per_page']:>10.0f}"
+                f"{change(result['peak_kib_per_page'], previous.get('peak_kib_per_page')):>9}"
+            )
+
+    if args.json:
+        print(json.dumps({'callbacks': results, 'regressions': regressions}, indent=2))
+    for name, problems in regressions.items():
+        for problem in problems:
+            print(f"REGRESSION {name}: {problem}", file=sys.stderr)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'recorded_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                'callbacks': results,
+            }, f, indent=2)
+            f.write('\n')
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+    elif not baseline and results:
+        print(f"No baseline at {args.baseline}, store one with --save-baseline", file=sys.stderr)
+
+    if any(regressions.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
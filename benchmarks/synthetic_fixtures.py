@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Write the synthetic fixtures shipped in benchmarks/fixtures.
+
+Recorded Transfermarkt pages are not shipped with the project. The fixtures
+in benchmarks/fixtures are built from the small synthetic pages of the test
+suite (tests/pages) instead, so that `benchmarks/parse.py` runs out of the box
+and its stored baseline (benchmarks/parse_baseline.json) has pages to compare
+against. They only cover the layouts of those pages: record real pages with
+`scrapy record` for representative figures.
+
+Usage:
+  python benchmarks/synthetic_fixtures.py --replace
+  python benchmarks/parse.py --save-baseline
+"""
+import argparse
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from tfmkt.fixtures import write_fixture  # noqa: E402
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+PAGES = os.path.join(BENCHMARKS, '..', 'tests', 'pages')
+BASE_URL = 'https://www.transfermarkt.co.uk'
+
+# page, spider, callback, site path, cb_kwargs and variant of every fixture
+FIXTURES = [
+    ('fixtures.html', 'games_urls', 'extract_game_urls', '/premier-league/gesamtspielplan/wettbewerb/GB1/saison_id/2020',
+     {'base': {'type': 'competition', 'href': '/premier-league/startseite/wettbewerb/GB1', 'parent': {}}}, 'league'),
+    ('game.html', 'games', 'parse_game', '/club-a_club-b/index/spielbericht/3426916',
+     {'base': {'type': 'game', 'href': '/club-a_club-b/index/spielbericht/3426916', 'parent': {}}}, None),
+    ('lineups.html', 'game_lineups', 'parse_lineups', '/liverpool-fc_leeds-united/aufstellung/spielbericht/3426896',
+     {'base': {
+         'href': '/liverpool-fc_leeds-united/aufstellung/spielbericht/3426896',
+         'parent': {'type': 'game', 'href': '/liverpool-fc_leeds-united/index/spielbericht/3426896', 'game_id': 3426896},
+         'lineups': {
+             'home_club': {'href': '/fc-liverpool/startseite/verein/31', 'formation': 'Starting Line-up: 4-3-3',
+                           'starting_lineup': [], 'substitutes': []},
+             'away_club': {'href': '/leeds-united/startseite/verein/399', 'formation': None,
+                           'starting_lineup': [], 'substitutes': []},
+         },
+     }}, None),
+    ('club.html', 'clubs', 'parse_details', '/fc-liverpool/startseite/verein/31/saison_id/2020',
+     {'base': {'type': 'club', 'href': '/fc-liverpool/startseite/verein/31', 'parent': {}}}, 'senior'),
+    ('player.html', 'players', 'parse_details', '/joel-matip/profil/spieler/33040',
+     {'base': {'type': 'player', 'href': '/joel-matip/profil/spieler/33040', 'parent': {}}}, 'active'),
+    ('player_retired.html', 'players', 'parse_details', '/joel-matip/profil/spieler/33041',
+     {'base': {'type': 'player', 'href': '/joel-matip/profil/spieler/33041', 'parent': {}}}, 'retired'),
+    ('player_stats.html', 'appearances', 'parse_stats', '/joel-matip/leistungsdaten/spieler/33040/plus/0?saison=2020',
+     {'parent': {'type': 'player', 'href': '/joel-matip/profil/spieler/33040'}}, 'active'),
+    ('competitions.html', 'competitions', 'parse_competitions', '/wettbewerbe/national/wettbewerbe/40',
+     {'base': {'parent': {}, 'country_id': '40', 'country_name': 'Germany', 'total_clubs': '227',
+               'total_players': '6.058', 'average_age': '24.1', 'foreigner_percentage': '23.2 %',
+               'total_value': '€5.42bn'}}, None),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', default=os.path.join(BENCHMARKS, 'fixtures'),
+                        help="fixtures directory (default: benchmarks/fixtures)")
+    parser.add_argument('--replace', action='store_true', help="remove the fixtures of the directory first")
+    args = parser.parse_args()
+
+    if args.replace:
+        shutil.rmtree(args.output, ignore_errors=True)
+    for page, spider, callback, path, cb_kwargs, variant in FIXTURES:
+        with open(os.path.join(PAGES, page), 'rb') as f:
+            body = f.read()
+        written = write_fixture(args.output, BASE_URL + path, body, spider, callback,
+                                cb_kwargs=cb_kwargs, source='synthetic', variant=variant)
+        print(f"{spider}.{callback}: {page}{'' if written else ' (already written)'}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+from scrapy import Request, Spider
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from tfmkt.checkpoint import CheckpointMiddleware
+from tfmkt.normalization import NormalizationPipeline
+from tfmkt.pipelines import NormalizedOutputPipeline
+
+
+def run(tmp_path, items):
+    """Pass items through the checkpoint and the item pipelines of a crawl using a JOBDIR, and return the exported ones."""
+    crawler = get_crawler(Spider, {
+        'JOBDIR': str(tmp_path / 'job'),
+        'CHECKPOINT_ENABLED': True,
+        'NORMALIZATION_ENABLED': True,
+        'NORMALIZATION_FIELDS': {'market_value': 'market_value'},
+        'NORMALIZED_OUTPUT_PARENTS': str(tmp_path / 'parents.jsonl'),
+        'NORMALIZED_OUTPUT_DROPPED_FIELDS': ['seasoned_href'],
+    })
+    spider = Spider('players')
+    checkpoint = CheckpointMiddleware.from_crawler(crawler)
+    pipelines = [NormalizationPipeline.from_crawler(crawler), NormalizedOutputPipeline.from_crawler(crawler)]
+    checkpoint.spider_opened(spider)
+    pipelines[1].open_spider(spider)
+
+    response = HtmlResponse('https://www.transfermarkt.co.uk/x', body=b'', request=Request('https://www.transfermarkt.co.uk/x'))
+    exported = []
+    for item in checkpoint.process_spider_output(response, [dict(item) for item in items], spider):
+        for pipeline in pipelines:
+            item = pipeline.process_item(item, spider)
+        checkpoint.item_scraped(item, response, spider)
+        exported.append(item)
+
+    pipelines[1].close_spider(spider)
+    checkpoint.spider_closed(spider, 'shutdown')
+    return exported, crawler.stats
+
+
+def test_emitted_items_are_dropped_when_resuming(tmp_path):
+    parent = {'type': 'club', 'href': '/fc-a/startseite/verein/1', 'seasoned_href': '/fc-a/startseite/verein/1/saison_id/2023'}
+    items = [
+        {'type': 'player', 'href': '/a/profil/spieler/10', 'market_value': '€1.50m', 'parent': parent},
+        {'type': 'player', 'href': '/b/profil/spieler/20', 'market_value': '€500k', 'parent': parent},
+    ]
+    exported, stats = run(tmp_path, items[:1])
+    assert exported[0]['market_value'] == 1500000
+    assert exported[0]['parent'] == '/fc-a/startseite/verein/1'
+    assert stats.get_value('checkpoint/untracked_items') is None
+
+    exported, stats = run(tmp_path, items)
+    assert [item['href'] for item in exported] == ['/b/profil/spieler/20']
+    assert stats.get_value('checkpoint/duplicate_items') == 1
+    assert not (tmp_path / 'job' / 'checkpoint' / 'emitted.digests').exists()
+
+
+class ClubsSpider(Spider):
+    name = 'clubs'
+
+    def start_requests(self):
+        # filtered by the dupefilter, as the requests of BaseSpider
+        yield Request('https://www.transfermarkt.co.uk/a/startseite/verein/1')
+
+    def parse(self, response):
+        pass
+
+
+def open_run(tmp_path):
+    crawler = get_crawler(ClubsSpider, {'JOBDIR': str(tmp_path / 'job'), 'CHECKPOINT_ENABLED': True})
+    spider = crawler.spider = ClubsSpider()
+    checkpoint = CheckpointMiddleware.from_crawler(crawler)
+    checkpoint.spider_opened(spider)
+    return checkpoint, spider, crawler.stats
+
+
+def crawl(checkpoint, spider, request, children=()):
+    """Process a request, and return the requests its callback yields."""
+    response = HtmlResponse(request.url, body=b'', request=request)
+    return list(checkpoint.process_spider_output(response, list(children), spider))
+
+
+def test_completed_entrypoints_are_skipped(tmp_path):
+    checkpoint, spider, _ = open_run(tmp_path)
+    [start] = checkpoint.process_start_requests(spider.start_requests(), spider)
+    [squad] = crawl(checkpoint, spider, start, [Request('https://www.transfermarkt.co.uk/a/kader/verein/1')])
+    crawl(checkpoint, spider, squad)
+    checkpoint.spider_closed(spider, 'finished')
+
+    checkpoint, spider, stats = open_run(tmp_path)
+    assert list(checkpoint.process_start_requests(spider.start_requests(), spider)) == []
+    assert stats.get_value('checkpoint/skipped_entrypoints') == 1
+    checkpoint.spider_closed(spider, 'finished')
+
+
+def test_entrypoints_with_failed_requests_are_crawled_again(tmp_path):
+    checkpoint, spider, _ = open_run(tmp_path)
+    [start] = checkpoint.process_start_requests(spider.start_requests(), spider)
+    assert not start.dont_filter
+    # the squad page fails to download: its callback is never called
+    crawl(checkpoint, spider, start, [Request('https://www.transfermarkt.co.uk/a/kader/verein/1')])
+    checkpoint.spider_closed(spider, 'finished')
+
+    checkpoint, spider, stats = open_run(tmp_path)
+    [start] = checkpoint.process_start_requests(spider.start_requests(), spider)
+    # the dupefilter of the job directory saw it in the first run
+    assert start.dont_filter
+    assert stats.get_value('checkpoint/retried_entrypoints') == 1
+    [squad] = crawl(checkpoint, spider, start, [Request('https://www.transfermarkt.co.uk/a/kader/verein/1')])
+    crawl(checkpoint, spider, squad)
+    assert stats.get_value('checkpoint/completed_entrypoints') == 1
+    checkpoint.spider_closed(spider, 'finished')
+
+    checkpoint, spider, _ = open_run(tmp_path)
+    assert list(checkpoint.process_start_requests(spider.start_requests(), spider)) == []
+    checkpoint.spider_closed(spider, 'finished')
@@ -0,0 +1,90 @@
+import gzip
+import io
+import json
+
+import pytest
+
+from tfmkt import compaction
+from tfmkt.compaction import Compactor
+
+
+def club(club_id, **fields):
+    return {'type': 'club', 'href': f'/c/startseite/verein/{club_id}', **fields}
+
+
+def appearance(player_id, game_id, goals):
+    return {'type': 'appearance', 'player_id': player_id, 'game_id': game_id, 'goals': goals}
+
+
+RUNS = [
+    [club(1, name='A'), club(2, name='B'), {'type': 'game', 'game_id': 7, 'result': '-:-'},
+     appearance(10, 7, 0), appearance(10, 7, 0)],
+    [club(2, name='B2'), club(3, name='C'), {'type': 'game', 'game_id': 7, 'result': '2:0'},
+     appearance(10, 7, 1), appearance(11, 7, 0)],
+    [club(3, deleted=True), club(1, name='A')],
+]
+
+
+def write_runs(tmp_path):
+    files = []
+    for i, items in enumerate(RUNS):
+        path = tmp_path / f'run{i}.jsonl.gz'
+        with gzip.open(path, 'wt') as f:
+            for item in items:
+                f.write(json.dumps(item) + '\n\n')
+        files.append(str(path))
+    return files
+
+
+def compact(files, **kwargs):
+    compactor = Compactor(**kwargs)
+    for file_name in files:
+        compactor.add(file_name)
+    output = io.StringIO()
+    stats = compactor.write(output=output)
+    return [json.loads(line) for line in output.getvalue().splitlines()], stats, compactor
+
+
+def test_newest_records_are_kept(tmp_path):
+    items, stats, compactor = compact(write_runs(tmp_path))
+    assert compactor.spilled == 0
+    assert items == [
+        # appearances are only told apart by content
+        *sorted([appearance(10, 7, 0), appearance(10, 7, 1), appearance(11, 7, 0)], key=compactor.key),
+        club(1, name='A'), club(2, name='B2'),
+        {'type': 'game', 'game_id': 7, 'result': '2:0'},
+    ]
+    assert stats.as_dict()['types']['club'] == {'read': 6, 'written': 2, 'superseded': 3, 'changed': 1, 'deleted': 1}
+    assert stats.as_dict()['types']['game']['changed'] == 1
+
+
+def test_spilled_runs_give_the_same_output(tmp_path, monkeypatch):
+    files = write_runs(tmp_path)
+    in_memory, in_memory_stats, _ = compact(files)
+
+    # a run file every record, merged 2 by 2
+    monkeypatch.setattr(compaction, 'MAX_FAN_IN', 2)
+    spilled, spilled_stats, compactor = compact(files, memory_limit=1, temp_dir=str(tmp_path))
+    assert compactor.spilled == sum(len(items) for items in RUNS)
+    assert spilled == in_memory
+    assert spilled_stats.as_dict() == in_memory_stats.as_dict()
+    # the temporary runs are removed
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['run0.jsonl.gz', 'run1.jsonl.gz', 'run2.jsonl.gz']
+
+
+@pytest.mark.parametrize('memory_limit', [1, 2**20])
+def test_key_fields(tmp_path, memory_limit):
+    items, stats, _ = compact(write_runs(tmp_path), key_fields={'appearance': ['player_id', 'game_id']},
+                              memory_limit=memory_limit)
+    assert [item for item in items if item['type'] == 'appearance'] == [appearance(10, 7, 1), appearance(11, 7, 0)]
+    assert stats.superseded['appearance'] == 2
+    assert stats.changed['appearance'] == 1
+
+
+def test_gzip_output(tmp_path):
+    compactor = Compactor()
+    for file_name in write_runs(tmp_path):
+        compactor.add(file_name)
+    compactor.write(str(tmp_path / 'compacted.jsonl.gz'))
+    with gzip.open(tmp_path / 'compacted.jsonl.gz', 'rt') as f:
+        assert len(f.readlines()) == 6
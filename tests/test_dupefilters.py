@@ -0,0 +1,85 @@
+import hashlib
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.utils.test import get_crawler
+
+from tfmkt.dupefilters import CompactDupeFilter, DigestSet, ScalableBloomFilter
+
+
+def digests(count, start=0):
+    return [hashlib.sha1(str(i).encode()).digest() for i in range(start, start + count)]
+
+
+@pytest.mark.parametrize('backed', [False, True])
+def test_digest_set_grows(tmp_path, backed):
+    path = str(tmp_path / 'seen.digests') if backed else None
+    store = DigestSet(digest_size=8, capacity=4, path=path)
+    assert all(store.add(digest) for digest in digests(100))
+    assert store.capacity == 256
+    assert len(store) == 100
+    assert not any(store.add(digest) for digest in digests(100))
+    assert all(digest in store for digest in digests(100))
+    assert not any(digest in store for digest in digests(100, start=100))
+    # the all zeros digest is told apart from empty slots
+    assert store.add(bytes(20)) and bytes(20) in store
+    store.close()
+
+    if backed:
+        assert (tmp_path / 'seen.digests').stat().st_size == 256 * 8
+        assert not (tmp_path / 'seen.digests.grow').exists()
+        store = DigestSet(digest_size=8, capacity=4, path=path)
+        assert len(store) == 101
+        assert all(digest in store for digest in digests(100))
+        store.close()
+        with pytest.raises(ValueError):
+            DigestSet(digest_size=16, path=path)
+
+
+def test_spilled_digest_set_is_removed(tmp_path):
+    path = str(tmp_path / 'seen.digests')
+    store = DigestSet(digest_size=8, capacity=4, path=path, keep=False)
+    for digest in digests(10):
+        store.add(digest)
+    store.close()
+    assert not any(tmp_path.iterdir())
+
+
+def test_scalable_bloom_filter_is_kept_across_runs(tmp_path):
+    path = str(tmp_path / 'requests.seen.bloom')
+    store = ScalableBloomFilter(capacity=100, error_rate=1e-3, path=path)
+    added = [store.add(digest) for digest in digests(1000)]
+    # filters of 100, 200, 400 and 800 elements
+    assert len(store.filters) == 4
+    assert added.count(False) <= 2
+    assert len(store) == added.count(True)
+    assert not any(store.add(digest) for digest in digests(1000))
+    store.close()
+
+    store = ScalableBloomFilter(capacity=100, error_rate=1e-3, path=path)
+    assert len(store) == added.count(True)
+    assert all(digest in store for digest in digests(1000))
+    assert sum(digest in store for digest in digests(10000, start=1000)) <= 15
+
+
+@pytest.mark.parametrize('store', ['hashset', 'bloom'])
+def test_requests_seen_are_kept_across_runs_with_jobdir(tmp_path, store):
+    settings = {
+        'JOBDIR': str(tmp_path), 'DUPEFILTER_STORE': store, 'DUPEFILTER_DIGEST_SIZE': 16,
+        'DUPEFILTER_INITIAL_CAPACITY': 4, 'DUPEFILTER_BLOOM_ERROR_RATE': 1e-6,
+    }
+    requests = [Request(f'https://www.transfermarkt.co.uk/x/{i}') for i in range(20)]
+
+    dupefilter = CompactDupeFilter.from_crawler(get_crawler(Spider, settings))
+    assert [dupefilter.request_seen(request) for request in requests[:10]] == [False] * 10
+    assert dupefilter.request_seen(requests[0].replace())
+    dupefilter.close('shutdown')
+
+    dupefilter = CompactDupeFilter.from_crawler(get_crawler(Spider, settings))
+    assert [dupefilter.request_seen(request) for request in requests] == [True] * 10 + [False] * 10
+    dupefilter.close('finished')
+
+
+def test_unknown_store():
+    with pytest.raises(ValueError):
+        CompactDupeFilter.from_crawler(get_crawler(Spider, {'DUPEFILTER_STORE': 'set'}))
@@ -0,0 +1,91 @@
+import datetime
+import io
+import json
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.exporters import JsonLinesItemExporter
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from tfmkt.checkpoint import CheckpointMiddleware
+from tfmkt import exporters
+from tfmkt.exporters import CompactJsonLinesItemExporter, FastJsonLinesItemExporter
+
+
+class Engine:
+    def __init__(self):
+        self.pauses = 0
+        self.paused = False
+
+    def pause(self):
+        self.pauses += 1
+        self.paused = True
+
+    def unpause(self):
+        self.paused = False
+
+
+def test_engine_is_resumed_once_every_exporter_caught_up():
+    crawler = get_crawler(Spider)
+    crawler.engine = Engine()
+    # writer threads not started: lines stay queued
+    exporters = [FastJsonLinesItemExporter(io.BytesIO(), crawler=crawler, max_pending=1) for _ in range(2)]
+    for exporter in exporters:
+        for i in range(2):
+            exporter.export_item({'i': i})
+    assert crawler.engine.paused and crawler.engine.pauses == 1
+
+    exporters[0].resume()
+    assert crawler.engine.paused
+    exporters[1].resume()
+    assert not crawler.engine.paused
+
+
+def test_items_are_checkpointed_once_written(tmp_path):
+    crawler = get_crawler(Spider, {'JOBDIR': str(tmp_path), 'CHECKPOINT_ENABLED': True})
+    spider = Spider('players')
+    checkpoint = CheckpointMiddleware.from_crawler(crawler)
+    checkpoint.spider_opened(spider)
+    feed = io.BytesIO()
+    exporter = FastJsonLinesItemExporter(feed, crawler=crawler)
+    exporter.start_exporting()
+
+    response = HtmlResponse('https://www.transfermarkt.co.uk/x', body=b'', request=Request('https://www.transfermarkt.co.uk/x'))
+    for item in checkpoint.process_spider_output(response, [{'href': '/a'}, {'href': '/b'}], spider):
+        exporter.export_item(item)
+        checkpoint.item_scraped(item, response, spider)
+    # the writer thread reports the lines it wrote through the reactor, which is not running
+    emitted = tmp_path / 'checkpoint' / 'emitted'
+    assert emitted.read_text() == ''
+
+    exporter.finish_exporting()
+    assert [json.loads(line) for line in feed.getvalue().splitlines()] == [{'href': '/a'}, {'href': '/b'}]
+    assert len(emitted.read_text().split()) == 2
+    checkpoint.spider_closed(spider, 'finished')
+
+
+def export(exporter_cls, items, **kwargs):
+    feed = io.BytesIO()
+    exporter = exporter_cls(feed, **kwargs)
+    exporter.start_exporting()
+    for item in items:
+        exporter.export_item(item)
+    exporter.finish_exporting()
+    return feed.getvalue()
+
+
+ITEMS = [{'name': 'Müller', 'v': 1.0}, {'date': datetime.date(2020, 12, 18), 'ids': [1, 2]}]
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'encoding': 'utf-8'}, {'encoding': 'latin-1'}])
+def test_output_is_the_one_of_scrapy_exporter(kwargs):
+    assert export(FastJsonLinesItemExporter, ITEMS, **kwargs) == export(JsonLinesItemExporter, ITEMS, **kwargs)
+    assert export(FastJsonLinesItemExporter, ITEMS).startswith(b'{"name": "M\\u00fcller", "v": 1.0}\n')
+
+
+def test_compact_output_does_not_depend_on_orjson(monkeypatch):
+    compact = export(CompactJsonLinesItemExporter, ITEMS)
+    assert compact == '{"name":"Müller","v":1.0}\n{"date":"2020-12-18","ids":[1,2]}\n'.encode('utf-8')
+    monkeypatch.setattr(exporters, 'orjson', None)
+    assert export(CompactJsonLinesItemExporter, ITEMS) == compact
@@ -0,0 +1,120 @@
+from pathlib import Path
+
+import pytest
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.utils.spider import iterate_spider_output
+
+from tfmkt.fields import OMITTED, FieldProjectionMiddleware, extract_fields, parse_fields
+from tfmkt.spiders.games import GamesSpider
+from tfmkt.spiders.players import PlayersSpider
+
+PAGES = Path(__file__).parent / 'pages'
+BASE_URL = 'https://www.transfermarkt.co.uk'
+
+# keys of the items scraped from the test pages before fields could be requested, in order
+GAME_KEYS = [
+    'type', 'href', 'parent', 'game_id', 'home_club', 'home_club_position', 'away_club', 'away_club_position',
+    'result', 'halftime_score', 'matchday', 'date', 'date_iso', 'kickoff_time', 'stadium', 'attendance', 'referee',
+    'events', 'home_starting_lineup', 'home_substitutes', 'away_starting_lineup', 'away_substitutes',
+    'home_manager', 'away_manager',
+]
+PLAYER_KEYS = [
+    'type', 'href', 'parent', 'name', 'last_name', 'number', 'name_in_home_country', 'date_of_birth',
+    'place_of_birth', 'age', 'height', 'citizenship', 'position', 'player_agent', 'image_url', 'date_of_death',
+    'current_club', 'status', 'foot', 'joined', 'contract_expires', 'day_of_last_contract_extension', 'outfitter',
+    'current_market_value', 'highest_market_value', 'social_media', 'code', 'on_loan_from', 'contract_option',
+    'contract_there_expires',
+]
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, None),
+    ('', None),
+    ('game_id, result,,', frozenset(('game_id', 'result'))),
+    (['name'], frozenset(('name',))),
+])
+def test_parse_fields(value, expected):
+    assert parse_fields(value) == expected
+
+
+def test_only_the_requested_field_functions_run():
+    calls = []
+
+    def field(name, value):
+        return lambda: calls.append(name) or value
+
+    functions = {'a': field('a', 1), 'b': field('b', OMITTED), 'c': field('c', 3)}
+    assert extract_fields(functions) == {'a': 1, 'c': 3}
+    assert list(extract_fields(functions)) == ['a', 'c']
+    calls.clear()
+    assert extract_fields(functions, frozenset(('b', 'c', 'd'))) == {'c': 3}
+    assert calls == ['b', 'c']
+
+
+def test_projection_middleware():
+    class Spider:
+        fields = frozenset(('result',))
+
+    request = Request(f'{BASE_URL}/x')
+    item = {'type': 'game', 'game_id': 1, 'result': '2:1'}
+    assert list(FieldProjectionMiddleware().process_spider_output(None, [request, item], Spider())) == [
+        request, {'type': 'game', 'result': '2:1'}
+    ]
+    Spider.fields = None
+    assert list(FieldProjectionMiddleware().process_spider_output(None, [item], Spider())) == [item]
+
+
+def spy(spider, *names):
+    """Record the calls of spider methods."""
+    calls = []
+    for name in names:
+        method = getattr(spider, name)
+        setattr(spider, name, lambda *args, _name=name, _method=method, **kwargs: calls.append(_name) or _method(*args, **kwargs))
+    return calls
+
+
+def parse(spider, callback, page, path, entity_type):
+    response = HtmlResponse(BASE_URL + path, body=(PAGES / page).read_bytes(), encoding='utf-8')
+    base = {'type': entity_type, 'href': path, 'parent': {}}
+    [item] = iterate_spider_output(getattr(spider, callback)(response, base=base))
+    return item
+
+
+GAME = ('parse_game', 'game.html', '/club-a_club-b/index/spielbericht/3426916', 'game')
+PLAYER = ('parse_details', 'player.html', '/joel-matip/profil/spieler/33040', 'player')
+# methods extracting fields the test pages have
+EXTRACTORS = {
+    GamesSpider: ('extract_game_events',),
+    PlayersSpider: ('_extract_date_of_birth', '_extract_age', '_extract_date_of_death'),
+}
+
+
+@pytest.mark.parametrize('spidercls, page, keys', [
+    (GamesSpider, GAME, GAME_KEYS),
+    (PlayersSpider, PLAYER, PLAYER_KEYS),
+    (PlayersSpider, ('parse_details', 'player_retired.html', '/joel-matip/profil/spieler/33041', 'player'),
+     [key for key in PLAYER_KEYS if key != 'social_media']),
+])
+def test_items_keep_their_keys_without_fields(spidercls, page, keys):
+    spider = spidercls(entrypoints=[])
+    calls = spy(spider, *EXTRACTORS[spidercls])
+    assert list(parse(spider, *page)) == keys
+    assert set(calls) == set(EXTRACTORS[spidercls])
+
+
+@pytest.mark.parametrize('spidercls, page, fields', [
+    (GamesSpider, GAME, 'result,date_iso'),
+    (PlayersSpider, PLAYER, 'name,current_market_value'),
+])
+def test_fields_not_requested_are_not_extracted(spidercls, page, fields):
+    spider = spidercls(entrypoints=[], fields=fields)
+    calls = spy(spider, *EXTRACTORS[spidercls])
+    item = parse(spider, *page)
+    assert calls == []
+    # the base of the item is left to FieldProjectionMiddleware
+    assert list(item) == [key for key in (GAME_KEYS if spidercls is GamesSpider else PLAYER_KEYS)
+                          if key in ('type', 'href', 'parent', 'game_id') or key in fields.split(',')]
+    [projected] = FieldProjectionMiddleware().process_spider_output(None, [item], spider)
+    assert list(projected) == ['type', *fields.split(',')]
+    assert all(projected[field] is not None for field in fields.split(','))
@@ -0,0 +1,34 @@
+import copy
+import json
+from pathlib import Path
+
+import pytest
+from scrapy.utils.misc import load_object
+from scrapy.utils.spider import iterate_spider_output
+
+from tfmkt.fixtures import load_fixtures
+
+BENCHMARKS = Path(__file__).parent.parent / 'benchmarks'
+BASELINE = json.loads((BENCHMARKS / 'parse_baseline.json').read_text())
+SPIDERS = {
+    'games_urls': 'tfmkt.spiders.games_urls.GamesUrlsSpider',
+    'games': 'tfmkt.spiders.games.GamesSpider',
+    'game_lineups': 'tfmkt.spiders.game_lineups.GameLineupsSpider',
+    'clubs': 'tfmkt.spiders.clubs.ClubsSpider',
+    'players': 'tfmkt.spiders.players.PlayersSpider',
+    'appearances': 'tfmkt.spiders.appearances.AppearancesSpider',
+    'competitions': 'tfmkt.spiders.competitions.CompetitionsSpider',
+}
+
+
+@pytest.mark.parametrize('name', sorted(BASELINE['callbacks']))
+def test_shipped_fixtures_match_the_baseline(name):
+    spider_name, callback_name = name.split('.')
+    fixtures = load_fixtures(str(BENCHMARKS / 'fixtures'), spider_name, callback_name)
+    callback = getattr(load_object(SPIDERS[spider_name])(entrypoints=[]), callback_name)
+    items = [
+        element for fixture in fixtures
+        for element in iterate_spider_output(callback(fixture.response(callback), **copy.deepcopy(fixture.cb_kwargs(callback))))
+    ]
+    assert len(fixtures) == BASELINE['callbacks'][name]['pages']
+    assert len(items) == BASELINE['callbacks'][name]['items']
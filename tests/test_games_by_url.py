@@ -0,0 +1,74 @@
+import datetime
+import gzip
+import json
+
+import pytest
+from scrapy.utils.test import get_crawler
+
+from tfmkt.spiders.games_by_url import GamesByUrlSpider, final_score
+
+
+def game(game_id, result=None, **fields):
+    return {'type': 'game', 'href': f'/a_b/index/spielbericht/{game_id}', 'game_id': game_id, 'result': result, **fields}
+
+
+def spider_with_previous(tmp_path, *previous):
+    """A spider reading the given games as the output of a previous run, split over a plain and a gzip file."""
+    plain, compressed = tmp_path / 'games.json', tmp_path / 'games_old.json.gz'
+    plain.write_text(''.join(json.dumps(item) + '\n' for item in previous[1:]))
+    with gzip.open(compressed, 'wt') as f:
+        f.write(json.dumps(previous[0]) + '\n')
+    crawler = get_crawler(GamesByUrlSpider)
+    return GamesByUrlSpider.from_crawler(crawler, entrypoints=[], previous=f'{compressed},{plain}')
+
+
+@pytest.mark.parametrize('result, expected', [
+    ('2:1', '2:1'),
+    ('3:2 aet', '3:2'),
+    ('4:5 on pens.', '4:5'),
+    ('-:-', None),
+    ('postponed', None),
+    (None, None),
+])
+def test_final_score(result, expected):
+    assert final_score(result) == expected
+
+
+def test_only_new_changed_and_played_games_are_scraped(tmp_path):
+    spider = spider_with_previous(
+        tmp_path,
+        game(1, '2:1'), game(2, '1:1'), game(3, '-:-'), game(4, '0:0 aet'), {'type': 'appearance', 'game_id': 9},
+    )
+    assert spider.previous_results == {1: '2:1', 2: '1:1', 3: '-:-', 4: '0:0 aet'}
+    tomorrow = (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+    yesterday = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+
+    # final and unchanged, whether the listing has its result or not
+    assert not spider.needs_scraping(game(1, '2:1'))
+    assert not spider.needs_scraping(game(1))
+    assert not spider.needs_scraping(game(4, '0:0 aet'))
+    # the result changed since
+    assert spider.needs_scraping(game(2, '1:2'))
+    # not final in the previous run
+    assert spider.needs_scraping(game(3, '3:0'))
+    assert spider.needs_scraping(game(3, date_iso=yesterday))
+    # not scraped before, played or not dated
+    assert spider.needs_scraping(game(5, '1:0'))
+    assert spider.needs_scraping({'type': 'game', 'href': '/a_b/index/spielbericht/6'})
+    # not played yet
+    assert not spider.needs_scraping(game(7, date_iso=tomorrow))
+    assert not spider.needs_scraping(game(3, date_iso=tomorrow))
+
+
+def test_skipped_games_have_no_requests(tmp_path):
+    spider = spider_with_previous(tmp_path, game(1, '2:1'), game(2, '1:1'))
+    assert spider.entrypoint_requests(game(1, '2:1')) == []
+    [request] = spider.entrypoint_requests(game(2, '1:2'))
+    assert request.url == 'https://www.transfermarkt.co.uk/a_b/index/spielbericht/2'
+    assert len(spider.entrypoint_requests(game(5))) == 1
+    assert spider.crawler.stats.get_value('incremental/skipped_games') == 1
+
+
+def test_every_game_is_scraped_without_previous():
+    spider = GamesByUrlSpider.from_crawler(get_crawler(GamesByUrlSpider), entrypoints=[])
+    assert len(spider.entrypoint_requests(game(1, '2:1'))) == 1
@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from tfmkt.fields import FieldProjectionMiddleware
+from tfmkt.spiders.games_live import GamesLiveSpider
+
+PAGES = Path(__file__).parent / 'pages'
+
+GAME = {
+    'type': 'game', 'href': '/club-a_club-b/index/spielbericht/3426916', 'game_id': 3426916,
+    'date_iso': '2020-12-18', 'kickoff_time': '6:45 PM',
+}
+
+
+def poll(spider, parent):
+    url = f"https://www.transfermarkt.co.uk{parent['href']}"
+    request = Request(url, meta={'game_id': parent['game_id']}, cb_kwargs={'parent': parent})
+    response = HtmlResponse(url, body=(PAGES / 'game.html').read_bytes(), request=request)
+    output = spider.parse_live(response, parent)
+    return list(FieldProjectionMiddleware().process_spider_output(response, output, spider))
+
+
+def test_poll_with_fields_projects_emitted_items():
+    spider = GamesLiveSpider.from_crawler(get_crawler(GamesLiveSpider), entrypoints=[], fields='game_id,date')
+    spider.entrypoint_requests(GAME)
+
+    events = poll(spider, GAME)
+    assert [item['type'] for item in events] == ['game_event']
+    assert events[0] == {'type': 'game_event', 'game_id': 3426916}
+
+    # same page again, the game is over: the final game item, projected as well
+    final = poll(spider, GAME)
+    assert final == [{'type': 'game', 'game_id': 3426916, 'date': 'Fri, 12/18/20'}]
+    assert spider.games == {}
@@ -0,0 +1,108 @@
+import gzip
+import json
+
+import pytest
+from scrapy import Spider
+from scrapy.utils.test import get_crawler
+
+from tfmkt.exporters import FastJsonLinesItemExporter
+from tfmkt.index import IndexedJsonLines, IndexWriter, index_path
+from tfmkt.keys import item_key, read_keyed_lines
+from tfmkt.pipelines import PartFile, PartitionedOutputPipeline
+
+GAMES = [
+    {'type': 'game', 'game_id': game_id, 'href': f'/a_b/index/spielbericht/{game_id}', 'result': result}
+    for game_id, result in ((1, '1:0'), (2, '2:2'), (1, '3:0'), (3, 'é:0'))
+]
+CLUB = {'type': 'club', 'href': '/a/startseite/verein/1'}
+
+
+@pytest.mark.parametrize('item, expected', [
+    (GAMES[0], '1'),
+    (CLUB, '/a/startseite/verein/1'),
+    ({'type': 'appearance', 'href': '/x'}, None),
+    ({'type': 'game'}, None),
+])
+def test_item_key(item, expected):
+    assert item_key(item) == expected
+
+
+def write_plain(path, items):
+    """Write items the way indexed feeds are, with an IndexWriter."""
+    index = IndexWriter(index_path(path))
+    with open(path, 'wb') as f:
+        for item in items:
+            line = (json.dumps(item, ensure_ascii=False) + '\n').encode('utf-8')
+            index.add(item_key(item), f.tell(), len(line))
+            f.write(line)
+    index.close()
+    return str(path)
+
+
+def test_plain_round_trip(tmp_path):
+    path = write_plain(tmp_path / 'games.jsonl', GAMES + [CLUB])
+    with IndexedJsonLines(path) as games:
+        assert len(games) == 4
+        assert games.get(1) == GAMES[2]
+        assert games.get_all('1') == [GAMES[0], GAMES[2]]
+        assert games.get(3) == GAMES[3]
+        assert games.get(4) is None
+        assert list(games.records([3, '/a/startseite/verein/1', 1, 5])) == [GAMES[2], GAMES[3], CLUB]
+
+
+def test_exported_feed_round_trip(tmp_path):
+    path = tmp_path / 'games.jsonl'
+    with open(path, 'wb') as f:
+        exporter = FastJsonLinesItemExporter(f, index=True)
+        exporter.start_exporting()
+        for game in GAMES:
+            exporter.export_item(game)
+        exporter.finish_exporting()
+
+    # appending to the feed adds to its index
+    with open(path, 'ab') as f:
+        exporter = FastJsonLinesItemExporter(f, index=True)
+        exporter.start_exporting()
+        exporter.export_item(CLUB)
+        exporter.finish_exporting()
+
+    with IndexedJsonLines(str(path)) as games:
+        assert [games.get(key) for key in games.keys()] == [GAMES[2], GAMES[1], GAMES[3], CLUB]
+
+
+def test_gzip_part_round_trip(tmp_path, monkeypatch):
+    # one gzip member every few records
+    monkeypatch.setattr(PartFile, 'CHUNK_SIZE', 100)
+    crawler = get_crawler(Spider, {
+        'PARTITIONED_OUTPUT_DIR': str(tmp_path),
+        'PARTITIONED_OUTPUT_TEMPLATE': 'type={type}',
+        'PARTITIONED_OUTPUT_COMPRESSION': 'gzip',
+        'PARTITIONED_OUTPUT_INDEX': True,
+        'PARTITIONED_OUTPUT_THREADS': 2,
+    })
+    pipeline = PartitionedOutputPipeline.from_crawler(crawler)
+    spider = Spider('games')
+    pipeline.open_spider(spider)
+    games = [{**GAMES[0], 'game_id': game_id} for game_id in range(20)]
+    for game in games:
+        pipeline.process_item(game, spider)
+    pipeline.close_spider(spider)
+
+    path = str(tmp_path / 'type=game' / 'part-00000.jsonl.gz')
+    with gzip.open(path, 'rt') as f:
+        assert [json.loads(line) for line in f] == games
+    with IndexedJsonLines(path) as indexed:
+        assert len({entry.block for entries in indexed.entries.values() for entry in entries}) > 1
+        assert [indexed.get(game_id) for game_id in (19, 0, 7)] == [games[19], games[0], games[7]]
+
+
+def test_read_keyed_lines(tmp_path):
+    indexed = write_plain(tmp_path / 'games.jsonl', GAMES)
+    with gzip.open(tmp_path / 'games.jsonl.gz', 'wt') as f:
+        for game in GAMES:
+            f.write(json.dumps(game) + '\n')
+    (tmp_path / 'keys.txt').write_text('3\n\n1\n')
+
+    for path in (indexed, str(tmp_path / 'games.jsonl.gz')):
+        assert read_keyed_lines(path, '1, 3') == [GAMES[2], GAMES[3]]
+        assert read_keyed_lines(path, f"@{tmp_path / 'keys.txt'}") == [GAMES[2], GAMES[3]]
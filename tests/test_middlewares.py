@@ -0,0 +1,110 @@
+from types import SimpleNamespace
+
+from scrapy import Request, Spider
+from scrapy.http import HtmlResponse
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.test import get_crawler
+
+from tfmkt.middlewares import DepthFirstMiddleware
+from tfmkt.parents import ParentInterningMiddleware, ParentRef
+
+
+class DiscoverySpider(Spider):
+    name = 'discovery'
+    leaf_callbacks = ('parse_details',)
+
+    def parse(self, response):
+        pass
+
+    def parse_details(self, response):
+        pass
+
+
+def middleware(tmp_path, max_queue=2, max_held=3):
+    crawler = get_crawler(DiscoverySpider, {
+        'DEPTH_FIRST_ENABLED': True,
+        'DEPTH_FIRST_LEAF_PRIORITY': 100,
+        'DEPTH_FIRST_MAX_QUEUE': max_queue,
+        'DEPTH_FIRST_MAX_HELD': max_held,
+        'DEPTH_FIRST_SPILL_DIR': str(tmp_path),
+    })
+    spider = crawler.spider = DiscoverySpider()
+    # the scheduler queue and the requests handed over to the engine
+    scheduled = []
+    crawler.engine = SimpleNamespace(slot=SimpleNamespace(scheduler=scheduled), crawl=scheduled.append)
+    return DepthFirstMiddleware.from_crawler(crawler), spider, scheduled
+
+
+def release_all(mw, scheduled):
+    """Release the held back requests until none is left."""
+    scheduled.clear()
+    released = []
+    while len(mw):
+        mw.release()
+        released.extend(scheduled)
+        scheduled.clear()
+    return released
+
+
+def test_leaf_requests_are_prioritized(tmp_path):
+    mw, spider, scheduled = middleware(tmp_path)
+    leaf = Request('http://example.com/leaf', callback=spider.parse_details)
+    output = list(mw.process_spider_output(None, [leaf, {'item': 1}], spider))
+    assert output == [leaf, {'item': 1}]
+    assert leaf.priority == 100
+
+
+def test_held_requests_are_spilled_and_released_in_order(tmp_path):
+    mw, spider, scheduled = middleware(tmp_path)
+    scheduled.extend(['queued'] * 2)
+    requests = [Request(f'http://example.com/{i}', callback=spider.parse) for i in range(10)]
+
+    assert list(mw.process_spider_output(None, requests, spider)) == []
+    assert len(mw.held) == 3
+    assert len(mw) == 10
+    assert mw.crawler.stats.get_value('depth_first/spilled') == 7
+
+    released = release_all(mw, scheduled)
+    assert [request.url for request in released] == [request.url for request in requests]
+
+    mw.spider_closed(spider)
+    assert not any(tmp_path.iterdir())
+
+
+def test_unserializable_requests_stay_in_memory_in_order(tmp_path):
+    mw, spider, scheduled = middleware(tmp_path, max_held=1)
+    scheduled.extend(['queued'] * 2)
+    requests = [Request(f'http://example.com/{i}', callback=spider.parse) for i in range(3)]
+    requests.insert(2, Request('http://example.com/lambda', callback=lambda response: None))
+
+    assert list(mw.process_spider_output(None, requests, spider)) == []
+    # the requests after the unserializable one are not spilled
+    assert len(mw.held) == 1
+    assert len(mw.spilled) == 1
+    assert len(mw.unspilled) == 2
+    assert mw.crawler.stats.get_value('depth_first/unserializable') == 1
+    assert [request.url for request in release_all(mw, scheduled)] == [request.url for request in requests]
+    mw.spider_closed(spider)
+
+
+def test_spilled_requests_carry_parent_references(tmp_path):
+    # the spider output goes through the interning first
+    order = get_project_settings().getdict('SPIDER_MIDDLEWARES')
+    assert order['tfmkt.middlewares.DepthFirstMiddleware'] < order['tfmkt.parents.ParentInterningMiddleware']
+
+    mw, spider, scheduled = middleware(tmp_path, max_held=1)
+    interning = ParentInterningMiddleware.from_crawler(get_crawler(DiscoverySpider, {'PARENT_INTERNING_ENABLED': True}))
+    scheduled.extend(['queued'] * 2)
+    parent = {'type': 'club', 'href': '/c/startseite/verein/1'}
+    requests = [Request(f'http://example.com/{i}', callback=spider.parse, cb_kwargs={'parent': dict(parent)})
+                for i in range(3)]
+
+    output = interning.process_spider_output(None, requests, spider)
+    assert list(mw.process_spider_output(None, output, spider)) == []
+    assert len(mw.spilled) == 2
+    for request in release_all(mw, scheduled):
+        assert isinstance(request.cb_kwargs['parent'], ParentRef)
+        interning.process_spider_input(HtmlResponse(request.url, body=b'', request=request), spider)
+        assert request.cb_kwargs['parent'] == parent
+    mw.spider_closed(spider)
+    interning.spider_closed(spider)
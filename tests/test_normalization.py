@@ -0,0 +1,86 @@
+import pytest
+from scrapy.utils.project import get_project_settings
+
+from tfmkt.normalization import (
+    Normalizer, Unparsed, converter, date, height, integer, market_value, number, parse_number, score,
+)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('12.00', 12.0),
+    ('1,78', 1.78),
+    ('45.123', 45123),
+    ('1,000,000', 1000000),
+    ('1.234,5', 1234.5),
+    ('1,234.5', 1234.5),
+])
+def test_parse_number(text, expected):
+    assert parse_number(text) == expected
+
+
+@pytest.mark.parametrize('convert, value, expected', [
+    (integer, "90'", 90),
+    (integer, '45.123', 45123),
+    (integer, '(28)', 28),
+    (integer, '-', None),
+    (number, '2.5', 2.5),
+    (number, '40%', 40),
+    (market_value, '€12.00m', 12000000),
+    (market_value, '€500k', 500000),
+    (market_value, '€500Th.', 500000),
+    (market_value, '€1.20bn', 1200000000),
+    (market_value, '18,00 Mio. €', 18000000),
+    (market_value, '€350', 350),
+    (market_value, '?', None),
+    (height, '1,78 m', 1.78),
+    (height, '178 cm', 1.78),
+    (date, 'Fri, 12/18/20', '2020-12-18'),
+    (date, 'Jul 29, 1993 (28)', '1993-07-29'),
+    (date, '29.07.1993', '1993-07-29'),
+    (date, 'N/A', None),
+    (score, '2:1', [2, 1]),
+    (score, '(0:1)', [0, 1]),
+])
+def test_converters(convert, value, expected):
+    assert convert(value) == expected
+
+
+@pytest.mark.parametrize('convert, value', [
+    (integer, 'none'),
+    (market_value, '€12.00x'),
+    (date, '18 December'),
+    (score, '-:-'),
+])
+def test_unparsed_values(convert, value):
+    with pytest.raises(Unparsed):
+        convert(value)
+
+
+def test_normalizer_copies_the_objects_it_converts():
+    parent = {'type': 'club', 'href': '/a/startseite/verein/1', 'total_market_value': '€1.00bn'}
+    item = {'market_value': '€1.50m', 'result': '2:1', 'players': [{'height': '1,80 m'}, {'height': '?cm'}], 'parent': parent}
+    normalizer = Normalizer({
+        'market_value': market_value, 'total_market_value': market_value, 'height': height,
+    })
+    normalized = normalizer.normalize(item)
+    assert normalized == {
+        'market_value': 1500000, 'result': '2:1', 'players': [{'height': 1.8}, {'height': '?cm'}],
+        'parent': {**parent, 'total_market_value': 1000000000},
+    }
+    assert parent['total_market_value'] == '€1.00bn'
+    assert normalizer.unparsed == 1
+
+
+def test_default_fields():
+    fields = get_project_settings().getdict('NORMALIZATION_FIELDS')
+    assert fields['halftime_score'] == 'score'
+    assert 'result' not in fields
+    assert all(converter(name) for name in fields.values())
+
+
+def test_parsed_market_values_are_written_as_integers():
+    normalizer = Normalizer({'current_market_value': market_value, 'height': height})
+    normalized = normalizer.normalize({'current_market_value': 25000.0, 'height': 2.0})
+    assert normalized == {'current_market_value': 25000, 'height': 2.0}
+    assert isinstance(normalized['current_market_value'], int)
+    assert normalizer.normalize({'current_market_value': 2500.5}) == {'current_market_value': 2500.5}
@@ -0,0 +1,72 @@
+import logging
+from pathlib import Path
+
+import pytest
+from scrapy import Request
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse
+from scrapy.utils.spider import iterate_spider_output
+from scrapy.utils.test import get_crawler
+
+from tfmkt.offload import OffloadMiddleware
+from tfmkt.spiders.clubs import ClubsSpider
+from tfmkt.spiders.competitions import CompetitionsSpider
+from tfmkt.spiders.games import GamesSpider
+
+PAGES = Path(__file__).parent / 'pages'
+
+COMPETITION_PAGE = b"""
+<div class="responsive-table"><table>
+  <thead><tr><th>#</th><th>Club</th></tr></thead>
+  <tbody>
+    <tr><td>1</td><td><a href="/club-a/startseite/verein/1/saison_id/2023">A</a></td></tr>
+    <tr><td>2</td><td><a href="/club-b/startseite/verein/2/saison_id/2023">B</a></td></tr>
+    <tr><td>3</td><td><a href="/club-a/startseite/verein/1/saison_id/2024">A</a></td></tr>
+  </tbody>
+</table></div>
+"""
+
+
+def comparable(output):
+    return [
+        (element.url, element.callback, element.cb_kwargs) if isinstance(element, Request) else element
+        for element in output
+    ]
+
+
+@pytest.mark.parametrize('spidercls, callback, url, body, cb_kwargs, expected', [
+    # the season argument is copied over to the worker spider, only the 2023 clubs are followed
+    (ClubsSpider, 'parse', 'https://www.transfermarkt.co.uk/premier-league/startseite/wettbewerb/GB1',
+     COMPETITION_PAGE, {'parent': {'type': 'competition', 'href': '/premier-league/startseite/wettbewerb/GB1'}}, 2),
+    (GamesSpider, 'parse_game', 'https://www.transfermarkt.co.uk/club-a_club-b/index/spielbericht/3426916',
+     (PAGES / 'game.html').read_bytes(),
+     {'base': {'type': 'game', 'href': '/club-a_club-b/index/spielbericht/3426916', 'parent': {}}}, 1),
+])
+def test_offloaded_output_matches_the_in_process_one(spidercls, callback, url, body, cb_kwargs, expected):
+    crawler = get_crawler(spidercls, {'OFFLOAD_CALLBACKS': [callback], 'OFFLOAD_WORKERS': 1})
+    spider = spidercls(entrypoints=[], season='2023')
+    mw = OffloadMiddleware.from_crawler(crawler)
+    mw.spider_opened(spider)
+
+    request = Request(url, callback=getattr(spider, callback), cb_kwargs=cb_kwargs)
+    response = HtmlResponse(url, body=body, encoding='utf-8', request=request)
+    mw.process_response(request, response, spider)
+    assert request.callback == mw.offloaded_callback
+    try:
+        offloaded = mw._rebuild_output(mw.submit(response, cb_kwargs).result(timeout=60))
+    finally:
+        mw.spider_closed(spider)
+    in_process = list(iterate_spider_output(getattr(spider, callback)(response, **cb_kwargs)))
+
+    assert len(in_process) == expected
+    assert comparable(offloaded) == comparable(in_process)
+
+
+def test_stateful_callbacks_are_not_offloaded(caplog):
+    crawler = get_crawler(CompetitionsSpider, {'OFFLOAD_CALLBACKS': ['parse', 'parse_competitions']})
+    with caplog.at_level(logging.WARNING, logger='tfmkt.offload'):
+        assert OffloadMiddleware.from_crawler(crawler).callbacks == {'parse'}
+    assert "parse_competitions" in caplog.text
+
+    with pytest.raises(NotConfigured):
+        OffloadMiddleware.from_crawler(get_crawler(CompetitionsSpider, {'OFFLOAD_CALLBACKS': ['parse_competitions']}))
@@ -0,0 +1,148 @@
+from types import SimpleNamespace
+
+import pytest
+from scrapy import Request, Spider, signals
+from scrapy.exceptions import DontCloseSpider
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+
+from tfmkt.orchestrator import StageFeeder, as_entrypoint
+
+
+class ClubsSpider(Spider):
+    name = 'clubs'
+
+    def entrypoint_requests(self, item):
+        yield Request(f"https://www.transfermarkt.co.uk{item['href']}")
+
+
+def fake_engine():
+    """An engine scheduling the requests it is handed in a list, and recording its pauses."""
+    engine = SimpleNamespace(slot=SimpleNamespace(scheduler=[], inprogress=set()), paused=False)
+    engine.crawl = engine.slot.scheduler.append
+    engine.pause = lambda: setattr(engine, 'paused', True)
+    engine.unpause = lambda: setattr(engine, 'paused', False)
+    return engine
+
+
+def stages(queue_size=4, max_outstanding=2):
+    upstream = get_crawler(Spider)
+    upstream.engine = fake_engine()
+    upstream.spider = Spider('competitions')
+    downstream = get_crawler(ClubsSpider)
+    downstream.engine = fake_engine()
+    downstream.spider = ClubsSpider()
+    feeder = StageFeeder(upstream, downstream, queue_size=queue_size, max_outstanding=max_outstanding)
+    return feeder, upstream, downstream
+
+
+def club(club_id):
+    return {'type': 'club', 'href': f'/c/startseite/verein/{club_id}', 'parent': {'type': 'competition'}}
+
+
+def scrape(upstream, item):
+    upstream.signals.send_catch_log(signals.item_scraped, item=item, response=None, spider=upstream.spider)
+
+
+def download(downstream):
+    """Process the first scheduled downstream request, as the engine would."""
+    slot = downstream.engine.slot
+    request = slot.scheduler.pop(0)
+    slot.inprogress.add(request)
+    downstream.signals.send_catch_log(signals.response_received, response=Response(request.url), request=request,
+                                      spider=downstream.spider)
+    slot.inprogress.remove(request)
+    return request
+
+
+def scheduled(downstream):
+    return [request.url.rsplit('/', 1)[1] for request in downstream.engine.slot.scheduler]
+
+
+def test_as_entrypoint_drops_the_parent():
+    item = club(1)
+    assert as_entrypoint(item) == {'type': 'club', 'href': '/c/startseite/verein/1'}
+    assert 'parent' in item
+
+
+def test_parents_wait_for_the_downstream_stage_to_open():
+    feeder, upstream, downstream = stages()
+    scrape(upstream, club(1))
+    assert len(feeder.queue) == 1
+    assert scheduled(downstream) == []
+
+    downstream.signals.send_catch_log(signals.spider_opened, spider=downstream.spider)
+    assert scheduled(downstream) == ['1']
+
+
+def test_feeding_stops_at_max_outstanding_and_resumes_on_responses():
+    feeder, upstream, downstream = stages(max_outstanding=2)
+    feeder.downstream_open = True
+    for club_id in range(3):
+        scrape(upstream, club(club_id))
+    assert scheduled(downstream) == ['0', '1']
+    assert len(feeder.queue) == 1
+
+    # the request being processed still counts as outstanding
+    download(downstream)
+    assert scheduled(downstream) == ['1']
+    download(downstream)
+    assert scheduled(downstream) == ['2']
+    assert not feeder.queue
+
+    # dropped requests make room too
+    scrape(upstream, club(3))
+    scrape(upstream, club(4))
+    assert scheduled(downstream) == ['2', '3']
+    request = downstream.engine.slot.scheduler.pop(0)
+    downstream.signals.send_catch_log(signals.request_dropped, request=request, spider=downstream.spider)
+    assert scheduled(downstream) == ['3', '4']
+    assert not feeder.queue
+
+
+def test_upstream_is_paused_while_the_queue_is_full():
+    feeder, upstream, downstream = stages(queue_size=4, max_outstanding=1)
+    feeder.downstream_open = True
+    # one parent handed over, four queued
+    for club_id in range(5):
+        scrape(upstream, club(club_id))
+    assert len(feeder.queue) == 4
+    assert upstream.engine.paused
+
+    # resumed once the queue is drained to half its size
+    download(downstream)
+    assert len(feeder.queue) == 4
+    with pytest.raises(DontCloseSpider):
+        feeder.downstream_idle(downstream.spider)
+    assert len(feeder.queue) == 3
+    assert upstream.engine.paused
+    download(downstream)
+    with pytest.raises(DontCloseSpider):
+        feeder.downstream_idle(downstream.spider)
+    assert len(feeder.queue) == 2
+    assert not upstream.engine.paused
+    assert upstream.engine_pauses == 0
+
+
+def test_downstream_stage_is_closed_once_the_upstream_one_is_done():
+    feeder, upstream, downstream = stages(max_outstanding=1)
+    feeder.downstream_open = True
+    scrape(upstream, club(1))
+    scrape(upstream, club(2))
+    download(downstream)
+
+    # kept open while the upstream stage runs
+    with pytest.raises(DontCloseSpider):
+        feeder.downstream_idle(downstream.spider)
+    assert scheduled(downstream) == ['2']
+
+    # or while parents are queued
+    scrape(upstream, club(3))
+    feeder.upstream_closed(upstream.spider, 'finished')
+    with pytest.raises(DontCloseSpider):
+        feeder.downstream_idle(downstream.spider)
+    download(downstream)
+    # the last parents are handed over, the engine closes the spider once their requests are done
+    feeder.downstream_idle(downstream.spider)
+    assert scheduled(downstream) == ['3']
+    assert not feeder.queue
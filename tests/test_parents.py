@@ -0,0 +1,119 @@
+import pickle
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.http import HtmlResponse
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.request import request_from_dict
+from scrapy.utils.test import get_crawler
+
+from tfmkt.parents import ParentInterningMiddleware, ParentRef, ParentRegistry
+from tfmkt.pipelines import NormalizedOutputPipeline
+
+
+def club(club_id, **fields):
+    return {'type': 'club', 'href': f'/c/startseite/verein/{club_id}', **fields}
+
+
+def test_equal_parents_share_one_instance():
+    registry = ParentRegistry()
+    first = registry.canonical(club(1))
+    assert registry.canonical(club(1)) is first
+    assert registry.canonical(first) is first
+    # same href, other fields: a variant of its own
+    assert registry.canonical(club(1, name='A')) is not first
+    assert len(registry) == 2
+
+
+def test_least_recently_used_parents_are_evicted():
+    registry = ParentRegistry(max_size=2)
+    refs = [registry.intern(club(i)) for i in range(3)]
+    assert len(registry) == 2
+    assert registry.evicted == 1
+    # references hold their parent, evicted or not
+    assert registry.resolve(refs[0]) == club(0)
+    # an evicted parent seen again is registered anew
+    assert registry.intern(club(0)).variant == 4
+
+
+def test_pickled_references_are_resolved_from_the_file(tmp_path):
+    path = str(tmp_path / 'parents.jsonl')
+    registry = ParentRegistry(path, max_size=1)
+    pickled = pickle.dumps(registry.intern(club(1, name='A')))
+    registry.intern(club(2))
+
+    ref = pickle.loads(pickled)
+    assert type(ref) is ParentRef
+    assert registry.resolve(ref) == club(1, name='A')
+    registry.close()
+
+    # only pickled parents are written
+    assert len((tmp_path / 'parents.jsonl').read_text().splitlines()) == 1
+
+    # the next run resolves it too, and numbers new parents after the ones of the file
+    registry = ParentRegistry(path)
+    assert registry.resolve(ref) == club(1, name='A')
+    assert registry.intern(club(1, name='A')).variant == 1
+    assert registry.intern(club(3)).variant == 2
+    registry.close()
+
+
+def test_pickled_references_without_a_file():
+    registry = ParentRegistry()
+    ref = registry.intern(club(1))
+    pickled = pickle.dumps(ref)
+    # written once
+    pickle.dumps(ref)
+    assert registry.resolve(pickle.loads(pickled)) is ref.parent
+    assert len(registry.offsets) == 1
+    registry.close()
+
+
+def test_unknown_references():
+    with pytest.raises(KeyError):
+        ParentRegistry().resolve(ParentRef('/c/startseite/verein/1', 1))
+
+
+def test_middleware_round_trip(tmp_path):
+    class ClubsSpider(Spider):
+        name = 'clubs'
+
+        def parse(self, response, parent):
+            pass
+
+    crawler = get_crawler(ClubsSpider, {
+        'PARENT_INTERNING_ENABLED': True, 'PARENT_INTERNING_MAX_PARENTS': 10, 'JOBDIR': str(tmp_path),
+    })
+    spider = crawler.spider = ClubsSpider()
+    mw = ParentInterningMiddleware.from_crawler(crawler)
+
+    parent = club(1)
+    request = Request('https://www.transfermarkt.co.uk/x', callback=spider.parse, cb_kwargs={'parent': dict(parent)})
+    [request] = mw.process_spider_output(None, [request], spider)
+    assert isinstance(request.cb_kwargs['parent'], ParentRef)
+
+    # through a disk queue
+    request = request_from_dict(pickle.loads(pickle.dumps(request.to_dict(spider=spider))), spider=spider)
+    mw.process_spider_input(HtmlResponse(request.url, body=b'', request=request), spider)
+    assert request.cb_kwargs['parent'] == parent
+
+    [item] = mw.process_spider_output(None, [{'type': 'player', 'parent': dict(parent)}], spider)
+    assert item['parent'] is request.cb_kwargs['parent']
+    mw.spider_closed(spider)
+    assert crawler.stats.get_value('parents/interned') == 1
+
+
+def test_normalized_output_keys(tmp_path):
+    crawler = get_crawler(Spider, {'NORMALIZED_OUTPUT_PARENTS': str(tmp_path / 'parents.jsonl')})
+    pipeline = NormalizedOutputPipeline.from_crawler(crawler)
+    pipeline.open_spider(None)
+    keys = [pipeline.parent_key(parent) for parent in (club(1), club(1, name='A'), club(1), club(2))]
+    pipeline.close_spider(None)
+    assert keys == ['/c/startseite/verein/1', '/c/startseite/verein/1#1', '/c/startseite/verein/1', '/c/startseite/verein/2']
+    assert len((tmp_path / 'parents.jsonl').read_text().splitlines()) == 3
+
+
+def test_normalized_output_runs_after_the_other_pipelines():
+    pipelines = get_project_settings().getdict('ITEM_PIPELINES')
+    order = pipelines.pop('tfmkt.pipelines.NormalizedOutputPipeline')
+    assert order > max(pipelines.values())
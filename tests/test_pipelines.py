@@ -0,0 +1,161 @@
+from types import SimpleNamespace
+
+import pytest
+from scrapy import Spider
+from scrapy.exceptions import DontCloseSpider, DropItem
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+
+from tfmkt.pipelines import ChangeDetectionPipeline, ParquetExportPipeline, flatten, item_season
+
+
+def club(club_id, parent=1, **fields):
+    return {'type': 'club', 'href': f'/c/startseite/verein/{club_id}',
+            'parent': {'href': f'/l/startseite/wettbewerb/L{parent}'}, **fields}
+
+
+def change_detection(tmp_path, **settings):
+    crawler = get_crawler(Spider, {
+        'CHANGE_DETECTION_INDEX': str(tmp_path / 'index.tsv'),
+        'CHANGE_DETECTION_IGNORED_FIELDS': ['scraped_at'],
+        **settings,
+    })
+    crawler.spider = spider = Spider('clubs')
+    scheduled = []
+    crawler.engine = SimpleNamespace(crawl=scheduled.append)
+    return ChangeDetectionPipeline.from_crawler(crawler), spider, scheduled
+
+
+def run(pipeline, spider, items):
+    """Send items through the pipeline, and return the ones not dropped."""
+    passed = []
+    for item in items:
+        try:
+            passed.append(pipeline.process_item(item, spider))
+        except DropItem:
+            pass
+    return passed
+
+
+def test_unchanged_items_are_dropped_on_the_next_run(tmp_path):
+    pipeline, spider, _ = change_detection(tmp_path)
+    items = [club(1, name='A'), club(2, name='B'), {'type': 'appearance', 'goals': 1}]
+    assert run(pipeline, spider, items) == items
+    pipeline.close_spider(spider)
+    assert len((tmp_path / 'index.tsv').read_text().splitlines()) == 2
+
+    # the index is read back by the next run, ignored fields are not hashed
+    pipeline, spider, _ = change_detection(tmp_path)
+    items = [club(1, name='A', scraped_at='2024-01-01'), club(2, name='B2'), club(3), {'type': 'appearance', 'goals': 1}]
+    assert run(pipeline, spider, items) == items[1:]
+    stats = pipeline.crawler.stats
+    assert [stats.get_value(f'change_detection/{name}') for name in ('new', 'changed', 'unchanged')] == [1, 1, 1]
+    pipeline.close_spider(spider)
+
+    pipeline, spider, _ = change_detection(tmp_path)
+    assert run(pipeline, spider, [club(2, name='B2')]) == []
+
+
+def test_tombstones_are_emitted_for_entities_not_scraped_again(tmp_path):
+    pipeline, spider, _ = change_detection(tmp_path)
+    run(pipeline, spider, [club(1), club(2), club(3, parent=2)])
+    pipeline.close_spider(spider)
+
+    pipeline, spider, scheduled = change_detection(tmp_path, CHANGE_DETECTION_TOMBSTONES=True)
+    # club 2 is gone from its competition, the competition of club 3 was not scraped
+    run(pipeline, spider, [club(1)])
+    with pytest.raises(DontCloseSpider):
+        pipeline.spider_idle(spider)
+    [request] = scheduled
+    assert request.url == 'data:,'
+    tombstones = list(request.callback(Response(request.url, request=request)))
+    assert tombstones == [
+        {'type': 'club', 'href': '/c/startseite/verein/2', 'parent': {'href': '/l/startseite/wettbewerb/L1'}, 'deleted': True}
+    ]
+    # tombstones go through the pipeline untouched, and are only sent once
+    assert run(pipeline, spider, tombstones) == tombstones
+    pipeline.spider_idle(spider)
+    assert len(scheduled) == 1
+    assert pipeline.crawler.stats.get_value('change_detection/deleted') == 1
+    pipeline.close_spider(spider)
+
+    pipeline, spider, _ = change_detection(tmp_path)
+    assert set(pipeline.index) == {('club', '/c/startseite/verein/1'), ('club', '/c/startseite/verein/3')}
+
+
+def test_flatten():
+    item = {'type': 'game', 'home_club': {'type': 'club', 'href': '/a'}, 'events': [{'minute': 1}],
+            'parent': {'href': '/l', 'parent': {'href': '/c'}}}
+    assert flatten(item) == {
+        'type': 'game', 'home_club.type': 'club', 'home_club.href': '/a', 'events': '[{"minute": 1}]',
+        'parent.href': '/l', 'parent.parent.href': '/c',
+    }
+
+
+@pytest.mark.parametrize('item, season, expected', [
+    ({'href': '/c/startseite/verein/1/saison_id/2023'}, None, '2023'),
+    ({'href': '/c/startseite/verein/1', 'parent': {'href': '/l/startseite/wettbewerb/L1/saison_id/2022'}}, None, '2022'),
+    ({'href': '/c/startseite/verein/1/saison_id/2023'}, 2021, '2021'),
+    ({'type': 'appearance'}, None, 'unknown'),
+])
+def test_item_season(item, season, expected):
+    spider = Spider('clubs')
+    spider.season = season
+    assert item_season(item, spider) == expected
+
+
+def parquet_export(tmp_path, row_group_size):
+    pytest.importorskip('pyarrow')
+    crawler = get_crawler(Spider, {
+        'PARQUET_OUTPUT_DIR': str(tmp_path), 'PARQUET_ROW_GROUP_SIZE': row_group_size, 'PARQUET_COMPRESSION': 'snappy',
+    })
+    return ParquetExportPipeline.from_crawler(crawler), Spider('games')
+
+
+def game(game_id, season=2023, **fields):
+    return {'type': 'game', 'game_id': game_id,
+            'parent': {'type': 'competition', 'href': f'/l/startseite/wettbewerb/L1/saison_id/{season}'}, **fields}
+
+
+def test_parquet_partitions(tmp_path):
+    pipeline, spider = parquet_export(tmp_path, row_group_size=2)
+    pq = pytest.importorskip('pyarrow.parquet')
+    items = [game(1, home_club={'href': '/a'}), game(2, home_club={'href': '/b'}), game(3, home_club={'href': '/c'}),
+             game(4, season=2022, home_club={'href': '/d'}), {'type': 'appearance', 'goals': 1}]
+    for item in items:
+        assert pipeline.process_item(item, spider) is item
+    pipeline.close_spider(spider)
+
+    path = tmp_path / 'type=game' / 'season=2023' / 'part-00000.parquet'
+    assert pq.ParquetFile(str(path)).num_row_groups == 2
+    assert pq.ParquetFile(str(path)).read().to_pylist() == [flatten(item) for item in items[:3]]
+    assert sorted(str(path.relative_to(tmp_path)) for path in tmp_path.rglob('*.parquet')) == [
+        'type=appearance/season=unknown/part-00000.parquet',
+        'type=game/season=2022/part-00000.parquet',
+        'type=game/season=2023/part-00000.parquet',
+    ]
+    assert pipeline.stats.get_value('parquet/rows') == 5
+    assert pipeline.stats.get_value('parquet/row_groups') == 4
+
+
+def test_parquet_schema_changes_and_mixed_types(tmp_path):
+    pipeline, spider = parquet_export(tmp_path, row_group_size=2)
+    pq = pytest.importorskip('pyarrow.parquet')
+    items = [
+        game(1, attendance=1000), game(2, attendance=2000),
+        # a new column, in the second row, starts a new file
+        game(3, attendance=3000), game(4, attendance=4000, referee='R'),
+        # numbers and strings in a column: a new file of strings
+        game(5, attendance='-'), game(6, attendance=6000),
+    ]
+    for item in items:
+        pipeline.process_item(item, spider)
+    pipeline.close_spider(spider)
+
+    directory = tmp_path / 'type=game' / 'season=2023'
+    parts = [pq.ParquetFile(str(directory / f'part-{part:05d}.parquet')).read().to_pylist() for part in range(3)]
+    assert parts[0] == [flatten(item) for item in items[:2]]
+    assert parts[1] == [{**flatten(items[2]), 'referee': None}, flatten(items[3])]
+    assert parts[2] == [{key: str(value) for key, value in flatten(item).items()} for item in items[4:]]
+    assert pipeline.stats.get_value('parquet/schema_changes') == 2
+    assert pipeline.stats.get_value('parquet/stringified_row_groups') == 1
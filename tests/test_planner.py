@@ -0,0 +1,101 @@
+import datetime
+import json
+
+import pytest
+
+from tfmkt.planner import METADATA_SUFFIX, Planner, read_scraped_at, utc_timestamp
+
+NIGHT_1 = datetime.datetime(2024, 3, 1, 2, tzinfo=datetime.timezone.utc)
+NIGHT_2 = NIGHT_1 + datetime.timedelta(days=40)
+
+COMPETITIONS = {
+    'GB1': {'type': 'competition', 'href': '/premier-league/startseite/wettbewerb/GB1'},
+    'ES1': {'type': 'competition', 'href': '/laliga/startseite/wettbewerb/ES1'},
+}
+CLUBS = {
+    '1': {'type': 'club', 'href': '/a/startseite/verein/1'},
+    '2': {'type': 'club', 'href': '/b/startseite/verein/2'},
+}
+
+
+def write_output(path, items, scraped_at=None):
+    with open(path, 'w') as f:
+        for item in items:
+            f.write(json.dumps(item) + '\n')
+    if scraped_at is not None:
+        with open(str(path) + METADATA_SUFFIX, 'w') as f:
+            json.dump({'spider': 'test', 'started_at': scraped_at.isoformat()}, f)
+    return str(path)
+
+
+def player(player_id, club_id):
+    return {'type': 'player', 'href': f'/p/profil/spieler/{player_id}', 'parent': CLUBS[club_id]}
+
+
+def test_catalog_is_kept_across_runs(tmp_path):
+    state = str(tmp_path / 'plan_state.json')
+
+    night_1 = Planner.load(state, now=NIGHT_1)
+    night_1.ingest('clubs', write_output(tmp_path / 'clubs.json', [
+        {**CLUBS['1'], 'parent': COMPETITIONS['GB1']},
+        {**CLUBS['2'], 'parent': COMPETITIONS['ES1']},
+    ], NIGHT_1))
+    night_1.ingest('players', write_output(tmp_path / 'players.json', [player(10, '1'), player(20, '2')], NIGHT_1))
+    night_1.save(state)
+
+    # 40 days later, only the players of club 1 were refreshed
+    night_2 = Planner.load(state, now=NIGHT_2)
+    night_2.ingest('players', write_output(tmp_path / 'players_new.json', [player(10, '1')], NIGHT_2 - datetime.timedelta(hours=1)))
+    plans = night_2.plan(max_age=30, transfer_windows='01-01:01-02')
+
+    assert [parent['href'] for parent in plans['clubs']] == [
+        COMPETITIONS['ES1']['href'], COMPETITIONS['GB1']['href']
+    ]
+    assert [parent['href'] for parent in plans['players']] == [CLUBS['2']['href']]
+    assert [parent['href'] for parent in plans['appearances']] == ['/p/profil/spieler/10', '/p/profil/spieler/20']
+    assert night_2.reasons['players'] == {'stale': 1}
+
+
+def test_played_clubs_are_planned(tmp_path):
+    planner = Planner(now=NIGHT_1 + datetime.timedelta(days=3))
+    planner.ingest('players', write_output(tmp_path / 'players.json', [player(10, '1'), player(20, '2')]), NIGHT_1)
+    planner.ingest('games_urls', write_output(tmp_path / 'games.json', [{
+        'type': 'game', 'href': '/spielbericht/index/spielbericht/1', 'result': '2:1', 'date_iso': '2024-03-02',
+        'home_club': CLUBS['1'], 'away_club': {'href': '/c/startseite/verein/3'},
+        'parent': COMPETITIONS['GB1'],
+    }]), NIGHT_1)
+    plans = planner.plan(transfer_windows='01-01:01-02')
+
+    assert [parent['href'] for parent in plans['players']] == [CLUBS['1']['href']]
+    assert planner.reasons['players'] == {'played': 1}
+
+
+def test_squads_are_replaced_by_new_outputs(tmp_path):
+    state = str(tmp_path / 'plan_state.json')
+    planner = Planner.load(state, now=NIGHT_1)
+    planner.ingest('players', write_output(tmp_path / 'players.json', [player(10, '1'), player(20, '1')]), NIGHT_1)
+    planner.save(state)
+
+    planner = Planner.load(state, now=NIGHT_2)
+    planner.ingest('players', write_output(tmp_path / 'players_new.json', [player(10, '1')]), NIGHT_2)
+    assert planner.squads == {'1': {'10'}}
+
+
+def test_scrape_time_is_required(tmp_path):
+    planner = Planner(now=NIGHT_1)
+    with pytest.raises(ValueError):
+        planner.ingest('players', write_output(tmp_path / 'players.json', [player(10, '1')]))
+
+
+def test_state_files_of_earlier_versions_are_read(tmp_path):
+    planner = Planner({'players': {'1': '2024-03-01T02:00:00+00:00'}}, now=NIGHT_1)
+    assert planner.last_scraped['players'] == {'1': '2024-03-01T02:00:00+00:00'}
+    assert planner.catalog['club'] == {}
+
+
+def test_scrape_times_are_utc(tmp_path):
+    assert utc_timestamp('2024-03-01T03:00:00+01:00') == '2024-03-01T02:00:00+00:00'
+    assert utc_timestamp('2024-03-01T02:00:00Z') == '2024-03-01T02:00:00+00:00'
+    assert utc_timestamp('2024-03-01T02:00:00') == '2024-03-01T02:00:00+00:00'
+    path = write_output(tmp_path / 'players.json', [], NIGHT_1)
+    assert read_scraped_at(path) == '2024-03-01T02:00:00+00:00'
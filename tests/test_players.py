@@ -0,0 +1,38 @@
+from pathlib import Path
+
+import pytest
+from scrapy.http import HtmlResponse
+from scrapy.utils.spider import iterate_spider_output
+
+from tfmkt.spiders.players import MARKET_VALUE_DESCRIPTION_PATTERN, PlayersSpider
+
+PAGES = Path(__file__).parent / 'pages'
+PATH = '/joel-matip/profil/spieler/33040'
+DESCRIPTION = 'Joel Matip, 29, from Cameroon ➤ Liverpool FC ➤ Market value: €12.00m ➤ * Aug 8, 1991'
+
+
+@pytest.mark.parametrize('description, expected', [
+    (DESCRIPTION, '€12.00m'),
+    ('Joel Matip, 33, from Cameroon ➤ Without Club, since Jul 1, 2024 ➤ market value is €2.50m', '€2.50m'),
+    ('Caoimhin Kelleher, 21, from Ireland ➤ Market Value: €500k', '€500k'),
+    ('Joel Matip, 33, from Cameroon ➤ Retired, since Jul 1, 2024', None),
+])
+def test_market_value_description_pattern(description, expected):
+    match = MARKET_VALUE_DESCRIPTION_PATTERN.search(description)
+    assert (match and match.group(1)) == expected
+
+
+@pytest.mark.parametrize('description, expected', [
+    (DESCRIPTION, 12000000.0),
+    # free agents
+    ('Joel Matip, 33, from Cameroon ➤ Without Club, since Jul 1, 2024 ➤ market value is €25k ➤ * Aug 8, 1991', 25000.0),
+])
+def test_current_market_value(description, expected):
+    body = (PAGES / 'player.html').read_text(encoding='utf-8').replace(DESCRIPTION, description)
+    response = HtmlResponse('https://www.transfermarkt.co.uk' + PATH, body=body, encoding='utf-8')
+    [item] = iterate_spider_output(
+        PlayersSpider(entrypoints=[]).parse_details(response, base={'type': 'player', 'href': PATH, 'parent': {}})
+    )
+    # floats, as whole values are converted to integers by the normalization pipeline
+    assert item['current_market_value'] == expected
+    assert isinstance(item['current_market_value'], float)
@@ -0,0 +1,98 @@
+import argparse
+import json
+
+import pytest
+from scrapy.exceptions import UsageError
+from scrapy.settings import Settings
+
+from tfmkt.commands.store import Command
+from tfmkt.spiders.clubs import ClubsSpider
+from tfmkt.spiders.common import read_store
+from tfmkt.spiders.players import PlayersSpider
+from tfmkt.store import EntityStore, is_store
+
+
+def club(club_id, **fields):
+    return {'type': 'club', 'href': f'/c/startseite/verein/{club_id}',
+            'parent': {'type': 'competition', 'href': '/l/startseite/wettbewerb/L1'}, **fields}
+
+
+def write_store(path):
+    store = EntityStore(str(path), commit_size=2)
+    store.upsert('club', '/c/startseite/verein/2', club(2), scraped_at='2024-01-01T00:00:00+00:00')
+    store.upsert('club', '/c/startseite/verein/1', club(1), scraped_at='2024-01-01T00:00:00+00:00')
+    store.upsert('competition', '/l/startseite/wettbewerb/L1', {'type': 'competition', 'href': '/l/startseite/wettbewerb/L1'})
+    # replaces the item, keeps the first scrape time
+    store.upsert('club', '/c/startseite/verein/1', club(1, name='A'), scraped_at='2024-02-01T00:00:00+00:00')
+    store.close()
+    return str(path)
+
+
+def test_upserts_keep_the_latest_version(tmp_path):
+    store = EntityStore(write_store(tmp_path / 'entities.db'))
+    assert store.get('club', '/c/startseite/verein/1') == club(1, name='A')
+    assert store.get('club', '/c/startseite/verein/3') is None
+    assert store.connection.execute(
+        "SELECT first_scraped_at, last_scraped_at FROM entities WHERE key = '/c/startseite/verein/1'"
+    ).fetchone() == ('2024-01-01T00:00:00+00:00', '2024-02-01T00:00:00+00:00')
+
+    store.delete('club', '/c/startseite/verein/2')
+    assert store.get('club', '/c/startseite/verein/2') is None
+    store.close()
+
+
+def test_query(tmp_path):
+    store = EntityStore(write_store(tmp_path / 'entities.db'))
+    assert list(store.query(entity_type='club')) == [club(1, name='A'), club(2)]
+    assert [item['type'] for item in store.query()] == ['club', 'club', 'competition']
+    assert list(store.query(parent='/l/startseite/wettbewerb/L1', scraped_before='2024-01-15')) == [club(2)]
+    assert list(store.query(where="json_extract(item, '$.name') = 'A'")) == [club(1, name='A')]
+    store.close()
+
+
+@pytest.mark.parametrize('file_name, expected', [
+    ('entities.db', True), ('entities.sqlite3', True), ('clubs.json', False), ('clubs.json.gz', False),
+])
+def test_is_store(file_name, expected):
+    assert is_store(file_name) == expected
+
+
+def run_command(*args):
+    command = Command()
+    command.settings = Settings()
+    parser = argparse.ArgumentParser()
+    command.add_options(parser)
+    opts, args = parser.parse_known_args(list(args))
+    command.run(args, opts)
+
+
+def test_store_command(tmp_path, capsys):
+    path = write_store(tmp_path / 'entities.db')
+    run_command(path, '--type', 'club', '--older-than', '1')
+    assert [json.loads(line) for line in capsys.readouterr().out.splitlines()] == [club(1, name='A'), club(2)]
+
+    output = tmp_path / 'clubs.json'
+    run_command(path, '--parent', '/l/startseite/wettbewerb/L1', '--where', "json_extract(item, '$.name') IS NULL",
+                '-o', str(output))
+    assert [json.loads(line) for line in output.read_text().splitlines()] == [club(2)]
+
+    with pytest.raises(UsageError):
+        run_command(str(tmp_path / 'missing.db'))
+
+
+def test_spiders_read_parents_from_a_store(tmp_path):
+    path = write_store(tmp_path / 'entities.db')
+    assert read_store(path, 'competition') == [{'type': 'competition', 'href': '/l/startseite/wettbewerb/L1'}]
+    with pytest.raises(ValueError):
+        read_store(path, None)
+    with pytest.raises(FileNotFoundError):
+        read_store(str(tmp_path / 'missing.db'), 'club')
+
+    # parents of parents are dropped, as with JSON lines
+    spider = PlayersSpider(parents=path, parents_type='club')
+    assert spider.entrypoints == [
+        {'type': 'club', 'href': '/c/startseite/verein/1', 'name': 'A'},
+        {'type': 'club', 'href': '/c/startseite/verein/2'},
+    ]
+    spider = ClubsSpider(parents=path, parents_type='competition')
+    assert spider.entrypoints == [{'type': 'competition', 'href': '/l/startseite/wettbewerb/L1'}]
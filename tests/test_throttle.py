@@ -0,0 +1,105 @@
+"""End-to-end check of tfmkt.throttle.AdaptiveThrottle against the rate limited stand-in server.
+
+The crawl runs in a child process, since the Twisted reactor cannot be
+restarted within the test session.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from tfmkt.throttle import parse_retry_after
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+REQUESTS = 30
+# responses after which the stand-in stops rate limiting, to see the delay recover
+LIMITED_RESPONSES = 12
+
+
+@pytest.mark.parametrize('value, expected', [
+    (b'5', 5.0),
+    (' 12 ', 12.0),
+    (None, None),
+    (b'soon', None),
+    (b'Wed, 21 Oct 2015 07:28:00 GMT', 0.0),
+])
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def crawl():
+    """Crawl the rate limited stand-in with the throttle enabled, and return the crawler stats."""
+    from scrapy import Request, Spider
+    from scrapy.crawler import CrawlerRunner
+    from scrapy.utils.log import configure_logging
+    from twisted.internet import reactor
+    from twisted.web import server
+
+    from tfmkt.localserver import PagesResource, RateLimitedResource
+
+    limited = RateLimitedResource(PagesResource(), rps=2, status=429)
+    port = reactor.listenTCP(0, server.Site(limited), interface='127.0.0.1')
+    base_url = f'http://127.0.0.1:{port.getHost().port}'
+
+    class ThrottledSpider(Spider):
+        name = 'throttled'
+        responses = 0
+
+        def start_requests(self):
+            for i in range(REQUESTS):
+                yield Request(f'{base_url}/page/{i}', dont_filter=True)
+
+        def parse(self, response):
+            self.responses += 1
+            if self.responses == LIMITED_RESPONSES:
+                # the site is healthy again
+                limited.rps = 0
+            yield {'url': response.url}
+
+    configure_logging({'LOG_LEVEL': 'ERROR'})
+    runner = CrawlerRunner({
+        'EXTENSIONS': {'tfmkt.throttle.AdaptiveThrottle': 0},
+        'THROTTLE_ENABLED': True,
+        'THROTTLE_TARGET_RPS': 10.0,
+        'THROTTLE_MAX_DELAY': 2.0,
+        'THROTTLE_BACKOFF_FACTOR': 2.0,
+        'THROTTLE_RECOVERY_FACTOR': 0.5,
+        'THROTTLE_SLOW_RESPONSE': 10.0,
+        'THROTTLE_RATE_WINDOW': 60.0,
+        'THROTTLE_LOG_INTERVAL': 0,
+        'CONCURRENT_REQUESTS': 4,
+        'RETRY_TIMES': 20,
+        'RETRY_HTTP_CODES': [429],
+        'REQUEST_FINGERPRINTER_IMPLEMENTATION': '2.7',
+        'TELNETCONSOLE_ENABLED': False,
+    })
+    crawler = runner.create_crawler(ThrottledSpider)
+    done = runner.crawl(crawler)
+    done.addBoth(lambda _: reactor.stop())
+    reactor.run()
+    return crawler.stats.get_stats()
+
+
+def test_throttle_backs_off_and_recovers():
+    child = subprocess.run(
+        [sys.executable, __file__], cwd=ROOT, env={**os.environ, 'PYTHONPATH': ROOT},
+        capture_output=True, text=True, timeout=120
+    )
+    assert child.returncode == 0, child.stderr
+    stats = json.loads(child.stdout.strip().splitlines()[-1])
+
+    mindelay = 1.0 / 10.0
+    assert stats['item_scraped_count'] == REQUESTS
+    assert stats['throttle/backoff/429'] > 0
+    assert stats['throttle/max_delay'] > mindelay
+    # healthy responses bring the delay back down to the target rate
+    assert stats['throttle/delay'] == pytest.approx(mindelay)
+    assert stats['throttle/delay'] < stats['throttle/max_delay']
+    assert 0 < stats['throttle/effective_rps'] <= 10.0
+
+
+if __name__ == '__main__':
+    print(json.dumps(crawl(), default=str))
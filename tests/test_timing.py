@@ -0,0 +1,141 @@
+import json
+import logging
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+from twisted.internet import task
+
+from tfmkt import timing as timing_module
+from tfmkt.timing import CallbackTimingMiddleware, Reservoir
+
+
+class GamesSpider(Spider):
+    name = 'games'
+
+    def parse_game(self, response):
+        yield {'type': 'game'}
+        yield Request('https://www.transfermarkt.co.uk/next', callback=self.parse_game)
+        yield {'type': 'game'}
+
+    def parse_broken(self, response):
+        raise ValueError("broken")
+
+
+def test_reservoir_percentiles():
+    reservoir = Reservoir(1000)
+    assert reservoir.percentiles() == {0.5: None, 0.95: None, 0.99: None}
+    for value in range(100, 0, -1):
+        reservoir.add(value)
+    assert reservoir.percentiles() == {0.5: 50, 0.95: 95, 0.99: 99}
+
+
+def test_reservoir_size_is_bounded():
+    reservoir = Reservoir(10)
+    for value in range(1000):
+        reservoir.add(value)
+    assert reservoir.count == 1000
+    assert len(reservoir.values) == 10
+    assert len(set(reservoir.values)) == 10
+
+
+def timing(tmp_path, interval=0):
+    crawler = get_crawler(GamesSpider, {
+        'CALLBACK_TIMING_ENABLED': True,
+        'CALLBACK_TIMING_INTERVAL': interval,
+        'CALLBACK_TIMING_PROMETHEUS_FILE': str(tmp_path / 'textfile' / 'tfmkt.prom'),
+        'CALLBACK_TIMING_RESERVOIR_SIZE': 1024,
+    })
+    crawler.spider = spider = GamesSpider()
+    crawler.stats.open_spider(spider)
+    mw = CallbackTimingMiddleware.from_crawler(crawler)
+    mw.spider_opened(spider)
+    return mw, spider
+
+
+def response_for(callback, latency=0.25):
+    request = Request('https://www.transfermarkt.co.uk/game', callback=callback, meta={'download_latency': latency})
+    return HtmlResponse(request.url, body=b'<html></html>', request=request)
+
+
+def test_callbacks_are_timed_and_their_output_counted(tmp_path):
+    mw, spider = timing(tmp_path)
+    for _ in range(2):
+        response = response_for(spider.parse_game)
+        mw.process_spider_input(response, spider)
+        result = response.request.callback(response)
+        assert len(list(mw.process_spider_output(response, result, spider))) == 3
+
+    response = response_for(spider.parse_broken)
+    mw.process_spider_input(response, spider)
+    with pytest.raises(ValueError):
+        response.request.callback(response)
+    mw.process_spider_exception(response, ValueError(), spider)
+
+    parse_game = mw.callbacks['parse_game']
+    assert (parse_game.calls, parse_game.items, parse_game.requests, parse_game.errors) == (2, 4, 2, 0)
+    assert parse_game.response_bytes == 2 * len(b'<html></html>')
+    assert parse_game.download_time == 0.5
+    assert parse_game.wall_time > 0
+    assert (mw.callbacks['parse_broken'].calls, mw.callbacks['parse_broken'].errors) == (1, 1)
+
+
+def test_reports(tmp_path, caplog):
+    mw, spider = timing(tmp_path)
+    for i in range(1, 101):
+        mw.record('parse_game', response_for(spider.parse_game, latency=i / 10), i / 100, i / 1000, 2, 1, i == 100)
+
+    with caplog.at_level(logging.INFO, logger='tfmkt.timing'):
+        mw.spider_closed(spider, 'finished')
+    [message] = [record.getMessage() for record in caplog.records if record.getMessage().startswith('Callback timing: ')]
+    report = json.loads(message[len('Callback timing: '):])
+    assert report['spider'] == 'games'
+    metrics = report['callbacks']['parse_game']
+    assert {key: metrics[key] for key in ('calls', 'errors', 'items', 'requests')} == {
+        'calls': 100, 'errors': 1, 'items': 200, 'requests': 100
+    }
+    assert metrics['wall_seconds'] == {'sum': 50.5, 'p50': 0.5, 'p95': 0.95, 'p99': 0.99}
+    assert metrics['download_seconds']['p95'] == 9.5
+    stats = mw.crawler.stats
+    assert stats.get_value('callback_timing/parse_game/calls') == 100
+    assert stats.get_value('callback_timing/parse_game/cpu_p99') == 0.099
+
+    lines = (tmp_path / 'textfile' / 'tfmkt.prom').read_text().splitlines()
+    labels = '{spider="games",callback="parse_game"'
+    assert '# TYPE tfmkt_callback_calls_total counter' in lines
+    assert f'tfmkt_callback_calls_total{labels}}} 100' in lines
+    assert f'tfmkt_callback_errors_total{labels}}} 1' in lines
+    assert '# TYPE tfmkt_callback_wall_seconds summary' in lines
+    assert f'tfmkt_callback_wall_seconds{labels},quantile="0.5"}} 0.5' in lines
+    assert f'tfmkt_callback_wall_seconds{labels},quantile="0.99"}} 0.99' in lines
+    assert f'tfmkt_callback_wall_seconds_sum{labels}}} 50.5' in lines
+    assert f'tfmkt_callback_wall_seconds_count{labels}}} 100' in lines
+    # every sample line is a metric name, labels and a number
+    for line in lines:
+        if not line.startswith('#'):
+            float(line.rsplit(' ', 1)[1])
+    assert not [path.name for path in (tmp_path / 'textfile').iterdir() if path.name != 'tfmkt.prom']
+
+
+def test_reports_are_logged_periodically(tmp_path, caplog, monkeypatch):
+    clock = task.Clock()
+
+    class LoopingCall(task.LoopingCall):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.clock = clock
+
+    monkeypatch.setattr(timing_module.task, 'LoopingCall', LoopingCall)
+    mw, spider = timing(tmp_path, interval=60)
+    with caplog.at_level(logging.INFO, logger='tfmkt.timing'):
+        clock.advance(59)
+        assert not caplog.records
+        clock.advance(1)
+        mw.record('parse_game', response_for(spider.parse_game), 0.1, 0.1, 1, 0, False)
+        clock.advance(60)
+        mw.spider_closed(spider, 'finished')
+        clock.advance(60)
+    reports = [json.loads(record.getMessage()[len('Callback timing: '):]) for record in caplog.records]
+    assert [report['callbacks'].get('parse_game', {}).get('calls') for report in reports] == [None, 1, 1]
+    assert not mw.task.running
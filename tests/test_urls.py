@@ -0,0 +1,66 @@
+import pytest
+from scrapy import Request
+
+from tfmkt.urls import CanonicalRequestFingerprinter, canonical_url, entity_id, entity_key, replace_param
+
+BASE = 'https://www.transfermarkt.co.uk'
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('/fc-liverpool/startseite/verein/31/', '/-/startseite/verein/31'),
+    ('/startseite/verein/31', '/-/startseite/verein/31'),
+    ('/fc-liverpool/kader/verein/31/plus/1', '/-/kader/verein/31/plus/1'),
+    ('/premier-league/startseite/wettbewerb/GB1/plus/', '/-/startseite/wettbewerb/GB1/plus'),
+    ('/premier-league/startseite/wettbewerb/GB1/saison_id/2020/plus/', '/-/startseite/wettbewerb/GB1/saison_id/2020/plus'),
+    ('/a/profil/spieler/10/saison_id/2020#top', '/-/profil/spieler/10/saison_id/2020'),
+    ('/wettbewerbe/europa/', '/wettbewerbe/europa'),
+    ('/schnellsuche/ergebnis/schnellsuche?query=b&Spieler_page=2', '/schnellsuche/ergebnis/schnellsuche?Spieler_page=2&query=b'),
+])
+def test_canonical_url(url, expected):
+    assert canonical_url(url, BASE) == BASE + expected
+
+
+def test_canonical_url_keeps_page_markers():
+    plain = canonical_url('/premier-league/startseite/wettbewerb/GB1', BASE)
+    assert canonical_url('/premier-league/startseite/wettbewerb/GB1/plus/', BASE) != plain
+    assert canonical_url('/other-slug/startseite/wettbewerb/GB1/', BASE) == plain
+
+
+@pytest.mark.parametrize('url', [
+    '/premier-league/startseite/wettbewerb/GB1/plus/saison_id/2020',
+    '/fc-liverpool/kader/verein/31/saison_id/2020/plus/1',
+])
+def test_canonical_url_is_idempotent(url):
+    canonical = canonical_url(url, BASE)
+    assert canonical_url(canonical) == canonical
+
+
+def test_canonical_url_of_other_urls():
+    assert canonical_url('data:,x') == 'data:,x'
+    assert canonical_url('HTTPS://WWW.Transfermarkt.co.uk/') == 'https://www.transfermarkt.co.uk/'
+
+
+def test_fingerprints_of_variants():
+    fingerprinter = CanonicalRequestFingerprinter()
+    fingerprint = fingerprinter.fingerprint(Request(BASE + '/fc-liverpool/startseite/verein/31/'))
+    assert fingerprinter.fingerprint(Request(BASE + '/startseite/verein/31')) == fingerprint
+    assert fingerprinter.fingerprint(Request(BASE + '/fc-liverpool/kader/verein/31')) != fingerprint
+
+
+@pytest.mark.parametrize('href, expected', [
+    ('/fc-liverpool/startseite/verein/31/saison_id/2020', 'club:31'),
+    ('https://www.transfermarkt.co.uk/premier-league/startseite/wettbewerb/GB1', 'competition:GB1'),
+    ('/a/profil/spieler/10/', 'player:10'),
+    ('/wettbewerbe/europa', 'confederation:europa'),
+    ('/navigation/impressum', None),
+])
+def test_entity_key(href, expected):
+    assert entity_key(href) == expected
+
+
+def test_entity_id_and_replace_param():
+    assert entity_id('club', '/fc-liverpool/startseite/verein/31') == '31'
+    assert entity_id('player', '/fc-liverpool/startseite/verein/31') is None
+    assert replace_param('/a/startseite/verein/31', 'saison_id', 2020) == '/a/startseite/verein/31/saison_id/2020'
+    assert replace_param('/a/startseite/verein/31/saison_id/2020', 'saison_id', None) == '/a/startseite/verein/31'
+    assert replace_param('/navigation/impressum', 'saison_id', 2020) == '/navigation/impressum'
@@ -0,0 +1,249 @@
+"""Resume interrupted crawls without reprocessing finished parents.
+
+Scrapy persists the scheduler queue and the seen requests in `JOBDIR`, so a
+crawl stopped gracefully picks up where it left off. That is not enough for
+runs that die: the queue on disk is only consistent after a clean shutdown, and
+restarting from scratch re-processes and re-exports every parent.
+
+`CheckpointMiddleware` keeps track, per entrypoint (a line of the parents
+file), of the requests descending from it that still have to be processed.
+Once the last of them went through its callback the entrypoint is appended to
+`JOBDIR/checkpoint/completed`, and its start request is skipped by any later run
+using the same `JOBDIR`. Every item exported is recorded in
+`JOBDIR/checkpoint/emitted` as well, and dropped if it is scraped again. Items
+exported to JSON lines feeds are only recorded once the background writer
+wrote their line to the feed (see `tfmkt.exporters.FeedWriters`), so that the
+items still queued when a run is killed are exported again by the next one.
+
+Items are told apart by a digest of their contents as the spider yields them,
+computed once when they go through the middleware and remembered, by item
+identity, until the item is exported: the item pipelines normalize items and
+rewrite their parent, so the exported item can not be digested again. The
+digests of the emitted items are loaded, for lookups, into a memory-mapped
+hash set (see `tfmkt.dupefilters.DigestSet`) that the operating system pages
+out as needed, so that resuming a crawl of millions of items does not keep
+them all in memory.
+
+Both files are appended to as the crawl goes, so they survive a crash. When a
+run did not shut down cleanly, the Scrapy queue and seen requests are discarded
+and the entrypoints that were not completed are crawled again from the start.
+
+Requests that failed to download are not considered processed, so the
+entrypoints they descend from are crawled again on the next run: the ids of
+the failed requests are left pending, and the start request of an entrypoint
+still pending is issued again, bypassing the dupefilter of `JOBDIR` that saw
+it in the previous run.
+"""
+from pathlib import Path
+import hashlib
+import json
+import logging
+import shutil
+import uuid
+
+from scrapy import Request, signals
+from scrapy.exceptions import NotConfigured
+
+from tfmkt.dupefilters import DigestSet
+from tfmkt.exporters import FeedWriters
+
+logger = logging.getLogger(__name__)
+
+ENTRYPOINT_KEY = 'checkpoint_entrypoint'
+REQUEST_ID_KEY = 'checkpoint_request'
+
+# bytes of the item digests kept in the hash set of emitted items
+DIGEST_SIZE = 16
+
+
+def item_digest(item) -> str:
+    """A digest of the contents of an item, used to tell items already emitted apart.
+
+    :param item: A scraped item.
+    :type item: dict
+    :return: The hex digest of the item.
+    :rtype: str
+    """
+    serialized = json.dumps(dict(item), sort_keys=True, default=str)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+def read_keys(path: Path) -> set:
+    if not path.exists():
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def read_digests(path: Path, digests_path: Path) -> DigestSet:
+    """Load the hex digests listed in a file into a memory-mapped `DigestSet`, rebuilt on every run."""
+    digests = DigestSet(digest_size=DIGEST_SIZE, capacity=1 << 16, path=str(digests_path), keep=False)
+    if path.exists():
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    digests.add(bytes.fromhex(line))
+    return digests
+
+
+class CheckpointMiddleware:
+    """Spider middleware that checkpoints completed entrypoints and emitted items in `JOBDIR`.
+
+    Enabled when `JOBDIR` is set, unless `CHECKPOINT_ENABLED` is false.
+    """
+
+    def __init__(self, crawler, jobdir):
+        self.crawler = crawler
+        self.jobdir = Path(jobdir)
+        self.dir = self.jobdir / 'checkpoint'
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+        self.running_path = self.dir / 'running'
+        self.pending_path = self.dir / 'pending.json'
+        self.completed_path = self.dir / 'completed'
+        self.emitted_path = self.dir / 'emitted'
+
+        if self.running_path.exists():
+            self.discard_queue()
+
+        self.completed = read_keys(self.completed_path)
+        self.emitted = read_digests(self.emitted_path, self.dir / 'emitted.digests')
+        # digests of the items on their way through the item pipelines, by item identity
+        self.digests = {}
+        self.pending = {}
+        if self.pending_path.exists():
+            with open(self.pending_path) as f:
+                self.pending = {key: set(ids) for key, ids in json.load(f).items()}
+        # entrypoints left pending by the previous run, crawled again
+        self.resumed = set(self.pending)
+
+        self.completed_file = None
+        self.emitted_file = None
+        self.feed_writers = FeedWriters.of(crawler)
+
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(self.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(self.item_discarded, signal=signals.item_dropped)
+        crawler.signals.connect(self.item_discarded, signal=signals.item_error)
+        crawler.signals.connect(self.request_dropped, signal=signals.request_dropped)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        jobdir = settings.get('JOBDIR')
+        if not jobdir or not settings.getbool('CHECKPOINT_ENABLED'):
+            raise NotConfigured
+        return cls(crawler, jobdir)
+
+    def discard_queue(self):
+        """Drop the state Scrapy left in `JOBDIR` after a run that did not shut down cleanly.
+
+        This must happen before the scheduler is opened, and is done when the
+        middleware is created.
+        """
+        logger.warning(
+            "The previous run using %s did not shut down cleanly, "
+            "entrypoints that were not completed will be crawled again", self.jobdir
+        )
+        shutil.rmtree(self.jobdir / 'requests.queue', ignore_errors=True)
+        for name in ('requests.seen', 'requests.seen.digests', 'requests.seen.digests.json', 'requests.seen.bloom', 'spider.state'):
+            (self.jobdir / name).unlink(missing_ok=True)
+        self.pending_path.unlink(missing_ok=True)
+
+    def spider_opened(self, spider):
+        self.running_path.touch()
+        self.completed_file = open(self.completed_path, 'a')
+        self.emitted_file = open(self.emitted_path, 'a')
+        if self.completed or self.emitted:
+            logger.info(
+                "Resuming from checkpoint: %d entrypoints completed, %d items emitted",
+                len(self.completed), len(self.emitted), extra={'spider': spider}
+            )
+
+    def spider_closed(self, spider, reason):
+        with open(self.pending_path, 'w') as f:
+            json.dump({key: sorted(ids) for key, ids in self.pending.items()}, f)
+        self.completed_file.close()
+        self.emitted_file.close()
+        self.emitted.close()
+        self.running_path.unlink(missing_ok=True)
+
+    def track(self, request, entrypoint):
+        """Register a request as pending for an entrypoint."""
+        request.meta[ENTRYPOINT_KEY] = entrypoint
+        request.meta[REQUEST_ID_KEY] = uuid.uuid4().hex
+        self.pending.setdefault(entrypoint, set()).add(request.meta[REQUEST_ID_KEY])
+
+    def done(self, request, spider):
+        """Mark a request as processed, and its entrypoint as completed if it was the last one pending."""
+        entrypoint = request.meta.get(ENTRYPOINT_KEY)
+        ids = self.pending.get(entrypoint)
+        if ids is None:
+            return
+        ids.discard(request.meta.get(REQUEST_ID_KEY))
+        if not ids:
+            del self.pending[entrypoint]
+            self.completed.add(entrypoint)
+            self.completed_file.write(entrypoint + '\n')
+            self.completed_file.flush()
+            self.crawler.stats.inc_value('checkpoint/completed_entrypoints', spider=spider)
+
+    def process_start_requests(self, start_requests, spider):
+        fingerprinter = self.crawler.request_fingerprinter
+        for request in start_requests:
+            entrypoint = fingerprinter.fingerprint(request).hex()
+            if entrypoint in self.completed:
+                self.crawler.stats.inc_value('checkpoint/skipped_entrypoints', spider=spider)
+                continue
+            if entrypoint in self.resumed:
+                # the ids of the failed requests of the previous run would never be done
+                self.resumed.discard(entrypoint)
+                self.pending[entrypoint] = set()
+                request = request.replace(dont_filter=True)
+                self.crawler.stats.inc_value('checkpoint/retried_entrypoints', spider=spider)
+            self.track(request, entrypoint)
+            yield request
+
+    def process_spider_output(self, response, result, spider):
+        entrypoint = response.meta.get(ENTRYPOINT_KEY)
+        try:
+            for element in result:
+                if isinstance(element, Request):
+                    if entrypoint is not None:
+                        self.track(element, entrypoint)
+                else:
+                    digest = item_digest(element)
+                    if bytes.fromhex(digest) in self.emitted:
+                        self.crawler.stats.inc_value('checkpoint/duplicate_items', spider=spider)
+                        continue
+                    self.digests[id(element)] = digest
+                yield element
+        finally:
+            self.done(response.request, spider)
+
+    def process_spider_exception(self, response, exception, spider):
+        self.done(response.request, spider)
+
+    def request_dropped(self, request, spider):
+        self.done(request, spider)
+
+    def item_scraped(self, item, response, spider):
+        digest = self.digests.pop(id(item), None)
+        if digest is None:
+            # a pipeline replaced the item with a new object, it is not known here
+            self.crawler.stats.inc_value('checkpoint/untracked_items', spider=spider)
+            return
+        self.feed_writers.when_written(lambda: self.record(digest))
+
+    def record(self, digest):
+        """Record an item as emitted, once it was written to the feeds."""
+        if self.emitted_file.closed:
+            return
+        if self.emitted.add(bytes.fromhex(digest)):
+            self.emitted_file.write(digest + '\n')
+            self.emitted_file.flush()
+
+    def item_discarded(self, item, response, spider, **kwargs):
+        self.digests.pop(id(item), None)
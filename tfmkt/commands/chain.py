@@ -0,0 +1,84 @@
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.utils.conf import arglist_to_dict
+
+from tfmkt.orchestrator import Stage, chain_stages
+
+
+class Command(ScrapyCommand):
+    """Run a chain of spiders in one process, feeding the items of each spider to the next one.
+
+    Usage:
+      scrapy chain competitions clubs players -a parents=samples/confederations.json -o players=players.json
+      scrapy chain clubs players appearances -a parents=competitions.json -a appearances.season=2024 \\
+          -o clubs=clubs.json -o appearances=appearances.json
+
+    Spider arguments (-a) apply to all stages, unless prefixed by a stage name.
+    The `parents` argument only applies to the first stage. Items of a stage are
+    only exported when an output (-o STAGE=URI) is given for it.
+    """
+
+    requires_project = True
+
+    def syntax(self):
+        return "[options] <spider> <spider> [<spider> ...]"
+
+    def short_desc(self):
+        return "Run a chain of spiders in one process, each one fed by the previous one"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "-a", dest="spargs", action="append", default=[], metavar="[STAGE.]NAME=VALUE",
+            help="set spider argument for all stages, or for STAGE only (may be repeated)"
+        )
+        parser.add_argument(
+            "-o", "--output", dest="outputs", action="append", default=[], metavar="STAGE=URI",
+            help="export the items of STAGE as JSON lines to URI (may be repeated)"
+        )
+        parser.add_argument(
+            "--queue-size", type=int, default=1000,
+            help="maximum number of items buffered between two stages (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--max-outstanding", type=int, default=100,
+            help="maximum number of requests in flight in a stage before it is fed more parents (default: %(default)s)"
+        )
+
+    def process_options(self, args, opts):
+        super().process_options(args, opts)
+        try:
+            opts.spargs = arglist_to_dict(opts.spargs)
+            opts.outputs = arglist_to_dict(opts.outputs)
+        except ValueError:
+            raise UsageError("Invalid -a or -o value, use -a [STAGE.]NAME=VALUE and -o STAGE=URI", print_help=False)
+
+    def run(self, args, opts):
+        if len(args) < 2:
+            raise UsageError("at least two spiders are required to build a chain")
+
+        unknown_outputs = set(opts.outputs) - set(args)
+        if unknown_outputs:
+            raise UsageError(f"output given for unknown stage(s): {', '.join(sorted(unknown_outputs))}")
+
+        stages = []
+        for index, name in enumerate(args):
+            kwargs = {}
+            for key, value in opts.spargs.items():
+                stage_name, _, arg_name = key.rpartition('.')
+                if stage_name and stage_name != name:
+                    continue
+                if arg_name == 'parents' and index > 0:
+                    continue
+                kwargs[arg_name] = value
+            stages.append(Stage(name, kwargs, opts.outputs.get(name)))
+
+        self.feeders = chain_stages(
+            self.crawler_process,
+            stages,
+            queue_size=opts.queue_size,
+            max_outstanding=opts.max_outstanding
+        )
+        self.crawler_process.start()
+        if self.crawler_process.bootstrap_failed:
+            self.exitcode = 1
@@ -0,0 +1,77 @@
+import json
+import sys
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from tfmkt.compaction import Compactor
+
+
+class Command(ScrapyCommand):
+    """Merge JSON lines outputs into one file with the latest version of every entity.
+
+    Usage:
+      scrapy compact games_2023.json.gz games_shard_*.json games_refresh.json -o games.json.gz
+      scrapy compact appearances_*.json --key appearance=href,date,competition_code -o appearances.json
+
+    Files are given oldest first: for every entity, the record of the last file
+    it appears in is kept. Memory is bounded with --memory, beyond which records
+    are sorted in temporary files and merged.
+    """
+
+    requires_project = False
+
+    def syntax(self):
+        return "<file> [<file> ...] [options]"
+
+    def short_desc(self):
+        return "De-duplicate JSON lines outputs by entity key, keeping the newest records"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "-o", "--output", default=None, metavar="FILE",
+            help="file the records are written to, gzip compressed if it ends with .gz (default: stdout)"
+        )
+        parser.add_argument(
+            "--key", dest="keys", action="append", default=[], metavar="TYPE=FIELD,...",
+            help="fields keying the items of a type without an entity key, e.g. appearance=href,date (may be repeated)"
+        )
+        parser.add_argument(
+            "--memory", type=float, default=256, metavar="MB",
+            help="memory used to sort records before spilling them to disk (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--temp-dir", default=None, metavar="DIR",
+            help="directory of the temporary files (default: the system temporary directory)"
+        )
+        parser.add_argument(
+            "--stats", default=None, metavar="FILE",
+            help="write the counts of records read, written, superseded, changed and deleted, by type, to FILE"
+        )
+
+    def run(self, args, opts):
+        if not args:
+            raise UsageError()
+
+        key_fields = {}
+        for key in opts.keys:
+            entity_type, separator, fields = key.partition('=')
+            if not separator or not fields:
+                raise UsageError(f"Invalid --key: {key}, expected TYPE=FIELD,...")
+            key_fields[entity_type] = fields.split(',')
+
+        compactor = Compactor(key_fields, memory_limit=int(opts.memory * 2**20), temp_dir=opts.temp_dir)
+        for file_name in args:
+            compactor.add(file_name)
+        stats = compactor.write(opts.output, output=sys.stdout)
+
+        counts = stats.as_dict()
+        if opts.stats:
+            with open(opts.stats, 'w') as f:
+                json.dump(counts, f, indent=2)
+        print(
+            f"{counts['read']} records read, {counts['written']} written, {counts['superseded']} superseded, "
+            f"{counts['changed']} entities changed, {counts['deleted']} deleted, {compactor.spilled} runs spilled to disk",
+            file=sys.stderr
+        )
@@ -0,0 +1,107 @@
+import datetime
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from tfmkt.planner import DEFAULT_TRANSFER_WINDOWS, METADATA_SUFFIX, PLANNED_SPIDERS, Planner, read_scraped_at, utc_timestamp
+
+
+def output_argument(value: str):
+    """An output given as FILE or FILE@ISO_TIME, with the time it was scraped at."""
+    file_name, _, scraped_at = value.rpartition('@')
+    if file_name:
+        try:
+            return file_name, utc_timestamp(scraped_at)
+        except ValueError:
+            pass
+    return value, None
+
+
+class Command(ScrapyCommand):
+    """Write minimal parents files for a refresh run, from the outputs of previous runs.
+
+    Usage:
+      scrapy plan --clubs clubs.json --players players.json --appearances appearances.json \\
+          --games-urls game_urls.json --output-dir plan
+      scrapy crawl players -a parents=plan/clubs.json -O players.jsonl
+      scrapy crawl players -a parents=plan/clubs.json > players.json
+      scrapy plan --players players.jsonl --players players.json@2024-03-01T02:00:00 --output-dir plan
+
+    The state file keeps when every parent was last scraped, along with the
+    parents themselves, so that later runs only need to be given the outputs
+    produced since. The scrape time of an output is read from the
+    `<output>.meta.json` file written next to it by the crawl, or given after
+    an @ for outputs written to stdout.
+    """
+
+    requires_project = False
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Plan a refresh run from the outputs of previous runs"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        for spider in ('clubs', 'players', 'appearances', 'games_urls'):
+            parser.add_argument(
+                f"--{spider.replace('_', '-')}", dest=spider, action="append", default=[], metavar="FILE[@ISO_TIME]",
+                type=output_argument, help=f"output of a previous {spider} run, and the time it ran at (may be repeated)"
+            )
+        parser.add_argument(
+            "--state", default="plan_state.json",
+            help="file keeping the last scraped time of every parent (default: %(default)s)"
+        )
+        parser.add_argument(
+            "-o", "--output-dir", default="plan",
+            help="directory the parents files are written to (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--max-age", type=float, default=30, metavar="DAYS",
+            help="refresh any parent not scraped for DAYS (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--window-max-age", type=float, default=7, metavar="DAYS",
+            help="refresh competitions and clubs not scraped for DAYS during transfer windows (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--transfer-windows", default=DEFAULT_TRANSFER_WINDOWS, metavar="MM-DD:MM-DD,...",
+            help="transfer windows, end day excluded (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--now", type=datetime.datetime.fromisoformat, default=None, metavar="ISO_TIME",
+            help="plan as of this time instead of now"
+        )
+
+    def run(self, args, opts):
+        if args:
+            raise UsageError()
+
+        now = opts.now
+        if now is not None and now.tzinfo is None:
+            now = now.replace(tzinfo=datetime.timezone.utc)
+        planner = Planner.load(opts.state, now=now)
+        for spider in ('clubs', 'players', 'appearances', 'games_urls'):
+            for file_name, scraped_at in getattr(opts, spider):
+                if scraped_at is None and read_scraped_at(file_name) is None:
+                    raise UsageError(
+                        f"No scrape time recorded for {file_name} (in {file_name}{METADATA_SUFFIX}), "
+                        f"give it as {file_name}@ISO_TIME"
+                    )
+                planner.ingest(spider, file_name, scraped_at)
+
+        plans = planner.plan(
+            max_age=opts.max_age,
+            window_max_age=opts.window_max_age,
+            transfer_windows=opts.transfer_windows
+        )
+        paths = planner.write(plans, opts.output_dir)
+        planner.save(opts.state)
+
+        for spider, parent_type, _ in PLANNED_SPIDERS:
+            reasons = ', '.join(f"{reason}: {count}" for reason, count in sorted(planner.reasons[spider].items()))
+            print(
+                f"{paths[spider]}: {len(plans[spider])} of {len(planner.catalog[parent_type])} "
+                f"{parent_type} parents for '{spider}'" + (f" ({reasons})" if reasons else "")
+            )
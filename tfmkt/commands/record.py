@@ -0,0 +1,134 @@
+import random
+import re
+import sys
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+from scrapy.utils.project import data_path
+
+from tfmkt.fixtures import (
+    BODY_SUFFIX, METADATA_SUFFIX, PAGE_TYPES, cached_pages, fixture_directory, page_type, response_encoding,
+    write_fixture
+)
+from tfmkt.urls import site_path
+
+
+class Command(ScrapyCommand):
+    """Record a sample of the pages of the HTTP cache as fixtures for offline tests and benchmarks.
+
+    Usage:
+      scrapy record -o benchmarks/fixtures
+      scrapy record --type players.parse_details --per-variant 20 -o benchmarks/fixtures
+      scrapy record --pattern '/pokalwettbewerb/' --replace -o benchmarks/fixtures
+
+    Cached pages are sorted by page type (see tfmkt.fixtures.PAGE_TYPES) and
+    variant (cup, league or youth competitions, active, retired or deceased
+    players), and a uniform sample of --per-variant pages of every variant is
+    written, compressed and de-duplicated by content. Pages are recorded during
+    a crawl instead, with their actual callback arguments, with
+    -s FIXTURES_RECORD_DIR=benchmarks/fixtures.
+    """
+
+    requires_project = False
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Sample pages of the HTTP cache into compressed fixtures by page type"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "-o", "--output", default="benchmarks/fixtures", metavar="DIR",
+            help="fixtures directory (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--cache-dir", default=None, metavar="DIR",
+            help="HTTP cache directory (default: the HTTPCACHE_DIR of the project)"
+        )
+        parser.add_argument(
+            "--type", dest="page_types", action="append", default=[], metavar="SPIDER.CALLBACK",
+            help=f"only pages of this type (may be repeated): {', '.join(t.name for t in PAGE_TYPES)}"
+        )
+        parser.add_argument(
+            "--pattern", default=None, metavar="REGEX",
+            help="only pages whose URL matches this regular expression"
+        )
+        parser.add_argument(
+            "--per-variant", type=int, default=5, metavar="N",
+            help="pages sampled per page type and variant (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="seed of the sampling, the same seed picks the same pages of the same cache (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--replace", action="store_true",
+            help="remove the existing fixtures of the sampled page types first"
+        )
+
+    def run(self, args, opts):
+        if args:
+            raise UsageError()
+        page_types = PAGE_TYPES
+        if opts.page_types:
+            names = {page_type.name: page_type for page_type in PAGE_TYPES}
+            unknown = [name for name in opts.page_types if name not in names]
+            if unknown:
+                raise UsageError(f"Unknown page types: {', '.join(unknown)}")
+            page_types = [names[name] for name in opts.page_types]
+        try:
+            pattern = re.compile(opts.pattern) if opts.pattern else None
+        except re.error as e:
+            raise UsageError(f"Invalid --pattern: {e}")
+        if opts.per_variant < 1:
+            raise UsageError("--per-variant must be at least 1")
+        cache_dir = opts.cache_dir or data_path(self.settings['HTTPCACHE_DIR'])
+
+        # reservoir sample of every (page type, variant)
+        rng = random.Random(opts.seed)
+        seen = {}
+        samples = {}
+        for page in cached_pages(cache_dir):
+            if page.status != 200 or (pattern and not pattern.search(page.url)):
+                continue
+            matched_type, match = page_type(page.url, page_types)
+            if matched_type is None:
+                continue
+            variant = matched_type.variant(site_path(page.url), page.read_body()) if matched_type.variant else None
+            bucket = (matched_type, variant)
+            seen[bucket] = seen.get(bucket, 0) + 1
+            sample = samples.setdefault(bucket, [])
+            if len(sample) < opts.per_variant:
+                sample.append((page, match))
+            else:
+                position = rng.randrange(seen[bucket])
+                if position < opts.per_variant:
+                    sample[position] = (page, match)
+
+        if opts.replace:
+            for recorded_type in page_types:
+                directory = fixture_directory(opts.output, recorded_type.spider, recorded_type.callback)
+                for suffix in (METADATA_SUFFIX, BODY_SUFFIX):
+                    for path in directory.glob(f'*{suffix}'):
+                        path.unlink()
+
+        for (recorded_type, variant), sample in sorted(samples.items(), key=lambda bucket: (bucket[0][0].name, bucket[0][1] or '')):
+            written = 0
+            for page, match in sorted(sample, key=lambda element: element[0].url):
+                body = page.read_body()
+                written += write_fixture(
+                    opts.output, page.url, body, recorded_type.spider, recorded_type.callback,
+                    cb_kwargs=recorded_type.cb_kwargs(match), status=page.status,
+                    encoding=response_encoding(page.url, page.headers, body), source='httpcache', variant=variant,
+                ) is not None
+            print(
+                f"{recorded_type.name:<32} {variant or '':<10} {seen[(recorded_type, variant)]:>8} cached "
+                f"{len(sample):>4} sampled {written:>4} new",
+                file=sys.stderr
+            )
+        missing = [recorded_type.name for recorded_type in page_types
+                   if not any(bucket[0] is recorded_type for bucket in samples)]
+        if missing:
+            print(f"No cached pages of: {', '.join(missing)}", file=sys.stderr)
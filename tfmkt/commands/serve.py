@@ -0,0 +1,115 @@
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+
+class Command(ScrapyCommand):
+    """Run a local stand-in for transfermarkt.co.uk that simulates its rate limiting.
+
+    Usage:
+      scrapy serve --rps 2 --retry-after 5 -L INFO
+      scrapy crawl confederations -a base_url=http://localhost:8000 -s THROTTLE_ENABLED=True -s THROTTLE_TARGET_RPS=4 -L INFO
+
+    Replay recorded pages, with network conditions close to the real site:
+      scrapy serve --fixtures benchmarks/fixtures --rps 0 --latency 0.2 --latency-jitter 0.3 \\
+          --reject-rate 0.01 --error-rate 0.005 --bandwidth 2048 -L INFO
+    """
+
+    requires_project = False
+
+    def syntax(self):
+        return "[options]"
+
+    def short_desc(self):
+        return "Run a local stand-in server that simulates the site rate limiting"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument("--port", type=int, default=8000, help="port to listen on (default: %(default)s)")
+        parser.add_argument("--interface", default='127.0.0.1', help="interface to listen on (default: %(default)s)")
+        parser.add_argument(
+            "--pages", metavar="DIR",
+            help="serve the files under DIR by path instead of a stub page"
+        )
+        parser.add_argument(
+            "--fixtures", metavar="DIR",
+            help="replay the fixtures under DIR (see scrapy record) under their original paths"
+        )
+        parser.add_argument(
+            "--cache", metavar="DIR",
+            help="replay the pages of the filesystem HTTP cache under DIR under their original paths"
+        )
+        parser.add_argument(
+            "--rps", type=float, default=2.0,
+            help="requests per second accepted before rejecting them, 0 for no limit (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--status", type=int, default=429, choices=[429, 503],
+            help="status code of rejected requests (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--retry-after", type=float, default=None, metavar="SECONDS",
+            help="send a Retry-After header with rejected requests"
+        )
+        parser.add_argument(
+            "--penalty", type=float, default=0.0, metavar="SECONDS",
+            help="keep rejecting all requests for SECONDS once the limit is hit (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--latency", type=float, default=0.0, metavar="SECONDS",
+            help="delay every response by SECONDS (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--latency-jitter", type=float, default=0.0, metavar="SECONDS",
+            help="add a random delay of up to SECONDS to every response (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--reject-rate", type=float, default=0.0, metavar="FRACTION",
+            help="reject this fraction of the requests below the limit as well, at random (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--error-rate", type=float, default=0.0, metavar="FRACTION",
+            help="answer this fraction of the requests with --error-status, at random (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--error-status", type=int, default=500,
+            help="status code of the injected errors (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--bandwidth", type=float, default=0, metavar="KB/S",
+            help="send at most KB/S kilobytes per second over all responses, 0 for no cap (default: %(default)s)"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=None,
+            help="seed of the random latency, rejections and errors"
+        )
+
+    def run(self, args, opts):
+        if args:
+            raise UsageError()
+        if opts.pages and (opts.fixtures or opts.cache):
+            raise UsageError("--pages cannot be combined with --fixtures or --cache")
+        for name in ('reject_rate', 'error_rate'):
+            if not 0 <= getattr(opts, name) <= 1:
+                raise UsageError(f"--{name.replace('_', '-')} must be between 0 and 1")
+
+        # the reactor is only imported once scrapy had a chance to install the configured one
+        from tfmkt.localserver import serve
+
+        serve(
+            port=opts.port,
+            interface=opts.interface,
+            pages_dir=opts.pages,
+            fixtures_dir=opts.fixtures,
+            cache_dir=opts.cache,
+            rps=opts.rps,
+            status=opts.status,
+            retry_after=opts.retry_after,
+            penalty=opts.penalty,
+            latency=opts.latency,
+            latency_jitter=opts.latency_jitter,
+            reject_rate=opts.reject_rate,
+            error_rate=opts.error_rate,
+            error_status=opts.error_status,
+            bandwidth=opts.bandwidth * 1024,
+            seed=opts.seed
+        )
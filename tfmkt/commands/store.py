@@ -0,0 +1,79 @@
+import datetime
+import json
+import os
+import sys
+
+from scrapy.commands import ScrapyCommand
+from scrapy.exceptions import UsageError
+
+from tfmkt.store import EntityStore
+
+
+class Command(ScrapyCommand):
+    """Write entities of an entity store as JSON lines, such as the parents of the next crawl.
+
+    Usage:
+      scrapy crawl players -a parents=clubs.json -s ENTITY_STORE=entities.db > players.json
+      scrapy store entities.db --type player --older-than 7 -o players_to_refresh.json
+      scrapy crawl appearances -a parents=players_to_refresh.json
+
+    Entities are written as last scraped, ordered by key.
+    """
+
+    requires_project = False
+
+    def syntax(self):
+        return "<store> [options]"
+
+    def short_desc(self):
+        return "Query the entity store written by the ENTITY_STORE pipeline"
+
+    def add_options(self, parser):
+        super().add_options(parser)
+        parser.add_argument(
+            "--type", dest="entity_type", metavar="TYPE",
+            help="only entities of this type: competition, club, player or game"
+        )
+        parser.add_argument(
+            "--parent", metavar="HREF",
+            help="only entities with this parent href"
+        )
+        parser.add_argument(
+            "--older-than", type=float, default=None, metavar="DAYS",
+            help="only entities not scraped for DAYS"
+        )
+        parser.add_argument(
+            "--where", default=None, metavar="SQL",
+            help="additional SQL condition, e.g. \"json_extract(item, '$.country_name') = 'Spain'\""
+        )
+        parser.add_argument(
+            "-o", "--output", default=None, metavar="FILE",
+            help="file the entities are written to (default: stdout)"
+        )
+
+    def run(self, args, opts):
+        if len(args) != 1:
+            raise UsageError()
+        if not os.path.exists(args[0]):
+            raise UsageError(f"Entity store not found: {args[0]}")
+
+        scraped_before = None
+        if opts.older_than is not None:
+            scraped_before = (
+                datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=opts.older_than)
+            ).isoformat(timespec='seconds')
+
+        store = EntityStore(args[0])
+        output = open(opts.output, 'w') if opts.output else sys.stdout
+        try:
+            count = 0
+            for item in store.query(entity_type=opts.entity_type, parent=opts.parent,
+                                    scraped_before=scraped_before, where=opts.where):
+                output.write(json.dumps(item) + '\n')
+                count += 1
+        finally:
+            store.close()
+            if opts.output:
+                output.close()
+        if opts.output:
+            print(f"{opts.output}: {count} entities")
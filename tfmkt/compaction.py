@@ -0,0 +1,182 @@
+"""Merge JSON lines outputs into one file with the latest version of every entity.
+
+Sharded and repeated runs leave many overlapping outputs of the same spider.
+`Compactor` de-duplicates them by entity key (see
+`tfmkt.keys.ENTITY_KEY_FIELDS`), keeping the newest record of every
+entity: files are given oldest first, and within a file later lines are newer.
+Items without an entity key, such as appearances, are keyed by the fields given
+with `key_fields`, or else by their content, which only drops exact duplicates.
+The newest record of an entity being a tombstone (`"deleted": true`, see
+`ChangeDetectionPipeline`) drops the entity.
+
+Memory is bounded by an external merge sort: records are buffered up to
+`memory_limit` bytes, sorted by key and spilled to temporary run files, which
+are then merged. Output is ordered by type and key.
+"""
+from collections import Counter
+from pathlib import Path
+import gzip
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import tempfile
+import typing
+
+from tfmkt.keys import ENTITY_KEY_FIELDS
+
+# maximum number of run files merged at once
+MAX_FAN_IN = 128
+# estimated memory used by a buffered record besides its line
+RECORD_OVERHEAD = 200
+
+
+def open_text(file_name: str, mode: str = 'rt'):
+    """Open a plain or gzip compressed text file, by extension, as `BaseSpider` does."""
+    if file_name.endswith('.gz'):
+        return gzip.open(file_name, mode, encoding='utf-8')
+    return open(file_name, mode, encoding='utf-8')
+
+
+class CompactionStats:
+    """Counts of a compaction, overall and by item type."""
+
+    def __init__(self):
+        self.read = Counter()
+        self.written = Counter()
+        # records replaced by a newer version of their entity
+        self.superseded = Counter()
+        # entities whose newest version differs from the previous one
+        self.changed = Counter()
+        # entities dropped because their newest version is a tombstone
+        self.deleted = Counter()
+
+    def as_dict(self) -> dict:
+        counters = ('read', 'written', 'superseded', 'changed', 'deleted')
+        types = sorted(set().union(*(getattr(self, counter) for counter in counters)))
+        return {
+            **{counter: sum(getattr(self, counter).values()) for counter in counters},
+            'types': {
+                entity_type: {counter: getattr(self, counter)[entity_type] for counter in counters}
+                for entity_type in types
+            }
+        }
+
+
+class Compactor:
+    """External merge sort of JSON lines files by entity key.
+
+    :param key_fields: Fields keying items that have no entity key, by item type.
+    :type key_fields: typing.Dict[str, typing.List[str]]
+    :param memory_limit: Bytes of records buffered before a run is spilled to disk.
+    :type memory_limit: int
+    :param temp_dir: Directory of the temporary run files.
+    :type temp_dir: str
+    """
+
+    def __init__(self, key_fields: typing.Dict[str, typing.List[str]] = None,
+                 memory_limit: int = 256 * 2**20, temp_dir: str = None):
+        self.key_fields = key_fields or {}
+        self.memory_limit = memory_limit
+        self.temporary_directory = tempfile.TemporaryDirectory(prefix='tfmkt-compact-', dir=temp_dir)
+        self.buffer = []
+        self.buffered = 0
+        self.runs = []
+        # number of runs spilled to disk
+        self.spilled = 0
+        self.sequence = 0
+        self.stats = CompactionStats()
+
+    def key(self, item: dict) -> str:
+        """The sort key of a record: the JSON encoding of [type, key], so that keys never contain tabs."""
+        entity_type = item.get('type') or ''
+        key_field = ENTITY_KEY_FIELDS.get(entity_type)
+        if key_field is not None and item.get(key_field) is not None:
+            key = str(item[key_field])
+        elif entity_type in self.key_fields:
+            key = '|'.join(json.dumps(item.get(field), sort_keys=True) for field in self.key_fields[entity_type])
+        else:
+            canonical = json.dumps(item, sort_keys=True, separators=(',', ':'))
+            key = '#' + hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+        return json.dumps([entity_type, key])
+
+    def add(self, file_name: str):
+        """Read the records of a file, newer than those of the files added before."""
+        with open_text(file_name) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                self.stats.read[item.get('type') or ''] += 1
+                self.buffer.append((self.key(item), self.sequence, line))
+                self.sequence += 1
+                self.buffered += len(line) + RECORD_OVERHEAD
+                if self.buffered >= self.memory_limit:
+                    self.spill()
+
+    def spill(self):
+        """Write the buffered records, sorted, to a new run file."""
+        self.buffer.sort()
+        path = Path(self.temporary_directory.name, f"run-{len(self.runs):06d}")
+        with open(path, 'w', encoding='utf-8') as f:
+            for key, sequence, line in self.buffer:
+                f.write(f"{key}\t{sequence:016x}\t{line}\n")
+        self.runs.append(path)
+        self.spilled += 1
+        self.buffer = []
+        self.buffered = 0
+
+    @staticmethod
+    def read_run(path: Path) -> typing.Iterator[typing.Tuple[str, int, str]]:
+        with open(path, encoding='utf-8') as f:
+            for record in f:
+                key, sequence, line = record.rstrip('\n').split('\t', 2)
+                yield key, int(sequence, 16), line
+
+    def merge_runs(self) -> typing.Iterator[typing.Tuple[str, int, str]]:
+        """All the records, ordered by key and then from oldest to newest."""
+        # merge runs by batches while there are too many to open at once
+        while len(self.runs) > MAX_FAN_IN:
+            batch, self.runs = self.runs[:MAX_FAN_IN], self.runs[MAX_FAN_IN:]
+            path = Path(self.temporary_directory.name, f"run-{self.sequence:016x}-{len(self.runs):06d}")
+            with open(path, 'w', encoding='utf-8') as f:
+                for key, sequence, line in heapq.merge(*(self.read_run(run) for run in batch)):
+                    f.write(f"{key}\t{sequence:016x}\t{line}\n")
+            for run in batch:
+                os.remove(run)
+            self.runs.append(path)
+        self.buffer.sort()
+        return heapq.merge(*(self.read_run(run) for run in self.runs), iter(self.buffer))
+
+    def write(self, file_name: str = None, output: typing.TextIO = None) -> CompactionStats:
+        """Write the newest record of every entity.
+
+        :param file_name: Output file, gzip compressed if it ends with ".gz".
+        :param output: Output stream, used when no file name is given.
+        :return: The counts of the compaction.
+        :rtype: CompactionStats
+        """
+        out = open_text(file_name, 'wt') if file_name else output
+        try:
+            for key, records in itertools.groupby(self.merge_runs(), key=lambda record: record[0]):
+                entity_type = json.loads(key)[0]
+                newest = previous = None
+                for _, _, line in records:
+                    if newest is not None:
+                        self.stats.superseded[entity_type] += 1
+                    previous, newest = newest, line
+                newest_item = json.loads(newest)
+                if newest_item.get('deleted'):
+                    self.stats.deleted[entity_type] += 1
+                    continue
+                if previous is not None and json.loads(previous) != newest_item:
+                    self.stats.changed[entity_type] += 1
+                out.write(newest + '\n')
+                self.stats.written[entity_type] += 1
+        finally:
+            if file_name:
+                out.close()
+            self.temporary_directory.cleanup()
+        return self.stats
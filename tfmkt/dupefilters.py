@@ -0,0 +1,316 @@
+"""A request dupefilter that scales to tens of millions of requests.
+
+Scrapy's `RFPDupeFilter` keeps the hex fingerprint of every request seen in a
+Python set, which costs well over 100 bytes per request. `CompactDupeFilter`
+keeps the binary fingerprints instead, in one of two stores selected with
+`DUPEFILTER_STORE`:
+
+* `hashset` (default): an open addressing hash set of fingerprints truncated to
+  `DUPEFILTER_DIGEST_SIZE` bytes, in a single flat buffer. No false positives
+  beyond digest collisions. When a spill directory is available (`JOBDIR`, or
+  `DUPEFILTER_SPILL_DIR`) the buffer is a memory-mapped file, so that the
+  operating system can page it out, and it is kept across runs with `JOBDIR`.
+* `bloom`: a scalable Bloom filter, growing as needed while keeping the
+  probability of false positives (requests wrongly filtered as duplicates)
+  under `DUPEFILTER_BLOOM_ERROR_RATE`. A few bytes per request at most.
+
+See benchmarks/dupefilter_memory.py for a comparison with the default.
+"""
+from pathlib import Path
+import json
+import math
+import mmap
+import os
+import pickle
+
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+
+
+class DigestSet:
+    """Open addressing (linear probing) hash set of fixed size binary digests.
+
+    Digests are stored back to back in a single buffer, a slot full of zeros
+    being an empty one. The buffer is a `bytearray`, or a memory-mapped file
+    when a path is given.
+
+    :param digest_size: Number of bytes kept from each digest.
+    :param capacity: Initial number of slots, rounded up to a power of two.
+    :param path: Optional path of the file backing the buffer.
+    :param keep: Whether the file is kept when the set is closed, and loaded
+      back when it exists already.
+    :param max_load: Load factor above which the set is doubled in size.
+    """
+
+    def __init__(self, digest_size: int = 16, capacity: int = 1 << 20, path: str = None, keep: bool = True,
+                 max_load: float = 0.7):
+        self.digest_size = digest_size
+        self.path = path
+        self.keep = keep
+        self.max_load = max_load
+        if path is not None and not keep:
+            self.remove_files()
+        self.empty = bytes(digest_size)
+        self.count = 0
+        self.file = None
+        self.buffer = None
+
+        header = self.read_header()
+        if header is not None:
+            self.count = header['count']
+            self.allocate(header['capacity'], self.path)
+        else:
+            self.allocate(1 << max(0, capacity - 1).bit_length(), self.path)
+
+    def read_header(self):
+        if self.path is None or not os.path.exists(self.path + '.json'):
+            return None
+        with open(self.path + '.json') as f:
+            header = json.load(f)
+        if header['digest_size'] != self.digest_size:
+            raise ValueError(f"{self.path} holds {header['digest_size']} bytes digests, not {self.digest_size}")
+        return header
+
+    def remove_files(self):
+        for suffix in ('', '.json', '.grow'):
+            Path(self.path + suffix).unlink(missing_ok=True)
+
+    def write_header(self):
+        with open(self.path + '.json', 'w') as f:
+            json.dump({'digest_size': self.digest_size, 'capacity': self.capacity, 'count': self.count}, f)
+
+    def allocate(self, capacity: int, path: str = None):
+        self.capacity = capacity
+        size = capacity * self.digest_size
+        if path is None:
+            self.file = None
+            self.buffer = bytearray(size)
+            return
+        self.file = open(path, 'a+b')
+        if os.path.getsize(path) < size:
+            self.file.truncate(size)
+        self.buffer = mmap.mmap(self.file.fileno(), size)
+
+    def __len__(self):
+        return self.count
+
+    def _slot(self, digest: bytes) -> int:
+        return int.from_bytes(digest[:8], 'little') & (self.capacity - 1)
+
+    def _normalize(self, digest: bytes) -> bytes:
+        digest = bytes(digest[:self.digest_size])
+        # the all zeros digest marks empty slots
+        return b'\x01' + digest[1:] if digest == self.empty else digest
+
+    def _insert(self, digest: bytes) -> bool:
+        size = self.digest_size
+        buffer = self.buffer
+        mask = self.capacity - 1
+        slot = self._slot(digest)
+        while True:
+            offset = slot * size
+            stored = buffer[offset:offset + size]
+            if stored == self.empty:
+                buffer[offset:offset + size] = digest
+                return True
+            if stored == digest:
+                return False
+            slot = (slot + 1) & mask
+
+    def __contains__(self, digest: bytes) -> bool:
+        digest = self._normalize(digest)
+        size = self.digest_size
+        mask = self.capacity - 1
+        slot = self._slot(digest)
+        while True:
+            offset = slot * size
+            stored = self.buffer[offset:offset + size]
+            if stored == self.empty:
+                return False
+            if stored == digest:
+                return True
+            slot = (slot + 1) & mask
+
+    def add(self, digest: bytes) -> bool:
+        """Add a digest to the set.
+
+        :return: True if the digest was not in the set already.
+        :rtype: bool
+        """
+        if self.count + 1 > self.capacity * self.max_load:
+            self.grow()
+        added = self._insert(self._normalize(digest))
+        if added:
+            self.count += 1
+        return added
+
+    def grow(self):
+        """Double the number of slots and rehash the digests into them."""
+        old_buffer, old_file, old_capacity = self.buffer, self.file, self.capacity
+        old_digests = (
+            bytes(old_buffer[offset:offset + self.digest_size])
+            for offset in range(0, old_capacity * self.digest_size, self.digest_size)
+        )
+
+        new_path = None
+        if self.path is not None:
+            new_path = self.path + '.grow'
+            Path(new_path).unlink(missing_ok=True)
+        self.allocate(old_capacity * 2, new_path)
+        for digest in old_digests:
+            if digest != self.empty:
+                self._insert(digest)
+
+        if old_file is not None:
+            old_buffer.close()
+            old_file.close()
+            self.buffer.flush()
+            self.buffer.close()
+            self.file.close()
+            os.replace(new_path, self.path)
+            self.allocate(self.capacity, self.path)
+            if self.keep:
+                self.write_header()
+
+    def close(self):
+        if self.file is not None:
+            self.buffer.flush()
+            self.buffer.close()
+            self.file.close()
+            if self.keep:
+                self.write_header()
+            else:
+                self.remove_files()
+
+
+class BloomFilter:
+    """A Bloom filter sized for `capacity` elements at a given false positive rate.
+
+    Elements are digests of at least 16 bytes, the bit positions are derived
+    from them by enhanced double hashing (Dillinger and Manolios, "Bloom Filters
+    in Probabilistic Verification", 2004), which does not collapse into a few
+    positions when the second hash is a multiple of a divisor of the number of bits.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest: bytes):
+        num_bits = self.num_bits
+        position = int.from_bytes(digest[:8], 'little') % num_bits
+        step = int.from_bytes(digest[8:16], 'little') % num_bits
+        positions = []
+        for i in range(self.num_hashes):
+            positions.append(position)
+            position = (position + step) % num_bits
+            step = (step + i) % num_bits
+        return positions
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(digest))
+
+    def add(self, digest: bytes) -> bool:
+        added = False
+        for p in self._positions(digest):
+            mask = 1 << (p & 7)
+            if not self.bits[p >> 3] & mask:
+                self.bits[p >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+
+class ScalableBloomFilter:
+    """A Bloom filter that grows with the number of elements added to it.
+
+    A new, larger filter with a tighter error rate is added every time the
+    current one is full, so that the compound false positive rate stays under
+    `error_rate` (Almeida et al., "Scalable Bloom Filters", 2007).
+
+    :param capacity: Number of elements of the first filter.
+    :param error_rate: Maximum false positive rate.
+    :param growth: Capacity ratio between two consecutive filters.
+    :param tightening: Error rate ratio between two consecutive filters.
+    :param path: Optional file the filters are saved to on close, and loaded from.
+    """
+
+    def __init__(self, capacity: int = 1 << 20, error_rate: float = 1e-6, growth: int = 2,
+                 tightening: float = 0.5, path: str = None):
+        self.initial_capacity = capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.path = path
+        self.filters = []
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                self.filters = pickle.load(f)
+
+    def __len__(self):
+        return sum(f.count for f in self.filters)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return any(digest in f for f in self.filters)
+
+    def add(self, digest: bytes) -> bool:
+        if digest in self:
+            return False
+        if not self.filters or self.filters[-1].count >= self.filters[-1].capacity:
+            index = len(self.filters)
+            self.filters.append(BloomFilter(
+                self.initial_capacity * self.growth ** index,
+                self.error_rate * (1 - self.tightening) * self.tightening ** index
+            ))
+        return self.filters[-1].add(digest)
+
+    def close(self):
+        if self.path is not None:
+            with open(self.path, 'wb') as f:
+                pickle.dump(self.filters, f)
+
+
+class CompactDupeFilter(RFPDupeFilter):
+    """Request fingerprint duplicates filter keeping binary fingerprints in a compact store."""
+
+    def __init__(self, store, debug: bool = False, *, fingerprinter=None):
+        super().__init__(None, debug, fingerprinter=fingerprinter)
+        self.store = store
+
+    @classmethod
+    def from_settings(cls, settings, *, fingerprinter=None):
+        jobdir = job_dir(settings)
+        directory = jobdir or settings.get('DUPEFILTER_SPILL_DIR')
+        if directory:
+            Path(directory).mkdir(parents=True, exist_ok=True)
+        capacity = settings.getint('DUPEFILTER_INITIAL_CAPACITY')
+
+        kind = settings.get('DUPEFILTER_STORE')
+        if kind == 'hashset':
+            store = DigestSet(
+                digest_size=settings.getint('DUPEFILTER_DIGEST_SIZE'),
+                capacity=capacity,
+                path=os.path.join(directory, 'requests.seen.digests' if jobdir else f'requests.seen.{os.getpid()}.digests') if directory else None,
+                keep=bool(jobdir)
+            )
+        elif kind == 'bloom':
+            store = ScalableBloomFilter(
+                capacity=capacity,
+                error_rate=settings.getfloat('DUPEFILTER_BLOOM_ERROR_RATE'),
+                # a Bloom filter can not be spilled, it is only kept across runs
+                path=os.path.join(jobdir, 'requests.seen.bloom') if jobdir else None
+            )
+        else:
+            raise ValueError(f"Unknown DUPEFILTER_STORE: {kind}, use 'hashset' or 'bloom'")
+        return cls(store, settings.getbool('DUPEFILTER_DEBUG'), fingerprinter=fingerprinter)
+
+    def request_seen(self, request) -> bool:
+        return not self.store.add(self.fingerprinter.fingerprint(request))
+
+    def close(self, reason):
+        self.store.close()
@@ -0,0 +1,256 @@
+"""Feed exporters of the project.
+
+`FastJsonLinesItemExporter` replaces Scrapy's JSON lines exporter for the
+`jsonlines` format. Scrapy's exporter encodes every item with the standard
+library encoder and writes it to the feed file right away, both on the reactor
+thread: a slow consumer at the other end of a `stdout:` pipe blocks the whole
+crawl. This exporter
+
+* writes the lines Scrapy's exporter writes (`ensure_ascii` unless a feed
+  encoding is set, spaces after separators), encoded on the reactor thread,
+* writes the encoded lines from a background thread, all the lines waiting at
+  once, so that writes are batched under load without delaying items otherwise,
+* pauses the engine while more than `FEED_WRITER_MAX_PENDING` items wait to be
+  written, and resumes it once they are down to half of that (and no other
+  component holds it paused, see `tfmkt.utils.pause_engine`),
+* keeps count of the lines written in `FeedWriters`, shared by the writers of
+  a crawler, so that the checkpoint of emitted items only records items once
+  their line reached the feed file: lines still queued when the process is
+  killed are scraped and exported again by the next run,
+* with `FEED_INDEX` (or the `index` feed option, in `item_export_kwargs`),
+  writes a `<feed file>.idx` index of the byte offsets of the entity keys of
+  the items (see `tfmkt.index`). Feeds that are not plain files, such as
+  `stdout:` or compressed feeds, are not indexed.
+
+`CompactJsonLinesItemExporter`, for the `jsonlines-compact` format, writes
+lines without spaces between tokens and with non-ASCII characters as UTF-8,
+encoded with orjson when it is installed (`pip install orjson`), which is
+several times faster, and with the standard library encoder otherwise. Its
+output is the same either way.
+
+https://docs.scrapy.org/en/latest/topics/exporters.html
+"""
+from collections import deque
+import logging
+import os
+import queue
+import threading
+
+from scrapy.exporters import BaseItemExporter
+from scrapy.utils.serialize import ScrapyJSONEncoder
+from twisted.internet import reactor
+
+from tfmkt.index import IndexWriter, index_path
+from tfmkt.keys import item_key
+from tfmkt.utils import pause_engine, unpause_engine
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# sentinel telling the writer thread to stop
+_STOP = object()
+
+
+class FeedWriters:
+    """The background feed writers of a crawler, and the lines they wrote.
+
+    Items scraped are handed to the feed exports before the other handlers of
+    `item_scraped` are called (extensions are created before the middlewares),
+    so that when those handlers run, the line of the item is queued in every
+    writer. `when_written` lets them wait until it is written.
+    """
+
+    def __init__(self):
+        self.writers = set()
+        # (lines queued by each busy writer, callback), in order
+        self.waiting = deque()
+
+    @classmethod
+    def of(cls, crawler) -> 'FeedWriters':
+        """The writers of a crawler."""
+        writers = getattr(crawler, 'feed_writers', None)
+        if writers is None:
+            writers = crawler.feed_writers = cls()
+        return writers
+
+    def when_written(self, callback):
+        """Call `callback` once every line queued so far is written, right away when there is none."""
+        barrier = {writer: writer.queued for writer in self.writers if writer.written < writer.queued}
+        if barrier:
+            self.waiting.append((barrier, callback))
+        else:
+            callback()
+
+    def lines_written(self):
+        """Call the callbacks whose lines are written, in order."""
+        while self.waiting:
+            barrier, callback = self.waiting[0]
+            if any(writer.written < queued for writer, queued in barrier.items()):
+                break
+            self.waiting.popleft()
+            callback()
+
+
+class FastJsonLinesItemExporter(BaseItemExporter):
+    """JSON lines exporter writing from a background thread, with the output of Scrapy's `JsonLinesItemExporter`.
+
+    :param file: The feed file, opened in binary mode.
+    :param crawler: The crawler whose engine is paused while the writer lags behind.
+    :param max_pending: Number of items waiting to be written above which the
+      engine is paused (`FEED_WRITER_MAX_PENDING`).
+    :param index: Whether to write an index of the entity keys of the items (`FEED_INDEX`).
+    """
+
+    # whether lines are written without spaces and with non-ASCII characters as UTF-8
+    compact = False
+
+    def __init__(self, file, crawler=None, max_pending: int = 10000, index: bool = False, **kwargs):
+        super().__init__(dont_fail=True, **kwargs)
+        self.file = file
+        self.crawler = crawler
+        self.max_pending = max_pending
+        # whether this exporter holds the engine paused
+        self.paused = False
+        self.error = None
+        # lines are never refused, the engine is paused instead: callbacks in progress still yield items
+        self.pending = queue.Queue()
+        self.writer = None
+        # lines queued, and lines written to the feed file as last reported by the writer thread
+        self.queued = 0
+        self.written = 0
+        self.feed_writers = FeedWriters.of(crawler) if crawler is not None else None
+        self.index = index
+        self.index_writer = None
+        # offset in the feed file of the next line written
+        self.offset = 0
+
+        if self.compact:
+            self._kwargs.setdefault('ensure_ascii', False)
+            self._kwargs.setdefault('separators', (',', ':'))
+        else:
+            self._kwargs.setdefault('ensure_ascii', not self.encoding)
+        self.json_encoder = ScrapyJSONEncoder(**self._kwargs)
+        # orjson only writes compact UTF-8 lines
+        use_orjson = (
+            orjson is not None and self._kwargs == {'ensure_ascii': False, 'separators': (',', ':')}
+            and (self.encoding or 'utf-8').lower() in ('utf-8', 'utf8')
+        )
+        self.encode = self.encode_orjson if use_orjson else self.encode_json
+
+    @classmethod
+    def from_crawler(cls, crawler, file, **kwargs):
+        kwargs.setdefault('index', crawler.settings.getbool('FEED_INDEX'))
+        return cls(file, crawler=crawler, max_pending=crawler.settings.getint('FEED_WRITER_MAX_PENDING'), **kwargs)
+
+    def encode_orjson(self, item: dict) -> bytes:
+        return orjson.dumps(
+            item, default=self.json_encoder.default, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS
+        )
+
+    def encode_json(self, item: dict) -> bytes:
+        return (self.json_encoder.encode(item) + '\n').encode(self.encoding or 'utf-8')
+
+    def start_exporting(self):
+        if self.index:
+            path = getattr(self.file, 'name', None)
+            if isinstance(path, str) and os.path.isfile(path):
+                # feeds opened for appending start at the end of the file
+                self.offset = self.file.tell()
+                self.index_writer = IndexWriter(index_path(path), append=self.offset > 0)
+            else:
+                logger.warning("Feed %r is not a plain file, it is not indexed", path)
+        self.writer = threading.Thread(target=self.write_lines, name='feed-writer', daemon=True)
+        self.writer.start()
+        if self.feed_writers is not None:
+            self.feed_writers.writers.add(self)
+
+    def export_item(self, item):
+        if self.error is not None:
+            raise self.error
+        if type(item) is dict and self.fields_to_export is None:
+            # plain dicts have no field serializers, going through ItemAdapter costs more than encoding them
+            line = self.encode(item)
+        else:
+            line = self.encode(dict(self._get_serialized_fields(item)))
+        self.pending.put(line if self.index_writer is None else (line, item_key(item)))
+        self.queued += 1
+        if not self.paused and self.crawler is not None and self.pending.qsize() > self.max_pending:
+            self.paused = True
+            self.crawler.stats.inc_value('feed_writer/pauses')
+            logger.debug("Pausing the engine, %d items wait to be written", self.pending.qsize())
+            pause_engine(self.crawler)
+
+    def finish_exporting(self):
+        self.pending.put(_STOP)
+        self.writer.join()
+        if self.feed_writers is not None:
+            self.feed_writers.writers.discard(self)
+            if self.error is None:
+                self.lines_written(self.queued)
+        self.resume()
+        if self.index_writer is not None:
+            self.index_writer.close()
+        if self.error is not None:
+            raise self.error
+
+    def resume(self):
+        if self.paused:
+            self.paused = False
+            unpause_engine(self.crawler)
+
+    def lines_written(self, written: int):
+        """Take note of the lines written by the writer thread, in the reactor thread."""
+        if written > self.written:
+            self.written = written
+            self.feed_writers.lines_written()
+        if self.paused and self.pending.qsize() <= self.max_pending // 2:
+            self.resume()
+
+    def write_lines(self):
+        """Write the pending lines to the feed file, in the writer thread."""
+        stopped = False
+        written = 0
+        while not stopped:
+            lines = [self.pending.get()]
+            while True:
+                try:
+                    lines.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            if lines[-1] is _STOP:
+                lines.pop()
+                stopped = True
+
+            if self.error is None:
+                try:
+                    if self.index_writer is not None:
+                        lines = self.index_lines(lines)
+                    self.file.write(b''.join(lines))
+                    self.file.flush()
+                    if self.index_writer is not None:
+                        self.index_writer.flush()
+                    written += len(lines)
+                except Exception as e:
+                    self.error = e
+            if self.feed_writers is not None and not stopped:
+                reactor.callFromThread(self.lines_written, written)
+
+    def index_lines(self, lines) -> list:
+        """Add the (line, key) pairs about to be written to the index, and return their lines."""
+        encoded = []
+        for line, key in lines:
+            if key is not None:
+                self.index_writer.add(key, self.offset, len(line))
+            self.offset += len(line)
+            encoded.append(line)
+        return encoded
+
+
+class CompactJsonLinesItemExporter(FastJsonLinesItemExporter):
+    """`FastJsonLinesItemExporter` writing compact UTF-8 lines, encoded with orjson when it is installed."""
+
+    compact = True
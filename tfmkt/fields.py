@@ -0,0 +1,84 @@
+"""Extract and export only the fields a job needs.
+
+Spiders take a `fields` argument, a comma separated list of item fields:
+
+    scrapy crawl games -a parents=competitions.json -a fields=game_id,result,date_iso
+
+Items are projected on these fields by `FieldProjectionMiddleware`, keeping
+their `type`. Callbacks extracting many fields, such as `GamesSpider.parse_game`
+and `PlayersSpider.parse_details`, are also organized as a dict of field
+functions, and only the functions of the fields requested are run: a games job
+that does not ask for `events` or lineups does not parse them. Values shared by
+several fields are computed once, on first use, by functions wrapped in `lazy`.
+"""
+import functools
+import typing
+
+from scrapy import Request
+
+# fields kept in projected items, whether requested or not
+ALWAYS_KEPT = frozenset(('type',))
+
+# returned by field functions to leave their field out of the item
+OMITTED = object()
+
+
+def parse_fields(value) -> typing.Optional[typing.FrozenSet[str]]:
+    """The fields requested by a `fields` spider argument, or None for all of them.
+
+    :param value: A comma separated list of fields, or a list of fields.
+    :return: The set of fields requested.
+    :rtype: typing.Optional[typing.FrozenSet[str]]
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    fields = frozenset(field.strip() for field in value if field.strip())
+    return fields or None
+
+
+def lazy(function: typing.Callable[[], typing.Any]) -> typing.Callable[[], typing.Any]:
+    """Wrap a function without arguments so that it runs once, on first call."""
+    return functools.lru_cache(maxsize=None)(function)
+
+
+def extract_fields(field_functions: typing.Dict[str, typing.Callable[[], typing.Any]],
+                   fields: typing.Optional[typing.FrozenSet[str]] = None) -> dict:
+    """Run the field functions of the requested fields.
+
+    :param field_functions: The function extracting every field, by field name,
+      in the order of the fields in items.
+    :param fields: The fields requested, or None for all of them.
+    :return: The values of the requested fields, less those whose function returned `OMITTED`.
+    :rtype: dict
+    """
+    values = {}
+    for name, function in field_functions.items():
+        if fields is None or name in fields:
+            value = function()
+            if value is not OMITTED:
+                values[name] = value
+    return values
+
+
+def project(item: dict, fields: typing.Optional[typing.FrozenSet[str]]) -> dict:
+    """Keep only the requested fields of an item, and its `type`."""
+    if fields is None:
+        return item
+    return {key: value for key, value in item.items() if key in fields or key in ALWAYS_KEPT}
+
+
+class FieldProjectionMiddleware:
+    """Spider middleware projecting the items of spiders on their `fields` argument.
+
+    Spiders without a `fields` argument are left untouched.
+    """
+
+    def process_spider_output(self, response, result, spider):
+        fields = getattr(spider, 'fields', None)
+        for element in result:
+            if fields is None or isinstance(element, Request):
+                yield element
+            else:
+                yield project(dict(element), fields)
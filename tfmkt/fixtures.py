@@ -0,0 +1,320 @@
+"""Recorded pages, for parsing spider callbacks offline.
+
+A fixture is a response recorded for a spider callback, stored under a
+fixtures directory as
+
+    <spider>/<callback>/<sha1>.html.gz   the gzip compressed response body
+    <spider>/<callback>/<sha1>.json      its metadata
+
+where `<sha1>` is the hash of the body, so that a page recorded twice is stored
+once. The metadata holds the `url` of the page, the `spider` and `callback` it
+is parsed by, the `cb_kwargs` of the callback, the response `status` and
+`encoding`, and when and where from the page was recorded:
+
+    {"url": "https://www.transfermarkt.co.uk/spielbericht/index/spielbericht/3098550",
+     "spider": "games", "callback": "parse_game",
+     "cb_kwargs": {"base": {"type": "game", "href": "/spielbericht/index/spielbericht/3098550", "parent": {...}}},
+     "status": 200, "encoding": "utf-8", "sha1": "...", "recorded_at": "...", "source": "httpcache"}
+
+Fixtures without `cb_kwargs` are parsed with those of the `@cb_kwargs`
+contract of the callback, if it has one.
+
+Fixtures are recorded from the HTTP cache by the `scrapy record` command, or
+during a crawl by `FixtureRecorderMiddleware`. Recorded pages are sorted into
+the `PAGE_TYPES` below by URL, and into variants (cup, league or youth
+competitions, active, retired or deceased players) by URL and content, so that
+a sample with a few pages of every variant covers the layouts the callbacks
+have to handle.
+"""
+from pathlib import Path
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import typing
+
+from scrapy import Request, signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Headers, HtmlResponse
+from w3lib.http import headers_raw_to_dict
+
+from tfmkt.urls import site_path
+
+logger = logging.getLogger(__name__)
+
+BODY_SUFFIX = '.html.gz'
+METADATA_SUFFIX = '.json'
+
+
+def contract_cb_kwargs(callback: typing.Callable) -> typing.Optional[dict]:
+    """The keyword arguments of the `@cb_kwargs` contract of a callback, if any."""
+    for line in (callback.__doc__ or '').splitlines():
+        line = line.strip()
+        if line.startswith('@cb_kwargs'):
+            return json.loads(line[len('@cb_kwargs'):])
+    return None
+
+
+class Fixture(typing.NamedTuple):
+    """A recorded response and the callback it is parsed by."""
+
+    path: Path
+    metadata: dict
+    body: bytes
+
+    @property
+    def url(self) -> str:
+        return self.metadata['url']
+
+    @property
+    def callback(self) -> str:
+        return self.metadata['callback']
+
+    def cb_kwargs(self, callback: typing.Callable = None) -> dict:
+        """The keyword arguments of the callback: the recorded ones, or else those of its `@cb_kwargs` contract."""
+        cb_kwargs = self.metadata.get('cb_kwargs')
+        if cb_kwargs is None and callback is not None:
+            cb_kwargs = contract_cb_kwargs(callback)
+        return cb_kwargs or {}
+
+    def response(self, callback: typing.Callable = None) -> HtmlResponse:
+        """A new response of the recorded page, with a request carrying the callback keyword arguments.
+
+        Responses cache their parsed document, so a new one is needed every time the page is parsed.
+        """
+        request = Request(self.url, callback=callback, cb_kwargs=self.cb_kwargs(callback))
+        return HtmlResponse(
+            url=self.url,
+            status=self.metadata.get('status', 200),
+            body=self.body,
+            encoding=self.metadata.get('encoding') or 'utf-8',
+            request=request,
+        )
+
+
+def fixture_directory(directory: str, spider: str, callback: str) -> Path:
+    return Path(directory, spider, callback)
+
+
+def write_fixture(directory: str, url: str, body: bytes, spider: str, callback: str,
+                  cb_kwargs: typing.Optional[dict] = None, status: int = 200, encoding: str = 'utf-8',
+                  source: str = None, variant: str = None) -> typing.Optional[Path]:
+    """Write a fixture, unless the same page is already recorded for the callback.
+
+    :return: The path of the metadata of the new fixture, or None if it was a duplicate.
+    :rtype: typing.Optional[Path]
+    """
+    sha1 = hashlib.sha1(body).hexdigest()
+    path = fixture_directory(directory, spider, callback)
+    metadata_path = path / f"{sha1}{METADATA_SUFFIX}"
+    if metadata_path.exists():
+        return None
+    path.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path / f"{sha1}{BODY_SUFFIX}", 'wb', compresslevel=9) as f:
+        f.write(body)
+    metadata = {
+        'url': url,
+        'spider': spider,
+        'callback': callback,
+        'cb_kwargs': cb_kwargs,
+        'status': status,
+        'encoding': encoding,
+        'variant': variant,
+        'sha1': sha1,
+        'recorded_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'source': source,
+    }
+    # written last, so that a fixture is only seen once complete
+    temporary = metadata_path.with_name(f".{metadata_path.name}.{os.getpid()}")
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False, default=str)
+    os.replace(temporary, metadata_path)
+    return metadata_path
+
+
+def read_fixture(metadata_path: Path) -> Fixture:
+    metadata_path = Path(metadata_path)
+    with open(metadata_path, encoding='utf-8') as f:
+        metadata = json.load(f)
+    body_path = metadata_path.with_name(metadata_path.name[:-len(METADATA_SUFFIX)] + BODY_SUFFIX)
+    with gzip.open(body_path, 'rb') as f:
+        body = f.read()
+    return Fixture(metadata_path, metadata, body)
+
+
+def load_fixtures(directory: str, spider: str = None, callback: str = None) -> typing.List[Fixture]:
+    """The fixtures of a fixtures directory, of a spider and a callback if given, ordered by path."""
+    pattern = f"{spider or '*'}/{callback or '*'}/*{METADATA_SUFFIX}"
+    return [read_fixture(path) for path in sorted(Path(directory).glob(pattern))]
+
+
+YOUTH_PATTERN = re.compile(r'(?:^|[-/])(?:u\d\d|19yl|youth|jugend|junioren|primavera|juvenil)(?:[-/]|$)', re.I)
+DEATH_PATTERN = re.compile(rb'Date of death', re.I)
+RETIRED_PATTERN = re.compile(rb'>\s*Retired\s*<')
+
+
+def competition_variant(path: str, body: bytes) -> str:
+    if YOUTH_PATTERN.search(path):
+        return 'youth'
+    return 'cup' if '/pokalwettbewerb/' in path else 'league'
+
+
+def club_variant(path: str, body: bytes) -> str:
+    return 'youth' if YOUTH_PATTERN.search(path) else 'senior'
+
+
+def player_variant(path: str, body: bytes) -> str:
+    if DEATH_PATTERN.search(body):
+        return 'deceased'
+    return 'retired' if RETIRED_PATTERN.search(body) else 'active'
+
+
+class PageType(typing.NamedTuple):
+    """A kind of page, and the spider callback parsing it."""
+
+    spider: str
+    callback: str
+    # matched against the site path of the page URL
+    pattern: typing.Pattern
+    # the callback keyword arguments of a page, built from the match of its path
+    cb_kwargs: typing.Callable[[typing.Match], typing.Optional[dict]]
+    # the variant of a page, from its path and body
+    variant: typing.Callable[[str, bytes], str] = None
+
+    @property
+    def name(self) -> str:
+        return f'{self.spider}.{self.callback}'
+
+
+def _base(entity_type: str):
+    return lambda match: {'base': {'type': entity_type, 'href': match.group(0), 'parent': {}}}
+
+
+PAGE_TYPES = [
+    PageType('games_urls', 'extract_game_urls',
+             re.compile(r'^(?:/[^/]+)?/gesamtspielplan/(?:pokal)?wettbewerb/[^/]+.*'),
+             _base('competition'), competition_variant),
+    PageType('games', 'parse_game',
+             re.compile(r'^(?:/[^/]+)?/index/spielbericht/\d+$'),
+             _base('game')),
+    # the lineups callback gets the lineups of the game page, see its @cb_kwargs contract
+    PageType('game_lineups', 'parse_lineups',
+             re.compile(r'^(?:/[^/]+)?/aufstellung/spielbericht/\d+$'),
+             lambda match: None),
+    PageType('clubs', 'parse_details',
+             re.compile(r'^/[^/]+/startseite/verein/\d+.*'),
+             _base('club'), club_variant),
+    PageType('players', 'parse_details',
+             re.compile(r'^/[^/]+/profil/spieler/\d+$'),
+             _base('player'), player_variant),
+    PageType('appearances', 'parse_stats',
+             re.compile(r'^/[^/]+/leistungsdaten/spieler/\d+.*'),
+             lambda match: {'parent': {'type': 'player', 'href': match.group(0)}}, player_variant),
+    PageType('competitions', 'parse_competitions',
+             re.compile(r'^/wettbewerbe/national/wettbewerbe/(\d+)$'),
+             lambda match: {'base': {'parent': {}, 'country_id': match.group(1)}}),
+]
+
+
+def page_type(url: str, page_types: typing.Iterable[PageType] = PAGE_TYPES
+              ) -> typing.Tuple[typing.Optional[PageType], typing.Optional[typing.Match]]:
+    """The type of the page at a URL, and the match of its path, or (None, None) for other pages."""
+    path = site_path(url)
+    for candidate in page_types:
+        match = candidate.pattern.match(path or '')
+        if match:
+            return candidate, match
+    return None, None
+
+
+class CachedPage(typing.NamedTuple):
+    url: str
+    status: int
+    headers: Headers
+    # the cache entry directory
+    path: Path
+
+    def read_body(self) -> bytes:
+        return _read_cache_file(self.path / 'response_body')
+
+
+def _read_cache_file(path: Path) -> bytes:
+    with open(path, 'rb') as f:
+        data = f.read()
+    # HTTPCACHE_GZIP compresses every file of the entries
+    return gzip.decompress(data) if data[:2] == b'\x1f\x8b' else data
+
+
+def cached_pages(cache_dir: str) -> typing.Iterator[CachedPage]:
+    """The pages of a filesystem HTTP cache (`FilesystemCacheStorage` or `SharedFilesystemCacheStorage`)."""
+    # sorted, so that samples of the same cache are reproducible
+    for meta_path in sorted(Path(cache_dir).glob('*/*/*/pickled_meta')):
+        try:
+            metadata = pickle.loads(_read_cache_file(meta_path))
+            headers = Headers(headers_raw_to_dict(_read_cache_file(meta_path.with_name('response_headers'))))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            continue
+        yield CachedPage(metadata.get('response_url') or metadata['url'], metadata['status'], headers, meta_path.parent)
+
+
+def response_encoding(url: str, headers: Headers, body: bytes) -> str:
+    return HtmlResponse(url=url, headers=headers, body=body).encoding
+
+
+class FixtureRecorderMiddleware:
+    """Spider middleware recording the responses of a crawl as fixtures, with their callback keyword arguments.
+
+    Enabled with the `FIXTURES_RECORD_DIR` setting. Up to
+    `FIXTURES_RECORD_PER_VARIANT` pages are recorded per page type and variant,
+    only from URLs matching `FIXTURES_RECORD_PATTERN` if set.
+    """
+
+    def __init__(self, crawler, directory: str, per_variant: int, pattern: typing.Optional[str]):
+        self.crawler = crawler
+        self.directory = directory
+        self.per_variant = per_variant
+        self.pattern = re.compile(pattern) if pattern else None
+        self.recorded = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        directory = settings.get('FIXTURES_RECORD_DIR')
+        if not directory:
+            raise NotConfigured
+        middleware = cls(crawler, directory, settings.getint('FIXTURES_RECORD_PER_VARIANT'),
+                         settings.get('FIXTURES_RECORD_PATTERN'))
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_spider_input(self, response, spider):
+        request = response.request
+        callback = request.meta.get('offloaded_callback') or getattr(request.callback, '__name__', None) or 'parse'
+        if response.status != 200 or (self.pattern and not self.pattern.search(response.url)):
+            return
+        bucket_type, _ = page_type(response.url)
+        path = site_path(response.url)
+        variant = bucket_type.variant(path, response.body) if bucket_type and bucket_type.variant else None
+        bucket = (spider.name, callback, variant)
+        if self.per_variant and self.recorded.get(bucket, 0) >= self.per_variant:
+            return
+        # cb_kwargs are recorded as the callback gets them, with parent references resolved
+        # by ParentInterningMiddleware, which runs first
+        written = write_fixture(
+            self.directory, response.url, response.body, spider.name, callback,
+            cb_kwargs=json.loads(json.dumps(request.cb_kwargs, default=str)),
+            status=response.status, encoding=getattr(response, 'encoding', 'utf-8'),
+            source='crawl', variant=variant,
+        )
+        self.recorded[bucket] = self.recorded.get(bucket, 0) + 1
+        if written:
+            self.crawler.stats.inc_value('fixtures/recorded', spider=spider)
+
+    def spider_closed(self, spider):
+        if self.recorded:
+            logger.info("Recorded fixtures of %d page variants to %s", len(self.recorded), self.directory,
+                        extra={'spider': spider})
@@ -0,0 +1,36 @@
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from twisted.internet import defer
+
+
+class SharedPoolHTTP11DownloadHandler(HTTP11DownloadHandler):
+    """HTTP/1.1 download handler that shares its connection pool across crawlers.
+
+    Every crawler normally owns a connection pool of its own. When several
+    crawlers run in the same process (see `tfmkt.orchestrator`) they all talk to
+    the same host, so sharing the pool lets keep-alive connections opened by one
+    stage be reused by the next one.
+
+    The pool is closed when the last handler using it is closed.
+    """
+
+    _shared_pool = None
+    _users = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        cls = SharedPoolHTTP11DownloadHandler
+        if cls._shared_pool is None:
+            cls._shared_pool = self._pool
+        else:
+            self._pool = cls._shared_pool
+        cls._users += 1
+
+    def close(self):
+        cls = SharedPoolHTTP11DownloadHandler
+        cls._users -= 1
+        if cls._users > 0:
+            return defer.succeed(None)
+
+        cls._shared_pool = None
+        return super().close()
@@ -0,0 +1,20 @@
+from pathlib import Path
+
+from scrapy.extensions.httpcache import FilesystemCacheStorage
+
+
+class SharedFilesystemCacheStorage(FilesystemCacheStorage):
+    """A filesystem HTTP cache storage that is shared by all spiders.
+
+    Scrapy's default storage keeps one cache directory per spider name, so the
+    same page requested by two different spiders (for example, the fixtures page
+    requested by both `games` and `games_urls`) is downloaded and stored twice.
+    This storage drops the spider name from the cache path so that all spiders
+    read and write the same entries.
+
+    https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#std-setting-HTTPCACHE_STORAGE
+    """
+
+    def _get_request_path(self, spider, request):
+        key = self._fingerprinter.fingerprint(request).hex()
+        return str(Path(self.cachedir, "shared", key[0:2], key))
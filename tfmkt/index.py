@@ -0,0 +1,146 @@
+"""Byte offset indexes of JSON lines outputs, for reading records by key without scanning.
+
+An index is a sidecar file next to the output, `<output>.idx`, with one tab
+separated line per record:
+
+    <key>\t<block>\t<offset>\t<length>
+
+The key is the entity key of the record, its `game_id` or `href` (see
+`tfmkt.keys.item_key`). For plain outputs `block` is empty, and `offset`
+and `length` locate the line in the file. For block compressed outputs (the
+gzip parts of `PartitionedOutputPipeline`, written as a series of gzip
+members), `block` is the offset of the gzip member holding the line, and
+`offset` and `length` locate the line in the decompressed member.
+
+`IndexedJsonLines` reads records by key through a memory map of the output, so
+that only the pages holding the requested records are read:
+
+    games = IndexedJsonLines('games.json')
+    game = games.get('3426916')
+"""
+from pathlib import Path
+import json
+import mmap
+import typing
+import zlib
+
+INDEX_SUFFIX = '.idx'
+
+# bytes of a gzip member decompressed at once
+READ_SIZE = 1 << 16
+
+
+class IndexEntry(typing.NamedTuple):
+    # offset of the gzip member holding the record, None for plain outputs
+    block: typing.Optional[int]
+    offset: int
+    length: int
+
+
+def index_path(path: str) -> str:
+    return str(path) + INDEX_SUFFIX
+
+
+class IndexWriter:
+    """Append the entries of an output to its index file.
+
+    :param path: Path of the index file.
+    :param append: Whether entries are added to an existing index, as when the output is appended to.
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def add(self, key: str, offset: int, length: int, block: int = None):
+        # keys never contain tabs or newlines in practice, but must not break the format if they do
+        key = key.replace('\t', ' ').replace('\n', ' ')
+        self.file.write(f"{key}\t{'' if block is None else block}\t{offset}\t{length}\n")
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_index(path: str) -> typing.Dict[str, typing.List[IndexEntry]]:
+    """Read an index file: the entries of every key, in output order."""
+    entries = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            key, block, offset, length = line.rstrip('\n').split('\t')
+            entries.setdefault(key, []).append(IndexEntry(int(block) if block else None, int(offset), int(length)))
+    return entries
+
+
+class IndexedJsonLines:
+    """Read the records of an indexed JSON lines output by key.
+
+    :param path: Path of the output. Its index is read from `<path>.idx`.
+    :type path: str
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = read_index(index_path(path))
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if Path(path).stat().st_size else b''
+        # the last gzip member decompressed, as records with close keys often share one
+        self.member = (None, b'')
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return Path(index_path(path)).exists()
+
+    def __contains__(self, key) -> bool:
+        return str(key) in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def keys(self) -> typing.Iterable[str]:
+        return self.entries.keys()
+
+    def decompress_member(self, block: int) -> bytes:
+        if self.member[0] != block:
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            chunks = []
+            position = block
+            while not decompressor.eof and position < len(self.map):
+                chunks.append(decompressor.decompress(self.map[position:position + READ_SIZE]))
+                position += READ_SIZE
+            self.member = (block, b''.join(chunks))
+        return self.member[1]
+
+    def read(self, entry: IndexEntry) -> dict:
+        if entry.block is None:
+            line = self.map[entry.offset:entry.offset + entry.length]
+        else:
+            line = self.decompress_member(entry.block)[entry.offset:entry.offset + entry.length]
+        return json.loads(line)
+
+    def get(self, key, default=None) -> typing.Optional[dict]:
+        """The last record with a key, or `default` if there is none."""
+        entries = self.entries.get(str(key))
+        return self.read(entries[-1]) if entries else default
+
+    def get_all(self, key) -> typing.List[dict]:
+        """All the records with a key, in output order."""
+        return [self.read(entry) for entry in self.entries.get(str(key), [])]
+
+    def records(self, keys: typing.Iterable) -> typing.Iterator[dict]:
+        """The last record of each of the keys found in the index, in output order."""
+        entries = [self.entries[str(key)][-1] for key in dict.fromkeys(keys) if str(key) in self.entries]
+        for entry in sorted(entries, key=lambda entry: (entry.block or 0, entry.offset)):
+            yield self.read(entry)
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,63 @@
+"""Entity keys of items, and reading the parents of a file by key.
+
+Items of the entity types are identified by a key, their `href` or `game_id`
+(see `ENTITY_KEY_FIELDS`). The keys are used by the pipelines (change
+detection, entity store, output indexes), by the compaction of outputs and by
+spiders reading only some of their parents (`-a parents_keys=...`), which is
+why they live in a module of their own.
+"""
+import typing
+
+from tfmkt.index import IndexedJsonLines
+from tfmkt.utils import read_jsonlines
+
+# field identifying the entity of an item, by item type
+ENTITY_KEY_FIELDS = {
+    'competition': 'href',
+    'club': 'href',
+    'player': 'href',
+    'game': 'game_id',
+}
+
+
+def item_key(item) -> typing.Optional[str]:
+    """The entity key of an item, its href or game_id (see `ENTITY_KEY_FIELDS`), or None for other items."""
+    key_field = ENTITY_KEY_FIELDS.get(item.get('type'))
+    if key_field is None or item.get(key_field) is None:
+        return None
+    return str(item[key_field])
+
+
+def parse_keys(keys: str) -> typing.List[str]:
+    """A list of keys, given as a comma separated list or as "@" followed by the name of a file with one key per line."""
+    if keys.startswith('@'):
+        with open(keys[1:]) as f:
+            return [line.strip() for line in f if line.strip()]
+    return [key.strip() for key in keys.split(',') if key.strip()]
+
+
+def read_keyed_lines(file_name: str, keys: str) -> typing.List[dict]:
+    """Read the JSON lines of a file with the given entity keys (game_id or href).
+
+    Files with an index (see `tfmkt.index`) are read at the offsets of the
+    keys, others are scanned.
+
+    :param file_name: The name of the file to read from, gzip compressed if it ends with ".gz".
+    :type file_name: str
+    :param keys: The keys, as accepted by `parse_keys`.
+    :type keys: str
+    :return: A list of json objects (dict), the last one of every key
+    :rtype: typing.List[dict]
+    """
+    keys = parse_keys(keys)
+    if IndexedJsonLines.exists(file_name):
+        with IndexedJsonLines(file_name) as indexed:
+            return list(indexed.records(keys))
+
+    wanted = set(keys)
+    parents = {}
+    for parent in read_jsonlines(file_name):
+        key = item_key(parent)
+        if key in wanted:
+            parents[key] = parent
+    return list(parents.values())
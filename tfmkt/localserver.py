@@ -0,0 +1,260 @@
+"""A local stand-in for transfermarkt.co.uk that simulates its rate limiting.
+
+The server answers any path with a stub page, or with the file of the same
+path under a pages directory when one is given. Above `rps` requests per second
+it starts rejecting requests with a 429 (or 503) response and a `Retry-After`
+header, and keeps rejecting them for `penalty` seconds, like the real site does.
+Responses can also be delayed by a fixed latency, to exercise the slow response
+handling of `tfmkt.throttle.AdaptiveThrottle`.
+
+For end-to-end benchmarks, the server replays recorded pages instead: fixtures
+(see `tfmkt/fixtures.py`) or the entries of a filesystem HTTP cache, served
+under the path of their original URL, so that spiders crawl the recorded site
+as they would the real one. Latency jitter, random errors and rejections, and
+a bandwidth cap shared by all responses make the replay closer to the site.
+
+Run it with `scrapy serve` and point spiders to it with `-a base_url=http://localhost:8000`.
+"""
+from collections import deque
+from pathlib import Path
+from urllib.parse import urlsplit
+import gzip
+import json
+import logging
+import random
+import time
+
+from twisted.internet import reactor
+from twisted.web import resource, server
+
+from tfmkt.fixtures import BODY_SUFFIX, METADATA_SUFFIX, cached_pages
+from tfmkt.urls import canonical_url
+
+logger = logging.getLogger(__name__)
+
+STUB_PAGE = b"<html><head><title>tfmkt stand-in</title></head><body></body></html>"
+
+
+class PagesResource(resource.Resource):
+    """Serves the files of a directory under their relative path, or a stub page."""
+
+    isLeaf = True
+
+    def __init__(self, pages_dir=None):
+        super().__init__()
+        self.pages_dir = Path(pages_dir).resolve() if pages_dir else None
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/html; charset=utf-8')
+        if self.pages_dir is None:
+            return STUB_PAGE
+
+        relative = request.path.decode('utf-8').strip('/') or 'index.html'
+        path = (self.pages_dir / relative).resolve()
+        if path.is_dir():
+            path = path / 'index.html'
+        if self.pages_dir not in path.parents or not path.is_file():
+            request.setResponseCode(404)
+            return STUB_PAGE
+        return path.read_bytes()
+
+
+def page_key(url: str) -> str:
+    """The canonical path and query of a URL, by which recorded pages are looked up."""
+    if not urlsplit(url).scheme:
+        url = 'http://localhost/' + url.lstrip('/')
+    parts = urlsplit(canonical_url(url))
+    return parts.path + (f'?{parts.query}' if parts.query else '')
+
+
+class RecordedPagesResource(resource.Resource):
+    """Serves recorded pages under the path of their original URL.
+
+    :param fixtures_dir: Directory of fixtures recorded by `scrapy record` or `FixtureRecorderMiddleware`.
+    :param cache_dir: Directory of a filesystem HTTP cache. Fixtures take precedence over cache entries of the same page.
+    """
+
+    isLeaf = True
+
+    def __init__(self, fixtures_dir=None, cache_dir=None):
+        super().__init__()
+        # page key -> (gzip compressed body file or None, cache entry, encoding)
+        self.pages = {}
+        self.stats = {'missing': 0}
+        if cache_dir:
+            for page in cached_pages(cache_dir):
+                if page.status == 200:
+                    self.pages[page_key(page.url)] = (None, page, None)
+        if fixtures_dir:
+            for metadata_path in Path(fixtures_dir).glob(f'*/*/*{METADATA_SUFFIX}'):
+                with open(metadata_path, encoding='utf-8') as f:
+                    metadata = json.load(f)
+                body_path = metadata_path.with_name(metadata_path.name[:-len(METADATA_SUFFIX)] + BODY_SUFFIX)
+                self.pages[page_key(metadata['url'])] = (body_path, None, metadata.get('encoding') or 'utf-8')
+        logger.info("Replaying %d recorded pages", len(self.pages))
+
+    def render_GET(self, request):
+        recorded = self.pages.get(page_key(request.uri.decode('utf-8')))
+        if recorded is None:
+            self.stats['missing'] += 1
+            request.setResponseCode(404)
+            request.setHeader(b'Content-Type', b'text/html; charset=utf-8')
+            return STUB_PAGE
+
+        body_path, cached_page, encoding = recorded
+        if cached_page is not None:
+            request.setHeader(b'Content-Type', cached_page.headers.get(b'Content-Type') or b'text/html; charset=utf-8')
+            return cached_page.read_body()
+
+        request.setHeader(b'Content-Type', f'text/html; charset={encoding}'.encode())
+        with open(body_path, 'rb') as f:
+            body = f.read()
+        # fixtures are stored gzip compressed, as clients ask for them
+        if b'gzip' in (request.getHeader(b'Accept-Encoding') or b''):
+            request.setHeader(b'Content-Encoding', b'gzip')
+            return body
+        return gzip.decompress(body)
+
+
+class RateLimitedResource(resource.Resource):
+    """Wraps a resource with a requests-per-second limit, latency, errors and a bandwidth cap.
+
+    :param wrapped: The resource serving accepted requests.
+    :param rps: Maximum number of requests accepted per second. 0 disables the limit.
+    :param status: Status code of rejected requests, 429 or 503.
+    :param retry_after: Value of the `Retry-After` header of rejected requests, in seconds.
+      None to leave the header out.
+    :param penalty: Seconds during which all requests are rejected after the limit is hit.
+    :param latency: Seconds to wait before answering any request.
+    :param latency_jitter: Maximum random delay added to `latency`, in seconds.
+    :param reject_rate: Fraction of the requests below the limit rejected anyway, at random.
+    :param error_rate: Fraction of the accepted requests answered with `error_status` instead, at random.
+    :param error_status: Status code of the injected errors.
+    :param bandwidth: Bytes per second sent at most, by all responses together. 0 disables the cap.
+    :param seed: Seed of the random jitter, rejections and errors.
+    """
+
+    isLeaf = True
+
+    # bytes sent at once when the bandwidth is capped
+    CHUNK_SIZE = 16384
+
+    def __init__(self, wrapped, rps=2.0, status=429, retry_after=None, penalty=0.0, latency=0.0,
+                 latency_jitter=0.0, reject_rate=0.0, error_rate=0.0, error_status=500, bandwidth=0, seed=None):
+        super().__init__()
+        self.wrapped = wrapped
+        self.rps = rps
+        self.status = status
+        self.retry_after = retry_after
+        self.penalty = penalty
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.reject_rate = reject_rate
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.bandwidth = bandwidth
+        self.random = random.Random(seed)
+
+        self.accepted = deque()
+        self.blocked_until = 0.0
+        # when the capped bandwidth is free again
+        self.sending_until = 0.0
+        self.stats = {'accepted': 0, 'rejected': 0, 'errors': 0, 'bytes': 0}
+
+    def is_limited(self, now) -> bool:
+        if now < self.blocked_until:
+            return True
+        if not self.rps:
+            return False
+
+        while self.accepted and self.accepted[0] <= now - 1.0:
+            self.accepted.popleft()
+        if len(self.accepted) >= self.rps:
+            self.blocked_until = now + self.penalty
+            return True
+        self.accepted.append(now)
+        return False
+
+    def render(self, request):
+        if self.is_limited(time.monotonic()) or (self.reject_rate and self.random.random() < self.reject_rate):
+            self.stats['rejected'] += 1
+            request.setResponseCode(self.status)
+            if self.retry_after is not None:
+                request.setHeader(b'Retry-After', str(int(self.retry_after)).encode())
+            body = b"Too Many Requests"
+        elif self.error_rate and self.random.random() < self.error_rate:
+            self.stats['errors'] += 1
+            request.setResponseCode(self.error_status)
+            body = b"Internal Server Error"
+        else:
+            self.stats['accepted'] += 1
+            body = self.wrapped.render(request)
+        self.stats['bytes'] += len(body)
+
+        delay = self.latency + (self.random.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0)
+        if not delay and not self.bandwidth:
+            return body
+
+        calls = []
+        request.notifyFinish().addErrback(lambda _: [call.cancel() for call in calls if call.active()])
+        if not self.bandwidth:
+            calls.append(reactor.callLater(delay, self._finish, request, body))
+            return server.NOT_DONE_YET
+
+        # responses are sent one after the other at the capped rate, in chunks
+        request.setHeader(b'Content-Length', str(len(body)).encode())
+        now = time.monotonic()
+        start = max(now + delay, self.sending_until)
+        self.sending_until = start + len(body) / self.bandwidth
+        for offset in range(0, len(body), self.CHUNK_SIZE):
+            chunk = body[offset:offset + self.CHUNK_SIZE]
+            calls.append(reactor.callLater(start + offset / self.bandwidth - now, request.write, chunk))
+        calls.append(reactor.callLater(self.sending_until - now, request.finish))
+        return server.NOT_DONE_YET
+
+    def _finish(self, request, body):
+        request.write(body)
+        request.finish()
+
+
+def serve(port=8000, interface='127.0.0.1', pages_dir=None, fixtures_dir=None, cache_dir=None,
+          stats_interval=10.0, **limits):
+    """Start the stand-in server and run the reactor until interrupted.
+
+    :param port: TCP port to listen on.
+    :type port: int
+    :param interface: Interface to listen on.
+    :type interface: str
+    :param pages_dir: Optional directory with the pages to serve.
+    :type pages_dir: str
+    :param fixtures_dir: Optional directory of fixtures to replay, instead of `pages_dir`.
+    :type fixtures_dir: str
+    :param cache_dir: Optional HTTP cache directory to replay, instead of `pages_dir`.
+    :type cache_dir: str
+    :param stats_interval: Seconds between two log lines with the accepted and rejected counts.
+    :type stats_interval: float
+    :param limits: Keyword arguments of `RateLimitedResource`.
+    """
+    if fixtures_dir or cache_dir:
+        pages = RecordedPagesResource(fixtures_dir, cache_dir)
+    else:
+        pages = PagesResource(pages_dir)
+    root = RateLimitedResource(pages, **limits)
+    reactor.listenTCP(port, server.Site(root), interface=interface)
+    logger.info("Serving on http://%s:%d/ (%s)", interface, port, limits)
+
+    def log_stats():
+        logger.info(
+            "Accepted %(accepted)d requests, rejected %(rejected)d, errors %(errors)d, "
+            "%(missing)d pages not recorded, %(bytes)d bytes sent",
+            {**root.stats, 'missing': getattr(pages, 'stats', {}).get('missing', 0)}
+        )
+
+    if stats_interval:
+        def log_stats_periodically():
+            log_stats()
+            reactor.callLater(stats_interval, log_stats_periodically)
+        reactor.callLater(stats_interval, log_stats_periodically)
+    reactor.addSystemEventTrigger('before', 'shutdown', log_stats)
+
+    reactor.run()
@@ -0,0 +1,156 @@
+"""Spider middlewares of the project.
+
+https://docs.scrapy.org/en/latest/topics/spider-middleware.html
+"""
+from collections import deque
+import logging
+import os
+import pickle
+import tempfile
+
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+from scrapy.squeues import PickleFifoDiskQueue
+
+logger = logging.getLogger(__name__)
+
+
+class DepthFirstMiddleware:
+    """Schedule leaf requests before discovery requests and cap the discovery fan-out.
+
+    Callbacks such as `PlayersSpider.parse` or `GamesSpider.extract_game_urls`
+    yield dozens to hundreds of requests at once. Scheduled breadth-first, the
+    queue grows with every page discovered before a single item is scraped.
+
+    Requests to one of the spider `leaf_callbacks` (callbacks that only yield
+    items, such as `parse_details` or `parse_game`) get their priority raised by
+    `DEPTH_FIRST_LEAF_PRIORITY`, so that they are downloaded as soon as they are
+    discovered. Other requests yielded by callbacks are discovery requests: they
+    are held back here while the scheduler holds `DEPTH_FIRST_MAX_QUEUE`
+    requests or more, and handed over once the queue has drained. Nothing is
+    held back when `JOBDIR` is set.
+
+    At most `DEPTH_FIRST_MAX_HELD` requests are held back in memory. Past that,
+    held back requests are spilled, in order, to a pickled disk queue under
+    `DEPTH_FIRST_SPILL_DIR` (a temporary directory by default), so that memory
+    stays bounded however many requests the callbacks discover. A request that
+    can not be serialized, such as a request to a callback that is not a spider
+    method, stops the spilling: it and the requests held back after it are kept
+    in memory, after the spilled ones, until the disk queue is drained.
+
+    Runs on the spider output after `ParentInterningMiddleware`, so that held
+    back requests carry parent references, which are pickled as such.
+
+    Spiders without `leaf_callbacks` are left untouched. Disabled unless
+    `DEPTH_FIRST_ENABLED` is set.
+    """
+
+    def __init__(self, crawler, leaf_priority, max_queue, max_held=0, spill_dir=None):
+        self.crawler = crawler
+        self.leaf_priority = leaf_priority
+        self.max_queue = max_queue
+        self.max_held = max_held
+        self.spill_dir = spill_dir
+
+        # held back requests, in order: the ones in memory, the spilled ones, and the ones
+        # held back after a request that could not be spilled
+        self.held = deque()
+        # opened on the first spill
+        self.spilled = None
+        self.unspilled = deque()
+        self.temporary_directory = None
+
+        crawler.signals.connect(self.release, signal=signals.response_received)
+        crawler.signals.connect(self.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('DEPTH_FIRST_ENABLED'):
+            raise NotConfigured
+        # with a JOBDIR the scheduler queue lives on disk, and requests held back
+        # in memory here would be lost when the crawl is stopped
+        max_queue = 0 if settings.get('JOBDIR') else settings.getint('DEPTH_FIRST_MAX_QUEUE')
+        return cls(
+            crawler, settings.getint('DEPTH_FIRST_LEAF_PRIORITY'), max_queue,
+            settings.getint('DEPTH_FIRST_MAX_HELD'), settings.get('DEPTH_FIRST_SPILL_DIR')
+        )
+
+    def __len__(self):
+        return len(self.held) + (len(self.spilled) if self.spilled is not None else 0) + len(self.unspilled)
+
+    def is_leaf(self, request, spider) -> bool:
+        callback = request.callback
+        return getattr(callback, '__name__', None) in getattr(spider, 'leaf_callbacks', ())
+
+    def queue_is_full(self) -> bool:
+        slot = self.crawler.engine.slot
+        return bool(self.max_queue) and slot is not None and len(slot.scheduler) >= self.max_queue
+
+    def process_spider_output(self, response, result, spider):
+        leaf_callbacks = getattr(spider, 'leaf_callbacks', None)
+        for element in result:
+            if not leaf_callbacks or not isinstance(element, Request):
+                yield element
+            elif self.is_leaf(element, spider):
+                element.priority += self.leaf_priority
+                yield element
+            elif len(self) or self.queue_is_full():
+                self.hold(element, spider)
+            else:
+                yield element
+
+    def hold(self, request, spider):
+        stats = self.crawler.stats
+        if self.unspilled:
+            self.unspilled.append(request)
+        # once requests are spilled, later ones are spilled too, to keep them in order
+        elif self.max_held and (len(self.held) >= self.max_held or self.spilled):
+            try:
+                self.spill_queue().push(request)
+            except (ValueError, TypeError, AttributeError, pickle.PicklingError) as e:
+                stats.inc_value('depth_first/unserializable', spider=spider)
+                logger.debug("Holding back %s and the next requests in memory, it can not be spilled: %s", request, e,
+                             extra={'spider': spider})
+                self.unspilled.append(request)
+            else:
+                stats.inc_value('depth_first/spilled', spider=spider)
+        else:
+            self.held.append(request)
+        stats.max_value('depth_first/held_max', len(self), spider=spider)
+
+    def spill_queue(self):
+        if self.spilled is None:
+            directory = self.spill_dir
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.temporary_directory = tempfile.TemporaryDirectory(prefix='tfmkt-depth-first-', dir=directory)
+            self.spilled = PickleFifoDiskQueue.from_crawler(
+                self.crawler, os.path.join(self.temporary_directory.name, 'held')
+            )
+        return self.spilled
+
+    def next_held(self):
+        if self.held:
+            return self.held.popleft()
+        if self.spilled:
+            return self.spilled.pop()
+        if self.unspilled:
+            return self.unspilled.popleft()
+        return None
+
+    def release(self, **kwargs):
+        """Hand held back discovery requests over to the engine while the scheduler has room for them."""
+        while len(self) and not self.queue_is_full():
+            self.crawler.engine.crawl(self.next_held())
+
+    def spider_idle(self, spider):
+        if len(self):
+            self.release()
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        if self.spilled is not None:
+            self.spilled.close()
+            self.temporary_directory.cleanup()
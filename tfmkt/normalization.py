@@ -0,0 +1,244 @@
+"""Convert the numeric and date fields of items from display strings to typed values.
+
+Spiders emit numbers and dates as they are displayed on Transfermarkt: market
+values such as "€12.00m" or "€500k", heights such as "1,78 m", minutes played
+such as "90'", attendances such as "45.123" and dates such as "Fri, 12/18/20".
+The converters of this module parse them with precompiled patterns, and
+`NormalizationPipeline` applies them to the fields listed in
+`NORMALIZATION_FIELDS`, at any depth of the items (the players of a lineup, the
+parent of an appearance):
+
+    {"market_value": "€12.00m", "height": "1,78 m", "date": "Fri, 12/18/20"}
+    {"market_value": 12000000, "height": 1.78, "date": "2020-12-18"}
+
+Values that cannot be parsed are left as they are, and counted in the
+`normalization/unparsed` stat. Market values that spiders already parse to
+floats (25000.0) are written as integers when they are whole (25000).
+"""
+import datetime
+import re
+import typing
+
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.misc import load_object
+
+# a number written with "." or "," as decimal or thousands separator
+NUMBER_PATTERN = re.compile(r'-?\d[\d.,]*')
+# a money amount, such as "€12.00m", "€500Th.", "€1.20bn" or "18,00 Mio. €"
+MONEY_PATTERN = re.compile(
+    r'^[€£$]?\s*(?P<number>\d[\d.,]*)\s*(?P<unit>k|th\.?|tsd\.?|m|mio\.?|mil|mill\.?|bn|b|mrd\.?)?\s*[€£$]?$',
+    re.IGNORECASE
+)
+# a score, such as "2:1" or "(0:1)"
+SCORE_PATTERN = re.compile(r'(\d+):(\d+)')
+# values meaning "no value"
+EMPTY_VALUES = frozenset(('', '-', '?', '--', 'n/a', 'unknown'))
+# a trailing "(28)", as in the age following a date of birth
+TRAILING_PARENTHESES_PATTERN = re.compile(r'\s*\(.*\)$')
+
+MONEY_UNITS = {
+    'k': 1_000, 'th': 1_000, 'th.': 1_000, 'tsd': 1_000, 'tsd.': 1_000,
+    'm': 1_000_000, 'mio': 1_000_000, 'mio.': 1_000_000, 'mil': 1_000_000, 'mill': 1_000_000, 'mill.': 1_000_000,
+    'bn': 1_000_000_000, 'b': 1_000_000_000, 'mrd': 1_000_000_000, 'mrd.': 1_000_000_000,
+}
+
+# date formats found on Transfermarkt pages, tried in this order
+DATE_FORMATS = (
+    '%a, %m/%d/%y',  # Fri, 12/18/20
+    '%m/%d/%y',  # 12/18/20
+    '%b %d, %Y',  # Jul 29, 1993
+    '%d/%m/%Y',  # 29/07/1993
+    '%d.%m.%Y',  # 29.07.1993
+    '%Y-%m-%d',  # 1993-07-29
+)
+
+
+class Unparsed(ValueError):
+    """Raised by converters given a value they cannot parse."""
+
+
+def _blank(value: str) -> bool:
+    return value.strip().lower() in EMPTY_VALUES
+
+
+def _plain(number: float) -> typing.Union[int, float]:
+    return int(number) if number == int(number) else number
+
+
+def parse_number(text: str) -> float:
+    """Parse a number written with either "." or "," as decimal separator.
+
+    When both are used, the last one is the decimal separator ("1.234,5",
+    "1,234.5"). When only one is used, it is a thousands separator if it is
+    repeated or followed by exactly three digits ("45.123", "1,000,000"), and
+    the decimal separator otherwise ("12.00", "1,78").
+    """
+    if ',' in text and '.' in text:
+        decimal = ',' if text.rindex(',') > text.rindex('.') else '.'
+        thousands = '.' if decimal == ',' else ','
+        return float(text.replace(thousands, '').replace(decimal, '.'))
+    for separator in (',', '.'):
+        if separator in text:
+            integer, _, fraction = text.rpartition(separator)
+            if text.count(separator) > 1 or len(fraction) == 3:
+                return float(text.replace(separator, ''))
+            return float(f"{integer}.{fraction}")
+    return float(text)
+
+
+def integer(value: str) -> typing.Optional[int]:
+    """The first number of a text, as an integer: "90'" -> 90, "45.123" -> 45123, "(28)" -> 28."""
+    if _blank(value):
+        return None
+    match = NUMBER_PATTERN.search(value)
+    if match is None:
+        raise Unparsed(value)
+    return int(parse_number(match.group(0).rstrip('.,')))
+
+
+def number(value: str) -> typing.Optional[typing.Union[int, float]]:
+    """The first number of a text, as an integer when it is one: "2.5" -> 2.5, "40%" -> 40."""
+    if _blank(value):
+        return None
+    match = NUMBER_PATTERN.search(value)
+    if match is None:
+        raise Unparsed(value)
+    return _plain(parse_number(match.group(0).rstrip('.,')))
+
+
+def market_value(value: str) -> typing.Optional[typing.Union[int, float]]:
+    """A money amount in units: "€12.00m" -> 12000000, "€500k" -> 500000, "€1.20bn" -> 1200000000."""
+    if _blank(value):
+        return None
+    match = MONEY_PATTERN.match(value.strip())
+    if match is None:
+        raise Unparsed(value)
+    unit = MONEY_UNITS.get((match.group('unit') or '').lower(), 1)
+    return _plain(round(parse_number(match.group('number')) * unit, 2))
+
+
+def height(value: str) -> typing.Optional[float]:
+    """A height in metres: "1,78 m" -> 1.78, "178 cm" -> 1.78."""
+    metres = number(value)
+    if metres is None:
+        return None
+    return metres / 100 if metres > 3 else float(metres)
+
+
+def date(value: str) -> typing.Optional[str]:
+    """A date in ISO format: "Fri, 12/18/20" -> "2020-12-18", "Jul 29, 1993 (28)" -> "1993-07-29"."""
+    if _blank(value):
+        return None
+    text = TRAILING_PARENTHESES_PATTERN.sub('', value.strip())
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            pass
+    raise Unparsed(value)
+
+
+def score(value: str) -> typing.Optional[typing.List[int]]:
+    """A score as a pair of goals: "2:1" -> [2, 1], "(0:1)" -> [0, 1]."""
+    if _blank(value):
+        return None
+    match = SCORE_PATTERN.search(value)
+    if match is None:
+        raise Unparsed(value)
+    return [int(match.group(1)), int(match.group(2))]
+
+
+# converters that NORMALIZATION_FIELDS can refer to by name
+CONVERTERS = {
+    'integer': integer,
+    'number': number,
+    'market_value': market_value,
+    'height': height,
+    'date': date,
+    'score': score,
+}
+
+
+def converter(name: str) -> typing.Callable[[str], typing.Any]:
+    """A converter, by name (see `CONVERTERS`) or by import path."""
+    return CONVERTERS[name] if name in CONVERTERS else load_object(name)
+
+
+class Normalizer:
+    """Apply converters to the fields of items, at any depth.
+
+    Nested objects and lists are copied when one of their fields is converted,
+    so that objects shared between items (such as interned parents) are not
+    modified.
+
+    :param fields: The converter of every field, by field name.
+    :type fields: typing.Dict[str, typing.Callable[[str], typing.Any]]
+    """
+
+    def __init__(self, fields: typing.Dict[str, typing.Callable[[str], typing.Any]]):
+        self.fields = fields
+        self.unparsed = 0
+
+    def normalize(self, value):
+        if isinstance(value, dict):
+            normalized = None
+            for key, field_value in value.items():
+                converted = self.convert(key, field_value)
+                if converted is not field_value:
+                    if normalized is None:
+                        normalized = dict(value)
+                    normalized[key] = converted
+            return value if normalized is None else normalized
+        if isinstance(value, list):
+            normalized = [self.normalize(element) for element in value]
+            return value if all(a is b for a, b in zip(normalized, value)) else normalized
+        return value
+
+    def convert(self, key, value):
+        if isinstance(value, str):
+            convert = self.fields.get(key)
+            if convert is None:
+                return value
+            try:
+                return convert(value)
+            except (Unparsed, ValueError):
+                self.unparsed += 1
+                return value
+        if isinstance(value, float) and self.fields.get(key) is market_value:
+            # amounts already parsed by spiders, such as the current market value of players
+            return _plain(value)
+        return self.normalize(value)
+
+
+class NormalizationPipeline:
+    """Convert the fields listed in `NORMALIZATION_FIELDS` to typed values.
+
+    Enabled with `NORMALIZATION_ENABLED`. `NORMALIZATION_FIELDS` maps field
+    names to converters, given by name (see `CONVERTERS`) or import path.
+
+    Runs before the other pipelines, so that the entity store, the change
+    detection hashes and Parquet columns get typed values as well.
+    """
+
+    def __init__(self, crawler, normalizer: Normalizer):
+        self.crawler = crawler
+        self.normalizer = normalizer
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('NORMALIZATION_ENABLED'):
+            raise NotConfigured
+        fields = {field: converter(name) for field, name in settings.getdict('NORMALIZATION_FIELDS').items() if name}
+        return cls(crawler, Normalizer(fields))
+
+    def process_item(self, item, spider):
+        unparsed = self.normalizer.unparsed
+        normalized = self.normalizer.normalize(item if isinstance(item, dict) else dict(item))
+        if self.normalizer.unparsed > unparsed:
+            self.crawler.stats.inc_value('normalization/unparsed', self.normalizer.unparsed - unparsed, spider=spider)
+        # the item is updated in place, as components such as the checkpoint follow items by identity,
+        # while nested values are replaced rather than modified, as parents are shared between items
+        if normalized is not item:
+            item.update(normalized)
+        return item
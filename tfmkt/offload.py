@@ -0,0 +1,175 @@
+"""Run selected spider callbacks in a pool of worker processes.
+
+Callbacks like `GamesSpider.parse_game`, `ClubsSpider.parse_details` or
+`AppearancesSpider.parse_stats` spend tens of milliseconds per page in lxml.
+Run on the reactor thread, that time is taken away from the downloader. With
+`OffloadMiddleware` enabled, responses for the callbacks listed in
+`OFFLOAD_CALLBACKS` are sent to a worker process instead, where a copy of the
+spider parses them. Items and follow-up requests are sent back and handed to
+the engine asynchronously, as if the callback had run locally.
+
+Offloaded callbacks must be stateless: they run on a copy of the spider, made
+in every worker from the spider class and the scalar attributes (strings,
+numbers, booleans, frozen sets) of the spider, so changes they make to the
+spider attributes are not seen by the crawler nor by the other workers, and
+other attributes are left to the class defaults. Callbacks that read or change
+such crawl state are listed in the `stateful_callbacks` attribute of their
+spider, and are never offloaded.
+
+https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+import logging
+import os
+
+from scrapy import Request, signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import TextResponse
+from scrapy.utils.misc import load_object
+from scrapy.utils.request import request_from_dict
+from scrapy.utils.spider import iterate_spider_output
+from twisted.internet import defer, reactor
+
+logger = logging.getLogger(__name__)
+
+# spider attributes copied over to the worker spiders, other attributes are considered crawl state
+_COPIED_ATTRIBUTE_TYPES = (str, int, float, bool, frozenset, type(None))
+
+# the spider copy each worker process parses responses with
+_worker_spider = None
+
+
+def _init_worker(spidercls_path: str, attributes: dict):
+    """Create the spider copy used by a worker process."""
+    global _worker_spider
+
+    spidercls = load_object(spidercls_path)
+    _worker_spider = spidercls(entrypoints=[])
+    _worker_spider.__dict__.update(attributes)
+
+
+def _run_callback(callback_name: str, response_cls, url: str, status: int, headers: dict, body: bytes, encoding: str, cb_kwargs: dict) -> list:
+    """Run a spider callback in a worker process.
+
+    :return: The callback output, with requests serialized as dicts.
+    :rtype: list
+    """
+    request = Request(url, cb_kwargs=cb_kwargs)
+    response = response_cls(url=url, status=status, headers=headers, body=body, encoding=encoding, request=request)
+
+    output = []
+    callback = getattr(_worker_spider, callback_name)
+    for result in iterate_spider_output(callback(response, **cb_kwargs)):
+        if isinstance(result, Request):
+            output.append(('request', result.to_dict(spider=_worker_spider)))
+        else:
+            output.append(('item', result))
+    return output
+
+
+class OffloadMiddleware:
+    """Downloader middleware that sends the responses of selected callbacks to worker processes.
+
+    Enabled by listing callback names in the `OFFLOAD_CALLBACKS` setting. The
+    size of the pool is set with `OFFLOAD_WORKERS` (defaults to the number of CPUs).
+    Callbacks listed in the `stateful_callbacks` attribute of the spider are not
+    offloaded.
+    """
+
+    def __init__(self, callbacks, workers):
+        self.callbacks = set(callbacks)
+        self.workers = workers
+        self.executor = None
+        self.spider = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        callbacks = crawler.settings.getlist('OFFLOAD_CALLBACKS')
+        stateful = set(callbacks) & set(getattr(crawler.spidercls, 'stateful_callbacks', ()))
+        if stateful:
+            logger.warning("Not offloading callbacks %s of the %s spider, they depend on the spider state",
+                           sorted(stateful), crawler.spidercls.name)
+            callbacks = [callback for callback in callbacks if callback not in stateful]
+        if not callbacks:
+            raise NotConfigured
+        workers = crawler.settings.getint('OFFLOAD_WORKERS') or os.cpu_count()
+
+        middleware = cls(callbacks, workers)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        attributes = {
+            key: value for key, value in vars(spider).items()
+            if isinstance(value, _COPIED_ATTRIBUTE_TYPES)
+        }
+        spidercls = type(spider)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(f"{spidercls.__module__}.{spidercls.__qualname__}", attributes)
+        )
+        spider.logger.info("Offloading callbacks %s to %d worker processes", sorted(self.callbacks), self.workers)
+
+    def spider_closed(self, spider):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def process_response(self, request, response, spider):
+        callback = request.callback
+        if (
+            isinstance(response, TextResponse)
+            and callback is not None
+            and getattr(callback, '__name__', None) in self.callbacks
+            and getattr(callback, '__self__', None) is spider
+        ):
+            request.meta['offloaded_callback'] = callback.__name__
+            request.callback = self.offloaded_callback
+        return response
+
+    def offloaded_callback(self, response, **cb_kwargs):
+        """Stand-in callback that runs the original one in the worker pool.
+
+        :return: A deferred that fires with the callback output.
+        :rtype: twisted.internet.defer.Deferred
+        """
+        future = self.submit(response, cb_kwargs)
+
+        d = defer.Deferred()
+        future.add_done_callback(lambda f: reactor.callFromThread(self._fire, d, f))
+        d.addCallback(self._rebuild_output)
+        return d
+
+    def submit(self, response, cb_kwargs: dict) -> Future:
+        """Send a response to the worker pool, to be parsed by its offloaded callback.
+
+        :return: A future of the callback output, with requests serialized as dicts.
+        :rtype: concurrent.futures.Future
+        """
+        return self.executor.submit(
+            _run_callback,
+            response.meta['offloaded_callback'],
+            type(response),
+            response.url,
+            response.status,
+            response.headers.to_unicode_dict(),
+            response.body,
+            response.encoding,
+            cb_kwargs
+        )
+
+    def _fire(self, d, future):
+        exception = future.exception()
+        if exception is not None:
+            d.errback(exception)
+        else:
+            d.callback(future.result())
+
+    def _rebuild_output(self, output):
+        return [
+            request_from_dict(value, spider=self.spider) if kind == 'request' else value
+            for kind, value in output
+        ]
@@ -0,0 +1,190 @@
+"""Run several crawlers of the Transfermarkt hierarchy in a single process.
+
+The spiders in this project are meant to be chained, each one consuming the
+output of the previous one as its "parents"
+
+    confederations -> competitions -> clubs -> players -> appearances
+
+Chaining them with shell pipes means that every item is serialized to JSON,
+written to a pipe, parsed back by the next process and stripped of its own
+`parent` key. The orchestrator in this module runs all the stages in the same
+`CrawlerProcess` instead, and hands the items scraped by a stage over to the
+next stage as entrypoints through a bounded in-memory queue. Stages overlap:
+the clubs of the first competition are being crawled while competitions are
+still being discovered.
+"""
+from collections import deque
+import logging
+import typing
+
+from scrapy import signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import DontCloseSpider
+
+from tfmkt.utils import pause_engine, unpause_engine
+
+logger = logging.getLogger(__name__)
+
+# settings applied to every stage so that all of them share one HTTP cache and
+# one connection pool
+SHARED_SETTINGS = {
+    'HTTPCACHE_STORAGE': 'tfmkt.httpcache.SharedFilesystemCacheStorage',
+    'DOWNLOAD_HANDLERS': {
+        'http': 'tfmkt.handlers.SharedPoolHTTP11DownloadHandler',
+        'https': 'tfmkt.handlers.SharedPoolHTTP11DownloadHandler',
+    },
+}
+
+
+def as_entrypoint(item) -> dict:
+    """Turn an item scraped by a stage into a parent object for the next one.
+
+    This is the in-memory equivalent of dumping the item as a JSON line and
+    reading it back in `BaseSpider`: the item is copied and its own `parent`
+    is dropped, as 2nd level parents are redundant.
+
+    :param item: An item scraped by the upstream stage.
+    :type item: dict
+    :return: A new parent object.
+    :rtype: dict
+    """
+    return {key: value for key, value in dict(item).items() if key != 'parent'}
+
+
+class StageFeeder:
+    """Feeds the items scraped by one crawler as entrypoints of another one.
+
+    Items are buffered in a queue of at most `queue_size` parents. When the
+    queue is full the upstream engine is paused, and it is resumed once the
+    downstream stage has drained it to half its size. Parents are only handed
+    over to the downstream engine while it has less than `max_outstanding`
+    requests scheduled or in progress, so the downstream scheduler does not
+    grow unbounded either.
+    """
+
+    def __init__(self, upstream: Crawler, downstream: Crawler, queue_size: int = 1000, max_outstanding: int = 100):
+        self.upstream = upstream
+        self.downstream = downstream
+        self.queue_size = queue_size
+        self.max_outstanding = max_outstanding
+
+        self.queue = deque()
+        self.upstream_paused = False
+        self.upstream_finished = False
+        self.downstream_open = False
+
+        upstream.signals.connect(self.upstream_item_scraped, signal=signals.item_scraped)
+        upstream.signals.connect(self.upstream_closed, signal=signals.spider_closed)
+
+        downstream.signals.connect(self.downstream_opened, signal=signals.spider_opened)
+        downstream.signals.connect(self.downstream_idle, signal=signals.spider_idle)
+        # responses served from the HTTP cache never reach the downloader, so the
+        # downstream progress is read from the engine rather than counted with
+        # request_reached_downloader/request_left_downloader
+        downstream.signals.connect(self.request_finished, signal=signals.response_received)
+        downstream.signals.connect(self.request_finished, signal=signals.request_dropped)
+
+    def upstream_item_scraped(self, item, response, spider):
+        self.queue.append(as_entrypoint(item))
+        if len(self.queue) >= self.queue_size and not self.upstream_paused:
+            logger.debug("Queue for '%s' is full, pausing '%s'", self.downstream.spidercls.name, spider.name)
+            pause_engine(self.upstream)
+            self.upstream_paused = True
+        self.feed()
+
+    def upstream_closed(self, spider, reason):
+        self.upstream_finished = True
+        self.feed()
+
+    def downstream_opened(self, spider):
+        self.downstream_open = True
+        self.feed()
+
+    def downstream_idle(self, spider):
+        self.feed()
+        if self.queue or not self.upstream_finished:
+            raise DontCloseSpider
+
+    def request_finished(self, request, spider, **kwargs):
+        self.feed()
+
+    @property
+    def outstanding(self) -> int:
+        """Number of requests waiting in the downstream scheduler or being processed by its engine."""
+        slot = self.downstream.engine.slot
+        if slot is None:
+            return 0
+        return len(slot.scheduler) + len(slot.inprogress)
+
+    def feed(self):
+        """Hand over queued parents to the downstream engine while it has room for them."""
+        if not self.downstream_open or self.downstream.engine.slot is None:
+            return
+
+        spider = self.downstream.spider
+        while self.queue and self.outstanding < self.max_outstanding:
+            for request in spider.entrypoint_requests(self.queue.popleft()):
+                self.downstream.engine.crawl(request)
+
+        if self.upstream_paused and len(self.queue) <= self.queue_size // 2:
+            logger.debug("Queue for '%s' drained, resuming upstream", spider.name)
+            unpause_engine(self.upstream)
+            self.upstream_paused = False
+
+
+class Stage(typing.NamedTuple):
+    """A spider to be run as part of a chain of stages.
+
+    :param name: The name of the spider.
+    :param kwargs: Spider arguments for this stage.
+    :param output: An optional feed URI where the stage items are exported to.
+    """
+    name: str
+    kwargs: dict = {}
+    output: typing.Optional[str] = None
+
+
+def chain_stages(process, stages: typing.List[Stage], queue_size: int = 1000, max_outstanding: int = 100) -> typing.List[StageFeeder]:
+    """Schedule a chain of stages to be run by a `CrawlerProcess`.
+
+    The first stage reads its parents as usual (from the `parents` argument,
+    stdin or `scrape_parents`), while every other stage is fed in-memory with
+    the items of the stage before. Stages only export their items when an
+    `output` is given.
+
+    :param process: The crawler process to run the stages with.
+    :type process: scrapy.crawler.CrawlerProcess
+    :param stages: The stages, in hierarchy order.
+    :type stages: typing.List[Stage]
+    :param queue_size: Maximum number of parents buffered between two stages.
+    :type queue_size: int
+    :param max_outstanding: Maximum number of requests in flight per downstream stage
+      before more parents are handed over to it.
+    :type max_outstanding: int
+    :return: The feeders connecting the stages. Signal handlers are weakly referenced,
+      so they need to be kept around for as long as the process runs.
+    :rtype: typing.List[StageFeeder]
+    """
+    crawlers = []
+    feeders = []
+    for index, stage in enumerate(stages):
+        settings = process.settings.copy()
+        settings.setdict(SHARED_SETTINGS, priority='cmdline')
+        # never fall back to the project-wide 'stdout:' feed, only export what was asked for
+        settings.set('FEED_URI', None, priority='cmdline')
+        settings.set('FEEDS', {stage.output: {'format': 'jsonlines'}} if stage.output else {}, priority='cmdline')
+
+        spidercls = process.spider_loader.load(stage.name)
+        crawler = Crawler(spidercls, settings)
+
+        kwargs = dict(stage.kwargs)
+        if index > 0:
+            kwargs['entrypoints'] = []
+            feeders.append(
+                StageFeeder(crawlers[-1], crawler, queue_size=queue_size, max_outstanding=max_outstanding)
+            )
+
+        process.crawl(crawler, **kwargs)
+        crawlers.append(crawler)
+
+    return feeders
@@ -0,0 +1,244 @@
+"""Keep a single copy of every parent object.
+
+Requests carry their parent object in `cb_kwargs`, and items embed it. Parents
+read from JSON lines get a new dict for every line they appear in (the
+competition of every game in a games file, for instance), and requests
+serialized to the disk queues of `JOBDIR` carry a full copy each.
+
+`ParentInterningMiddleware` registers every parent in a `ParentRegistry`, which
+keeps one instance per distinct parent:
+
+* requests leaving the spider carry a `ParentRef` instead of their parent, which
+  is resolved back to the registered instance before the callback is called,
+* the parent of items is replaced with the registered instance, so that equal
+  parents share one dict until the items are exported. The exported output does
+  not change.
+
+The registry only holds the `PARENT_INTERNING_MAX_PARENTS` parents used most
+recently. References held in memory keep their parent alive by themselves, so
+evicting a parent from the registry only means that an equal parent seen later
+gets an instance of its own, and parents are freed once no request or item
+uses them anymore.
+
+References pickled (to the disk queue of `JOBDIR`, or to the spill files of
+`DepthFirstMiddleware`) only keep the href and number of their parent, which
+is appended to the registry file as it is pickled, and are resolved by reading
+its line back, at an offset kept in memory. With `JOBDIR`, the file is
+`JOBDIR/parents.jsonl`, so that the next run can resolve them as well, and a
+temporary file otherwise.
+"""
+from collections import OrderedDict
+from pathlib import Path
+import json
+import tempfile
+import typing
+
+from scrapy import Request, signals
+from scrapy.exceptions import NotConfigured
+
+PARENT_KEY = 'parent'
+
+
+class ParentRef(typing.NamedTuple):
+    """A reference to a parent registered in a `ParentRegistry`."""
+
+    href: str
+    # number of the parent in the registry
+    variant: int
+
+
+class LiveParentRef(ParentRef):
+    """A `ParentRef` holding its parent, which is written to its registry file when the reference is pickled."""
+
+    def __reduce__(self):
+        self.registry.persist(self)
+        return ParentRef, (self.href, self.variant)
+
+
+def content_key(parent: dict) -> str:
+    return json.dumps(parent, sort_keys=True, default=str)
+
+
+class ParentRegistry:
+    """Registry of distinct parent objects, least recently used ones evicted first.
+
+    Distinct parents sharing an href (as when different spiders emitted the
+    same entity with different fields) are told apart by their contents.
+
+    :param path: Optional JSON lines file the parents of pickled references are
+      appended to, and references not holding their parent are resolved from.
+      A temporary file is used without one.
+    :type path: str
+    :param max_size: Maximum number of parents held, 0 for no limit.
+    :type max_size: int
+    """
+
+    def __init__(self, path: str = None, max_size: int = 0):
+        self.max_size = max_size
+        # (href, contents) -> live reference to the registered parent, least recently used first
+        self.entries = OrderedDict()
+        # id of a registered instance -> its entry key, to skip serializing parents interned already
+        self.keys_by_id = {}
+        # number of the last parent registered
+        self.count = 0
+        # parents registered and evicted by this instance
+        self.registered = 0
+        self.evicted = 0
+        # parent number -> offset of its line in the file, for the parents written to it
+        self.offsets = {}
+        # opened on the first write without a path
+        self.file = None
+        if path is not None:
+            if Path(path).exists():
+                with open(path, 'rb') as f:
+                    offset = 0
+                    for line in f:
+                        if line.strip():
+                            variant = json.loads(line)['variant']
+                            self.offsets[variant] = offset
+                            self.count = max(self.count, variant)
+                        offset += len(line)
+            self.file = open(path, 'a+b')
+
+    def __len__(self):
+        return len(self.entries)
+
+    def intern(self, parent: dict) -> ParentRef:
+        """Register a parent, unless an equal one is registered already.
+
+        :param parent: A parent object, with an "href".
+        :type parent: dict
+        :return: The reference of the registered parent, which holds it.
+        :rtype: ParentRef
+        """
+        key = self.keys_by_id.get(id(parent))
+        if key is None:
+            key = (parent.get('href') or '', content_key(parent))
+        ref = self.entries.get(key)
+        if ref is not None:
+            self.entries.move_to_end(key)
+            return ref
+
+        self.count += 1
+        self.registered += 1
+        return self.register(key, parent, self.count)
+
+    def register(self, key, parent, variant):
+        ref = LiveParentRef(key[0], variant)
+        ref.parent = parent
+        ref.registry = self
+        self.entries[key] = ref
+        self.keys_by_id[id(parent)] = key
+        while self.max_size and len(self.entries) > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            del self.keys_by_id[id(evicted.parent)]
+            self.evicted += 1
+        return ref
+
+    def persist(self, ref: LiveParentRef):
+        """Write the parent of a reference to the file, unless it is written already."""
+        if ref.variant in self.offsets:
+            return
+        if self.file is None:
+            self.file = tempfile.TemporaryFile()
+        self.file.seek(0, 2)
+        self.offsets[ref.variant] = self.file.tell()
+        self.file.write(json.dumps({'href': ref.href, 'variant': ref.variant, 'parent': ref.parent}).encode('utf-8') + b'\n')
+        self.file.flush()
+
+    def resolve(self, ref: ParentRef) -> dict:
+        """The parent of a reference, read back from the file for references that were pickled."""
+        if isinstance(ref, LiveParentRef):
+            return ref.parent
+        offset = self.offsets.get(ref.variant)
+        if offset is None:
+            raise KeyError(f"Unknown parent reference {ref}")
+        self.file.seek(offset)
+        parent = json.loads(self.file.readline())['parent']
+        key = (ref.href, content_key(parent))
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key].parent
+        # registered again under its number, its line is in the file already
+        return self.register(key, parent, ref.variant).parent
+
+    def canonical(self, parent: dict) -> dict:
+        """The registered instance equal to a parent."""
+        return self.intern(parent).parent
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def is_parent(value) -> bool:
+    return isinstance(value, dict) and 'href' in value
+
+
+class ParentInterningMiddleware:
+    """Spider middleware replacing the parents of requests with references, and interning the parents of items.
+
+    Parents are looked for in the `parent` argument of callbacks, and one level
+    down in their dict arguments (`base={'parent': ...}`). Enabled unless
+    `PARENT_INTERNING_ENABLED` is false. The registry holds
+    `PARENT_INTERNING_MAX_PARENTS` parents at most.
+    """
+
+    def __init__(self, crawler, registry: ParentRegistry):
+        self.crawler = crawler
+        self.registry = registry
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('PARENT_INTERNING_ENABLED'):
+            raise NotConfigured
+        path = None
+        if settings.get('JOBDIR'):
+            Path(settings['JOBDIR']).mkdir(parents=True, exist_ok=True)
+            path = str(Path(settings['JOBDIR'], 'parents.jsonl'))
+        return cls(crawler, ParentRegistry(path, settings.getint('PARENT_INTERNING_MAX_PARENTS')))
+
+    def spider_closed(self, spider):
+        self.crawler.stats.set_value('parents/interned', self.registry.registered, spider=spider)
+        self.crawler.stats.set_value('parents/evicted', self.registry.evicted, spider=spider)
+        self.registry.close()
+
+    def reference(self, value):
+        if is_parent(value):
+            self.crawler.stats.inc_value('parents/references', spider=self.crawler.spider)
+            return self.registry.intern(value)
+        return value
+
+    def dereference(self, value):
+        return self.registry.resolve(value) if isinstance(value, ParentRef) else value
+
+    def reference_request(self, request):
+        for name, value in list(request.cb_kwargs.items()):
+            if name == PARENT_KEY:
+                request.cb_kwargs[name] = self.reference(value)
+            elif isinstance(value, dict) and is_parent(value.get(PARENT_KEY)):
+                request.cb_kwargs[name] = {**value, PARENT_KEY: self.reference(value[PARENT_KEY])}
+        return request
+
+    def process_start_requests(self, start_requests, spider):
+        for request in start_requests:
+            yield self.reference_request(request)
+
+    def process_spider_input(self, response, spider):
+        cb_kwargs = response.request.cb_kwargs
+        for name, value in list(cb_kwargs.items()):
+            if name == PARENT_KEY:
+                cb_kwargs[name] = self.dereference(value)
+            elif isinstance(value, dict) and isinstance(value.get(PARENT_KEY), ParentRef):
+                cb_kwargs[name] = {**value, PARENT_KEY: self.dereference(value[PARENT_KEY])}
+
+    def process_spider_output(self, response, result, spider):
+        for element in result:
+            if isinstance(element, Request):
+                yield self.reference_request(element)
+            else:
+                if is_parent(element.get(PARENT_KEY)):
+                    element[PARENT_KEY] = self.registry.canonical(element[PARENT_KEY])
+                yield element
@@ -0,0 +1,678 @@
+"""Item pipelines of the project.
+
+https://docs.scrapy.org/en/latest/topics/item-pipeline.html
+"""
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider, DropItem, NotConfigured
+from scrapy.utils.serialize import ScrapyJSONEncoder
+
+from tfmkt.index import IndexWriter, index_path
+from tfmkt.keys import ENTITY_KEY_FIELDS, item_key
+from tfmkt.parents import content_key, is_parent
+from tfmkt.store import EntityStore
+from tfmkt.urls import entity_id, split_path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+class ChangeDetectionPipeline:
+    """Drop items whose content did not change since the previous run.
+
+    Every item with an entity key (see `ENTITY_KEY_FIELDS`) is hashed, and the
+    hash compared with the one recorded in the index file given by
+    `CHANGE_DETECTION_INDEX`. Items that are new or changed go through, others
+    are dropped. Items of other types are not looked at. The index is updated at
+    the end of the crawl.
+
+    With `CHANGE_DETECTION_TOMBSTONES`, an item
+        {"type": "club", "href": "...", "parent": {"href": "..."}, "deleted": true}
+    is emitted at the end of the crawl for every entity of the index that was
+    not scraped again, although other entities of its parent were.
+
+    Top level fields listed in `CHANGE_DETECTION_IGNORED_FIELDS` are left out
+    of the hash.
+    """
+
+    def __init__(self, crawler, index_path, tombstones, ignored_fields):
+        self.crawler = crawler
+        self.index_path = Path(index_path)
+        self.tombstones = tombstones
+        self.ignored_fields = set(ignored_fields)
+
+        # (type, key) -> (hash, parent href)
+        self.index = self.read_index()
+        self.seen = set()
+        self.parents_seen = set()
+        self.tombstones_sent = False
+
+        if tombstones:
+            crawler.signals.connect(self.spider_idle, signal=signals.spider_idle)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        index_path = settings.get('CHANGE_DETECTION_INDEX')
+        if not index_path:
+            raise NotConfigured
+        return cls(
+            crawler,
+            index_path,
+            settings.getbool('CHANGE_DETECTION_TOMBSTONES'),
+            settings.getlist('CHANGE_DETECTION_IGNORED_FIELDS')
+        )
+
+    def read_index(self) -> dict:
+        index = {}
+        if self.index_path.exists():
+            with open(self.index_path) as f:
+                for line in f:
+                    entity_type, key, digest, parent = line.rstrip('\n').split('\t')
+                    index[(entity_type, key)] = (digest, parent)
+        return index
+
+    def write_index(self):
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.index_path.with_name(self.index_path.name + '.tmp')
+        with open(temporary_path, 'w') as f:
+            for (entity_type, key), (digest, parent) in self.index.items():
+                f.write(f"{entity_type}\t{key}\t{digest}\t{parent}\n")
+        os.replace(temporary_path, self.index_path)
+
+    def content_hash(self, item) -> str:
+        content = {key: value for key, value in dict(item).items() if key not in self.ignored_fields}
+        serialized = json.dumps(content, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+    def process_item(self, item, spider):
+        entity_type = item.get('type')
+        key_field = ENTITY_KEY_FIELDS.get(entity_type)
+        if key_field is None or item.get(key_field) is None or item.get('deleted'):
+            return item
+
+        entity = (entity_type, str(item[key_field]))
+        parent = (item.get('parent') or {}).get('href') or ''
+        digest = self.content_hash(item)
+
+        self.seen.add(entity)
+        self.parents_seen.add(parent)
+        previous = self.index.get(entity)
+        self.index[entity] = (digest, parent)
+
+        stats = self.crawler.stats
+        if previous is None:
+            stats.inc_value('change_detection/new', spider=spider)
+        elif previous[0] != digest:
+            stats.inc_value('change_detection/changed', spider=spider)
+        else:
+            stats.inc_value('change_detection/unchanged', spider=spider)
+            raise DropItem(f"Unchanged {entity_type} {entity[1]}")
+        return item
+
+    def deleted_entities(self):
+        return [
+            (entity, parent) for entity, (_, parent) in self.index.items()
+            if entity not in self.seen and parent in self.parents_seen
+        ]
+
+    def spider_idle(self, spider):
+        if self.tombstones_sent:
+            return
+        self.tombstones_sent = True
+        if self.deleted_entities():
+            self.crawler.engine.crawl(Request('data:,', callback=self.emit_tombstones, dont_filter=True))
+            raise DontCloseSpider
+
+    def emit_tombstones(self, response):
+        for (entity_type, key), parent in self.deleted_entities():
+            del self.index[(entity_type, key)]
+            self.crawler.stats.inc_value('change_detection/deleted', spider=self.crawler.spider)
+            yield {
+                'type': entity_type,
+                ENTITY_KEY_FIELDS[entity_type]: int(key) if ENTITY_KEY_FIELDS[entity_type] == 'game_id' else key,
+                'parent': {'href': parent},
+                'deleted': True
+            }
+
+    def close_spider(self, spider):
+        self.write_index()
+
+
+class EntityStorePipeline:
+    """Upsert every entity scraped into the SQLite entity store given by `ENTITY_STORE`.
+
+    Items with an entity key (see `ENTITY_KEY_FIELDS`) replace the stored version
+    of their entity, and update its `last_scraped_at`; tombstones delete it.
+    Changes are committed every `ENTITY_STORE_COMMIT_SIZE` items, and at the end
+    of the crawl. See `tfmkt.store.EntityStore`.
+
+    Runs before `ChangeDetectionPipeline`, so that unchanged entities are
+    recorded as scraped as well.
+    """
+
+    def __init__(self, crawler, path, commit_size):
+        self.crawler = crawler
+        self.path = Path(path)
+        self.commit_size = commit_size
+        self.store = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        path = settings.get('ENTITY_STORE')
+        if not path:
+            raise NotConfigured
+        return cls(crawler, path, settings.getint('ENTITY_STORE_COMMIT_SIZE'))
+
+    def open_spider(self, spider):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.store = EntityStore(str(self.path), commit_size=self.commit_size)
+
+    def close_spider(self, spider):
+        self.store.close()
+
+    def process_item(self, item, spider):
+        entity_type = item.get('type')
+        key_field = ENTITY_KEY_FIELDS.get(entity_type)
+        if key_field is None or item.get(key_field) is None:
+            return item
+
+        if item.get('deleted'):
+            self.store.delete(entity_type, item[key_field])
+            self.crawler.stats.inc_value('entity_store/deleted', spider=spider)
+        else:
+            self.store.upsert(entity_type, item[key_field], dict(item))
+            self.crawler.stats.inc_value('entity_store/upserted', spider=spider)
+        return item
+
+
+class NormalizedOutputPipeline:
+    """Write every distinct parent once to a side table, and have items reference it.
+
+    Exported items repeat their whole parent object: the competition of every
+    game, the player of every appearance. With `NORMALIZED_OUTPUT_PARENTS` set
+    to the path of a JSON lines file, the `parent` of items is replaced with the
+    key of the parent, and each distinct parent is written once to that file,
+    along with its key:
+
+        {"type": "game", "href": "...", "parent": "/super-lig/startseite/wettbewerb/TR1", ...}
+        {"key": "/super-lig/startseite/wettbewerb/TR1", "type": "competition", "href": "...", ...}
+
+    The key of a parent is its href, suffixed with "#<n>" for the n-th distinct
+    parent sharing the same href. Fields listed in `NORMALIZED_OUTPUT_DROPPED_FIELDS`
+    (derived ones such as `seasoned_href`) are left out of items and parents.
+
+    Runs last (990 in `ITEM_PIPELINES`): the other pipelines read the parent
+    of items and its derived fields, and the Parquet and partitioned outputs
+    keep full parents. Only the feed exports get the normalized items.
+    """
+
+    def __init__(self, parents_path, dropped_fields):
+        self.parents_path = Path(parents_path)
+        self.dropped_fields = set(dropped_fields)
+        # (href, contents) -> key of the distinct parents written
+        self.keys = {}
+        # href -> number of distinct parents written with it
+        self.variants = {}
+        self.file = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        parents_path = settings.get('NORMALIZED_OUTPUT_PARENTS')
+        if not parents_path:
+            raise NotConfigured
+        return cls(parents_path, settings.getlist('NORMALIZED_OUTPUT_DROPPED_FIELDS'))
+
+    def open_spider(self, spider):
+        self.parents_path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.parents_path, 'w')
+
+    def close_spider(self, spider):
+        self.file.close()
+
+    def parent_key(self, parent: dict) -> str:
+        parent = {key: value for key, value in parent.items() if key not in self.dropped_fields}
+        href = parent.get('href') or ''
+        entry = (href, content_key(parent))
+        key = self.keys.get(entry)
+        if key is None:
+            variant = self.variants.get(href, 0)
+            self.variants[href] = variant + 1
+            key = self.keys[entry] = href if variant == 0 else f"{href}#{variant}"
+            self.file.write(json.dumps({'key': key, **parent}) + '\n')
+            self.file.flush()
+        return key
+
+    def process_item(self, item, spider):
+        for field in self.dropped_fields:
+            item.pop(field, None)
+        if is_parent(item.get('parent')):
+            item['parent'] = self.parent_key(item['parent'])
+        return item
+
+
+def flatten(item: dict, prefix: str = '') -> dict:
+    """Flatten nested objects into dotted keys, e.g. {"home_club": {"href": ...}} into {"home_club.href": ...}.
+
+    Lists are encoded as JSON strings, as their elements do not map to columns.
+    """
+    flat = {}
+    for key, value in item.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (list, tuple)):
+            flat[f"{prefix}{key}"] = json.dumps(value, default=str)
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def item_season(item, spider) -> str:
+    """The season of an item: the `season` argument of the spider, or else the `saison_id` of the item href
+    or of its parent href, "unknown" when none is found."""
+    season = getattr(spider, 'season', None)
+    if season is not None:
+        return str(season)
+    parent = item.get('parent')
+    for href in (item.get('href'), parent.get('href') if isinstance(parent, dict) else None):
+        path = split_path(href)
+        if path is not None and path.param('saison_id'):
+            return path.param('saison_id')
+    return 'unknown'
+
+
+class ParquetExportPipeline:
+    """Write items to Parquet files, partitioned by item type and season.
+
+    With `PARQUET_OUTPUT_DIR` set, items are flattened (see `flatten`) and
+    written under `<PARQUET_OUTPUT_DIR>/type=<type>/season=<season>/`, in the
+    Hive partitioning layout understood by Arrow, Spark or DuckDB (see
+    `item_season` for the season).
+
+    Rows are buffered per partition and written as a row group every
+    `PARQUET_ROW_GROUP_SIZE` items, which bounds memory. The columns of a file
+    are the ones of its first row group: when items with other columns or types
+    come up, a new file is started in the partition.
+
+    Requires pyarrow (`pip install pyarrow`).
+    """
+
+    def __init__(self, stats, output_dir, row_group_size, compression):
+        self.stats = stats
+        self.output_dir = Path(output_dir)
+        self.row_group_size = row_group_size
+        self.compression = compression
+        # partition -> rows waiting to be written
+        self.rows = {}
+        # partition -> (writer, schema) of its current file
+        self.writers = {}
+        # partition -> number of files started
+        self.parts = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        output_dir = settings.get('PARQUET_OUTPUT_DIR')
+        if not output_dir:
+            raise NotConfigured
+        if pyarrow is None:
+            raise ImportError("PARQUET_OUTPUT_DIR requires pyarrow, install it with: pip install pyarrow")
+        return cls(
+            crawler.stats,
+            output_dir,
+            settings.getint('PARQUET_ROW_GROUP_SIZE'),
+            settings.get('PARQUET_COMPRESSION')
+        )
+
+    def process_item(self, item, spider):
+        partition = (str(item.get('type') or 'unknown'), item_season(item, spider))
+        rows = self.rows.setdefault(partition, [])
+        rows.append(flatten(dict(item)))
+        if len(rows) >= self.row_group_size:
+            self.write(partition)
+        return item
+
+    def open_writer(self, partition, table):
+        entity_type, season = partition
+        directory = self.output_dir / f"type={entity_type}" / f"season={season}"
+        directory.mkdir(parents=True, exist_ok=True)
+        part = self.parts.get(partition, 0)
+        self.parts[partition] = part + 1
+        writer = pyarrow.parquet.ParquetWriter(
+            str(directory / f"part-{part:05d}.parquet"), table.schema, compression=self.compression
+        )
+        self.writers[partition] = (writer, table.schema)
+        return writer
+
+    @staticmethod
+    def table(rows):
+        """A table of rows, with the columns of all the rows (`Table.from_pylist` only takes the ones of the first)."""
+        columns = dict.fromkeys(key for row in rows for key in row)
+        return pyarrow.Table.from_pydict({column: [row.get(column) for row in rows] for column in columns})
+
+    def write(self, partition):
+        """Write the rows buffered for a partition as a row group."""
+        rows = self.rows.pop(partition, [])
+        if not rows:
+            return
+        current = self.writers.get(partition)
+        table = None
+        if current is not None:
+            writer, schema = current
+            columns = set(schema.names)
+            if all(columns.issuperset(row) for row in rows):
+                try:
+                    table = pyarrow.Table.from_pylist(rows, schema=schema)
+                except (pyarrow.ArrowException, TypeError):
+                    table = None
+            if table is None:
+                writer.close()
+                self.stats.inc_value('parquet/schema_changes')
+        if table is None:
+            try:
+                table = self.table(rows)
+            except (pyarrow.ArrowException, TypeError):
+                # values of different types in a column, such as numbers and strings
+                self.stats.inc_value('parquet/stringified_row_groups')
+                table = self.table([
+                    {key: None if value is None else str(value) for key, value in row.items()} for row in rows
+                ])
+            writer = self.open_writer(partition, table)
+        writer.write_table(table)
+        self.stats.inc_value('parquet/row_groups')
+        self.stats.inc_value('parquet/rows', len(rows))
+
+    def close_spider(self, spider):
+        for partition in list(self.rows):
+            self.write(partition)
+        for writer, _ in self.writers.values():
+            writer.close()
+
+
+class PartFile:
+    """A part file of a partition, written as JSON lines and compressed on the fly.
+
+    gzip parts are written as a series of gzip members of about `CHUNK_SIZE`
+    bytes each, compressed in parallel by the thread pool of the pipeline (zlib
+    releases the GIL) and written in order. zstd parts are compressed by the
+    worker threads of zstd itself. Either way the file reads as a single stream
+    (`gzip.open`, `zcat`, `zstd -d`).
+
+    :param path: Path of the file.
+    :param compression: "gzip", "zstd", or None.
+    :param executor: Thread pool compressing the chunks of gzip parts.
+    :param threads: Number of compression threads.
+    :param level: Compression level.
+    :param index: Whether to write an index of the entity keys of the part (not supported for zstd).
+    """
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, path: Path, compression, executor, threads, level, index: bool = False):
+        self.path = path
+        self.compression = compression
+        self.executor = executor
+        self.threads = threads
+        self.level = level
+        self.rows = 0
+        self.size = 0
+        self.checksum = hashlib.sha256()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(path, 'wb')
+        self.chunk = []
+        self.chunk_size = 0
+        # (key, offset, length) of the lines of the chunk with an entity key
+        self.chunk_keys = []
+        # compressed chunks and their keys, in file order
+        self.pending = deque()
+        self.index = IndexWriter(index_path(path)) if index and compression != 'zstd' else None
+        self.compressor = None
+        if compression == 'zstd':
+            self.compressor = zstandard.ZstdCompressor(level=level, threads=threads).stream_writer(self, closefd=False)
+
+    def write(self, data: bytes):
+        """Write compressed bytes to the file (also called by the zstd stream writer)."""
+        self.checksum.update(data)
+        return self.file.write(data)
+
+    def add(self, line: bytes, key: str = None):
+        self.rows += 1
+        if self.compressor is not None:
+            self.size += len(line)
+            self.compressor.write(line)
+            return
+        if key is not None and self.index is not None:
+            # plain parts are indexed by file offset, gzip ones by offset in the chunk
+            offset = self.size if self.compression is None else self.chunk_size
+            self.chunk_keys.append((key, offset, len(line)))
+        self.size += len(line)
+        self.chunk.append(line)
+        self.chunk_size += len(line)
+        if self.chunk_size >= self.CHUNK_SIZE:
+            self.flush_chunk()
+
+    def flush_chunk(self):
+        chunk, keys = b''.join(self.chunk), self.chunk_keys
+        self.chunk, self.chunk_size, self.chunk_keys = [], 0, []
+        if not chunk:
+            return
+        if self.compression != 'gzip':
+            self.write_chunk(chunk, keys, compressed=False)
+            return
+        self.pending.append((self.executor.submit(gzip.compress, chunk, self.level), keys))
+        # write the chunks compressed so far, and wait for the oldest ones when too many are in flight
+        while self.pending and (self.pending[0][0].done() or len(self.pending) > self.threads * 2):
+            future, keys = self.pending.popleft()
+            self.write_chunk(future.result(), keys, compressed=True)
+
+    def write_chunk(self, data: bytes, keys, compressed: bool):
+        block = self.file.tell() if compressed else None
+        self.write(data)
+        if self.index is not None:
+            for key, offset, length in keys:
+                self.index.add(key, offset, length, block=block)
+
+    def close(self) -> dict:
+        """Close the file.
+
+        :return: The manifest entry of the file, without its path.
+        :rtype: dict
+        """
+        if self.compressor is not None:
+            self.compressor.close()
+        else:
+            self.flush_chunk()
+            while self.pending:
+                future, keys = self.pending.popleft()
+                self.write_chunk(future.result(), keys, compressed=True)
+        self.file.close()
+        if self.index is not None:
+            self.index.close()
+        return {
+            'rows': self.rows,
+            'bytes': self.path.stat().st_size,
+            'uncompressed_bytes': self.size,
+            'sha256': self.checksum.hexdigest(),
+            'compression': self.compression
+        }
+
+
+class PartitionedOutputPipeline:
+    """Write items to JSON lines files partitioned by a key template, rotated and compressed.
+
+    With `PARTITIONED_OUTPUT_DIR` set, every item is written to the partition
+    given by `PARTITIONED_OUTPUT_TEMPLATE`, a `str.format` template over the
+    top level fields of the item, `season` (see `item_season`),
+    `competition_code` (of the item, its href or its parent href) and `spider`:
+
+        type={type}/season={season}/competition={competition_code}
+
+    Partitions are written as a series of part files, `part-00000.jsonl.gz`
+    and so on. A part is closed once it holds `PARTITIONED_OUTPUT_MAX_ITEMS`
+    items or `PARTITIONED_OUTPUT_MAX_BYTES` bytes (uncompressed), or when more
+    than `PARTITIONED_OUTPUT_MAX_OPEN_FILES` parts are open, and the next item
+    of the partition starts a new part. Parts are compressed with
+    `PARTITIONED_OUTPUT_COMPRESSION`, "gzip" or "zstd" (requires
+    `pip install zstandard`), using `PARTITIONED_OUTPUT_THREADS` threads.
+
+    Every part closed is added to `manifest.json`, along with its partition,
+    number of rows, size and sha256 checksum, so that loaders can read the
+    parts in parallel and skip the ones they have loaded already. Later runs
+    writing to the same directory add new parts to the manifest, and leave
+    earlier parts untouched.
+
+    With `PARTITIONED_OUTPUT_INDEX`, gzip and plain parts get an index of the
+    entity keys of their records (see `tfmkt.index`).
+    """
+
+    EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst', None: ''}
+
+    def __init__(self, stats, output_dir, template, max_items, max_bytes, max_open_files, compression, threads, level,
+                 index=False):
+        self.stats = stats
+        self.output_dir = Path(output_dir)
+        self.template = template
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.max_open_files = max_open_files
+        self.compression = compression
+        self.threads = threads
+        self.level = level
+        self.index = index
+        self.executor = None
+        # partition -> part being written, least recently written first
+        self.parts = OrderedDict()
+        self.manifest_path = self.output_dir / 'manifest.json'
+        self.manifest = []
+        # partition -> number of parts started, in this and previous runs
+        self.part_numbers = {}
+        self.encode = self.encode_orjson if orjson is not None else self.encode_json
+        self.json_encoder = ScrapyJSONEncoder()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        output_dir = settings.get('PARTITIONED_OUTPUT_DIR')
+        if not output_dir:
+            raise NotConfigured
+        compression = settings.get('PARTITIONED_OUTPUT_COMPRESSION') or None
+        if compression not in cls.EXTENSIONS:
+            raise NotConfigured(f"Unknown PARTITIONED_OUTPUT_COMPRESSION: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError("PARTITIONED_OUTPUT_COMPRESSION=zstd requires zstandard, install it with: pip install zstandard")
+        level = settings.getint('PARTITIONED_OUTPUT_COMPRESSION_LEVEL')
+        return cls(
+            crawler.stats,
+            output_dir,
+            settings.get('PARTITIONED_OUTPUT_TEMPLATE'),
+            settings.getint('PARTITIONED_OUTPUT_MAX_ITEMS'),
+            settings.getint('PARTITIONED_OUTPUT_MAX_BYTES'),
+            settings.getint('PARTITIONED_OUTPUT_MAX_OPEN_FILES'),
+            compression,
+            settings.getint('PARTITIONED_OUTPUT_THREADS') or os.cpu_count(),
+            level if level else (9 if compression == 'gzip' else 3),
+            settings.getbool('PARTITIONED_OUTPUT_INDEX')
+        )
+
+    def open_spider(self, spider):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if self.manifest_path.exists():
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)['files']
+            for entry in self.manifest:
+                self.part_numbers[entry['partition']] = self.part_numbers.get(entry['partition'], 0) + 1
+        if self.compression == 'gzip':
+            self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='partitioned-output')
+
+    def encode_orjson(self, item: dict) -> bytes:
+        return orjson.dumps(item, default=self.json_encoder.default, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS)
+
+    def encode_json(self, item: dict) -> bytes:
+        return (self.json_encoder.encode(item) + '\n').encode('utf-8')
+
+    def partition(self, item: dict, spider) -> str:
+        values = defaultdict(lambda: 'unknown', {
+            key: value for key, value in item.items() if isinstance(value, (str, int, float))
+        })
+        values['spider'] = spider.name
+        values['season'] = item_season(item, spider)
+        if not item.get('competition_code'):
+            parent = item.get('parent')
+            for href in (item.get('href'), parent.get('href') if isinstance(parent, dict) else None):
+                code = entity_id('competition', href) if href else None
+                if code:
+                    values['competition_code'] = code
+                    break
+        partition = self.template.format_map(values)
+        # values must not escape the output directory
+        return '/'.join(
+            segment.replace('\\', '_') if segment not in ('', '.', '..') else '_'
+            for segment in partition.split('/')
+        )
+
+    def process_item(self, item, spider):
+        partition = self.partition(item, spider)
+        part = self.parts.get(partition)
+        if part is None:
+            part = self.open_part(partition)
+        else:
+            self.parts.move_to_end(partition)
+        part.add(self.encode(dict(item)), item_key(item))
+        if (self.max_items and part.rows >= self.max_items) or (self.max_bytes and part.size >= self.max_bytes):
+            self.close_part(partition)
+        return item
+
+    def open_part(self, partition: str) -> PartFile:
+        if self.max_open_files and len(self.parts) >= self.max_open_files:
+            self.close_part(next(iter(self.parts)))
+        number = self.part_numbers.get(partition, 0)
+        self.part_numbers[partition] = number + 1
+        path = self.output_dir / partition / f"part-{number:05d}.jsonl{self.EXTENSIONS[self.compression]}"
+        part = PartFile(path, self.compression, self.executor, self.threads, self.level, index=self.index)
+        self.parts[partition] = part
+        return part
+
+    def close_part(self, partition: str):
+        part = self.parts.pop(partition)
+        entry = part.close()
+        self.manifest.append({'path': part.path.relative_to(self.output_dir).as_posix(), 'partition': partition, **entry})
+        self.stats.inc_value('partitioned_output/files')
+        self.stats.inc_value('partitioned_output/rows', entry['rows'])
+        self.write_manifest()
+
+    def write_manifest(self):
+        temporary_path = self.manifest_path.with_name(self.manifest_path.name + '.tmp')
+        with open(temporary_path, 'w') as f:
+            json.dump({'files': self.manifest}, f, indent=1)
+        os.replace(temporary_path, self.manifest_path)
+
+    def close_spider(self, spider):
+        for partition in list(self.parts):
+            self.close_part(partition)
+        if self.executor is not None:
+            self.executor.shutdown()
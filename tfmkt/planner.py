@@ -0,0 +1,337 @@
+"""Plan refresh runs from the outputs of previous runs.
+
+A nightly refresh does not need to re-crawl the whole catalog. Most clubs did
+not play since the last run, and squads only change during transfer windows.
+The planner reads previous outputs, records in a state file when each parent
+was last scraped by each spider, and writes minimal parents files:
+
+* `competitions.json`, parents for the `clubs` spider,
+* `clubs.json`, parents for the `players` spider,
+* `players.json`, parents for the `appearances` spider.
+
+A parent is planned when any of these rules applies:
+
+* stale: it was never scraped by the spider, or not for `max_age` days,
+* played (clubs and players): its club played a game since it was last scraped,
+  according to the `games_urls` output,
+* transfer window (competitions and clubs): a transfer window is open and it was
+  not scraped for `window_max_age` days.
+
+The state file keeps, along with the last scraped times, the catalog of
+parents (by type and id), the squads and the last game of every club, so that
+later runs only need to be given the outputs produced since.
+
+The time an output was scraped at is the start time of the crawl that wrote it,
+recorded next to it in `<output>.meta.json` by the `OutputMetadata` extension,
+or given explicitly. File modification times are not used, as copying or
+decompressing an output changes them.
+"""
+from collections import Counter
+from pathlib import Path
+from urllib.parse import urlsplit
+from urllib.request import url2pathname
+import datetime
+import json
+import logging
+import os
+import typing
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from tfmkt.urls import entity_id
+from tfmkt.utils import read_jsonlines
+
+logger = logging.getLogger(__name__)
+
+# types of the parents planned, see `PLANNED_SPIDERS`
+PARENT_TYPES = ('competition', 'club', 'player')
+
+# (spider, type of its parents, name of the parents file)
+PLANNED_SPIDERS = [
+    ('clubs', 'competition', 'competitions.json'),
+    ('players', 'club', 'clubs.json'),
+    ('appearances', 'player', 'players.json'),
+]
+
+DEFAULT_TRANSFER_WINDOWS = '01-01:02-01,06-01:09-01'
+
+# suffix of the metadata file written next to an output
+METADATA_SUFFIX = '.meta.json'
+
+
+def utc_timestamp(value: typing.Union[str, datetime.datetime]) -> str:
+    """A time, as an ISO string or a datetime, as an ISO string in UTC. Naive times are taken to be UTC."""
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc).isoformat(timespec='seconds')
+
+
+def read_scraped_at(file_name: str) -> typing.Optional[str]:
+    """The time the output in a file was scraped at, from the metadata written next to it, or None."""
+    metadata_path = file_name + METADATA_SUFFIX
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path) as f:
+        started_at = json.load(f).get('started_at')
+    return utc_timestamp(started_at) if started_at else None
+
+
+def parse_transfer_windows(value: str) -> typing.List[typing.Tuple[str, str]]:
+    """Parse transfer windows given as comma separated "MM-DD:MM-DD" ranges, end excluded."""
+    windows = []
+    for window in value.split(','):
+        start, end = window.strip().split(':')
+        windows.append((start, end))
+    return windows
+
+
+class Planner:
+    """Keeps the last scraped state of parents and plans the next refresh.
+
+    :param state: The state loaded from a previous planner run, see `load`.
+    :type state: dict
+    :param now: The current time, defaults to now (UTC).
+    :type now: datetime.datetime
+    """
+
+    def __init__(self, state: dict = None, now: datetime.datetime = None):
+        state = state or {}
+        if 'last_scraped' not in state:
+            # state files of earlier versions only held the last scraped times
+            state = {'last_scraped': state}
+        self.now = now or datetime.datetime.now(datetime.timezone.utc)
+        # spider -> parent id -> ISO timestamp of the last time the spider scraped it
+        last_scraped = state['last_scraped']
+        self.last_scraped = {spider: dict(last_scraped.get(spider, {})) for spider, _, _ in PLANNED_SPIDERS}
+
+        # parent objects seen in the outputs, by type and id
+        catalog = state.get('catalog', {})
+        self.catalog = {entity_type: dict(catalog.get(entity_type, {})) for entity_type in PARENT_TYPES}
+        # club id -> ids of the players in its squad
+        self.squads = {club: set(players) for club, players in state.get('squads', {}).items()}
+        # club id -> ISO date of the last game it played
+        self.last_played = dict(state.get('last_played', {}))
+        # clubs whose squad was read from the outputs ingested, replacing the one of the state
+        self.ingested_squads = set()
+        # spider -> number of parents planned by rule, filled by `plan`
+        self.reasons = {}
+
+    @classmethod
+    def load(cls, file_name: str, **kwargs) -> 'Planner':
+        state = {}
+        if os.path.exists(file_name):
+            with open(file_name) as f:
+                state = json.load(f)
+        return cls(state, **kwargs)
+
+    def save(self, file_name: str):
+        state = {
+            'last_scraped': self.last_scraped,
+            'catalog': self.catalog,
+            'squads': {club: sorted(players) for club, players in self.squads.items()},
+            'last_played': self.last_played,
+        }
+        temporary_name = file_name + '.tmp'
+        with open(temporary_name, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(temporary_name, file_name)
+
+    def add_to_catalog(self, entity_type: str, item: dict) -> typing.Optional[str]:
+        key = entity_id(entity_type, item.get('href'))
+        if key is not None:
+            self.catalog[entity_type][key] = {k: v for k, v in item.items() if k not in ('parent', 'seasoned_href')}
+        return key
+
+    def mark_scraped(self, spider: str, key: str, scraped_at: str):
+        if key is not None and scraped_at > self.last_scraped[spider].get(key, ''):
+            self.last_scraped[spider][key] = scraped_at
+
+    def ingest(self, spider: str, file_name: str, scraped_at: typing.Union[str, datetime.datetime] = None):
+        """Read the output of a previous run of a spider.
+
+        :param spider: One of "clubs", "players", "appearances" or "games_urls".
+        :type spider: str
+        :param file_name: Path to the output, optionally gzip compressed.
+        :type file_name: str
+        :param scraped_at: The time the output was scraped at. Defaults to the
+          one recorded next to it by `OutputMetadata`.
+        :type scraped_at: str or datetime.datetime
+        :raises ValueError: When the scrape time is neither given nor recorded.
+        """
+        if scraped_at is None:
+            scraped_at = read_scraped_at(file_name)
+            if scraped_at is None:
+                raise ValueError(
+                    f"No scrape time recorded for {file_name} (in {file_name}{METADATA_SUFFIX}), "
+                    f"give it explicitly"
+                )
+        else:
+            scraped_at = utc_timestamp(scraped_at)
+
+        count = 0
+        for item in read_jsonlines(file_name):
+            count += 1
+            parent = item.get('parent') or {}
+            if spider == 'clubs':
+                self.add_to_catalog('club', item)
+                self.mark_scraped('clubs', self.add_to_catalog('competition', parent), scraped_at)
+            elif spider == 'players':
+                player = self.add_to_catalog('player', item)
+                club = self.add_to_catalog('club', parent)
+                self.mark_scraped('players', club, scraped_at)
+                if club is not None and player is not None:
+                    if club not in self.ingested_squads:
+                        self.ingested_squads.add(club)
+                        self.squads[club] = set()
+                    self.squads[club].add(player)
+            elif spider == 'appearances':
+                self.mark_scraped('appearances', self.add_to_catalog('player', parent), scraped_at)
+            elif spider == 'games_urls':
+                self.add_to_catalog('competition', parent)
+                if not item.get('result') or not item.get('date_iso'):
+                    continue
+                for side in ('home_club', 'away_club'):
+                    club = entity_id('club', (item.get(side) or {}).get('href'))
+                    if club is not None and item['date_iso'] > self.last_played.get(club, ''):
+                        self.last_played[club] = item['date_iso']
+            else:
+                raise ValueError(f"Unknown spider output: {spider}")
+        logger.info("Read %d items from %s (%s)", count, file_name, spider)
+
+    def transfer_window_open(self, windows) -> bool:
+        today = self.now.strftime('%m-%d')
+        return any(start <= today < end for start, end in windows)
+
+    def played_since(self, club: str, scraped_at: str) -> bool:
+        last_played = self.last_played.get(club)
+        return last_played is not None and last_played >= scraped_at[:10]
+
+    def plan(self, max_age: float = 30, window_max_age: float = 7,
+             transfer_windows: str = DEFAULT_TRANSFER_WINDOWS) -> typing.Dict[str, typing.List[dict]]:
+        """Compute the parents each spider should be run with.
+
+        :param max_age: Days after which any parent is refreshed.
+        :type max_age: float
+        :param window_max_age: Days after which competitions and clubs are refreshed while a transfer window is open.
+        :type window_max_age: float
+        :param transfer_windows: Transfer windows, as comma separated "MM-DD:MM-DD" ranges.
+        :type transfer_windows: str
+        :return: For every spider, the list of parents to run it with.
+        :rtype: typing.Dict[str, typing.List[dict]]
+        """
+        stale_before = (self.now - datetime.timedelta(days=max_age)).isoformat(timespec='seconds')
+        window_stale_before = (self.now - datetime.timedelta(days=window_max_age)).isoformat(timespec='seconds')
+        window_open = self.transfer_window_open(parse_transfer_windows(transfer_windows))
+
+        club_of_player = {
+            player: club for club, players in self.squads.items() for player in players
+        }
+
+        plans = {}
+        for spider, parent_type, _ in PLANNED_SPIDERS:
+            parents = []
+            reasons = Counter()
+            for key, parent in sorted(self.catalog[parent_type].items()):
+                scraped_at = self.last_scraped[spider].get(key)
+                if scraped_at is None or scraped_at < stale_before:
+                    reason = 'stale'
+                elif parent_type == 'club' and self.played_since(key, scraped_at):
+                    reason = 'played'
+                elif parent_type == 'player' and self.played_since(club_of_player.get(key), scraped_at):
+                    reason = 'played'
+                elif parent_type != 'player' and window_open and scraped_at < window_stale_before:
+                    reason = 'transfer_window'
+                else:
+                    continue
+                reasons[reason] += 1
+                parents.append(parent)
+            plans[spider] = parents
+            self.reasons[spider] = reasons
+        return plans
+
+    def write(self, plans: typing.Dict[str, typing.List[dict]], output_dir: str) -> typing.Dict[str, str]:
+        """Write the parents files of a plan.
+
+        :return: The path of the parents file written for every spider.
+        :rtype: typing.Dict[str, str]
+        """
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        paths = {}
+        for spider, parent_type, file_name in PLANNED_SPIDERS:
+            path = os.path.join(output_dir, file_name)
+            with open(path, 'w') as f:
+                for parent in plans[spider]:
+                    f.write(json.dumps(parent) + '\n')
+            paths[spider] = path
+        return paths
+
+
+class OutputMetadata:
+    """Extension recording the time a crawl was run at next to its file feeds, for `Planner.ingest`.
+
+    When the spider closes, `<path>.meta.json` is written for every feed
+    exported to a local file:
+
+        {"spider": "players", "started_at": "2024-03-01T02:00:00+00:00", "finished_at": "...", "items": 48211}
+
+    When a feed is appended to rather than overwritten, as by a resumed crawl,
+    the earliest start time is kept. Feeds with URI parameters (such as
+    `%(time)s`) and remote feeds are left out.
+
+    Enabled with the `OUTPUT_METADATA_ENABLED` setting.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.started_at = None
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('OUTPUT_METADATA_ENABLED'):
+            raise NotConfigured
+        return cls(crawler)
+
+    def feed_paths(self) -> typing.List[typing.Tuple[str, bool]]:
+        """The local paths of the feeds of the crawl, and whether each one is overwritten."""
+        settings = self.crawler.settings
+        feeds = dict(settings.getdict('FEEDS'))
+        if settings.get('FEED_URI'):
+            feeds.setdefault(settings.get('FEED_URI'), {})
+        paths = []
+        for uri, options in feeds.items():
+            uri = str(uri)
+            if '%(' in uri:
+                continue
+            parts = urlsplit(uri)
+            if parts.scheme == 'file':
+                path = url2pathname(parts.path)
+            elif not parts.scheme or len(parts.scheme) == 1:
+                # a plain path, or a Windows one with a drive letter
+                path = uri
+            else:
+                continue
+            paths.append((path, bool((options or {}).get('overwrite'))))
+        return paths
+
+    def spider_opened(self, spider):
+        self.started_at = utc_timestamp(datetime.datetime.now(datetime.timezone.utc))
+
+    def spider_closed(self, spider, reason):
+        metadata = {
+            'spider': spider.name,
+            'started_at': self.started_at,
+            'finished_at': utc_timestamp(datetime.datetime.now(datetime.timezone.utc)),
+            'items': self.crawler.stats.get_value('item_scraped_count', 0, spider=spider),
+        }
+        for path, overwrite in self.feed_paths():
+            if not os.path.exists(path):
+                continue
+            previous = None if overwrite else read_scraped_at(path)
+            with open(path + METADATA_SUFFIX, 'w') as f:
+                json.dump({**metadata, 'started_at': min(metadata['started_at'], previous or metadata['started_at'])}, f)
+                f.write('\n')
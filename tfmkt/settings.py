@@ -3,6 +3,7 @@ BOT_NAME = 'tfmkt'
 
 SPIDER_MODULES = ['tfmkt.spiders']
 NEWSPIDER_MODULE = 'tfmkt.spiders'
+COMMANDS_MODULE = 'tfmkt.commands'
 
 # Obey robots.txt rules
 ROBOTSTXT_OBEY = True
@@ -10,17 +11,182 @@ ROBOTSTXT_OBEY = True
 FEED_FORMAT = 'jsonlines'
 FEED_URI = 'stdout:'
 
+# JSON lines are written from a background thread (see tfmkt/exporters.py), with the same output as Scrapy's
+# exporter. The jsonlines-compact format writes lines without spaces and with non-ASCII characters as UTF-8,
+# encoded with orjson when installed. The engine is paused while more than FEED_WRITER_MAX_PENDING items wait
+# to be written
+FEED_EXPORTERS = {
+   'jsonlines': 'tfmkt.exporters.FastJsonLinesItemExporter',
+   'jsonl': 'tfmkt.exporters.FastJsonLinesItemExporter',
+   'jsonlines-compact': 'tfmkt.exporters.CompactJsonLinesItemExporter',
+}
+FEED_WRITER_MAX_PENDING = 10000
+# Write a <feed file>.idx index of the byte offset of every entity key, for reading records by key (see tfmkt/index.py)
+FEED_INDEX = False
+
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
 EXTENSIONS = {
-   'scrapy.extensions.closespider.CloseSpider': 500
+   'scrapy.extensions.closespider.CloseSpider': 500,
+   'tfmkt.throttle.AdaptiveThrottle': 0,
+   'tfmkt.planner.OutputMetadata': 0
 }
 DOWNLOADER_MIDDLEWARES = {
+   'tfmkt.offload.OffloadMiddleware': 50,
    'scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware': 500
 }
 
+# Run the listed callbacks in a pool of OFFLOAD_WORKERS worker processes (defaults to the number of CPUs)
+# instead of the reactor thread. For example: -s OFFLOAD_CALLBACKS=parse_game,parse_details,parse_stats
+OFFLOAD_CALLBACKS = []
+OFFLOAD_WORKERS = 0
+
+# ParentInterningMiddleware runs first on the spider input, so that other middlewares and callbacks only see
+# resolved parents, and DepthFirstMiddleware last on the spider output, so that the requests it holds back carry
+# parent references. CheckpointMiddleware runs on the spider output after the built-in middlewares filtered it
+# See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
+SPIDER_MIDDLEWARES = {
+   'tfmkt.middlewares.DepthFirstMiddleware': 3,
+   'tfmkt.parents.ParentInterningMiddleware': 5,
+   'tfmkt.checkpoint.CheckpointMiddleware': 20,
+   'tfmkt.fields.FieldProjectionMiddleware': 30,
+   'tfmkt.fixtures.FixtureRecorderMiddleware': 940,
+   'tfmkt.timing.CallbackTimingMiddleware': 950
+}
+
+# Requests carry references to a registry of distinct parents instead of a copy of their parent, and equal item
+# parents share one instance (see tfmkt/parents.py). The registry holds the PARENT_INTERNING_MAX_PARENTS parents
+# used most recently (0 for no limit)
+PARENT_INTERNING_ENABLED = True
+PARENT_INTERNING_MAX_PARENTS = 100000
+
+# Checkpoint completed entrypoints and emitted items when a JOBDIR is given (see tfmkt/checkpoint.py), so that
+# a restarted crawl skips them. For example: -s JOBDIR=jobs/appearances
+CHECKPOINT_ENABLED = True
+
+# Depth-first scheduling (see tfmkt/middlewares.py), it changes the crawl order and is disabled by default.
+# Requests to the spider leaf_callbacks are prioritized, and other requests yielded by callbacks are held back
+# while the scheduler holds DEPTH_FIRST_MAX_QUEUE requests or more (0 for no limit). At most DEPTH_FIRST_MAX_HELD
+# requests are held back in memory, the next ones are spilled to a disk queue under DEPTH_FIRST_SPILL_DIR
+# (a temporary directory when None)
+DEPTH_FIRST_ENABLED = False
+DEPTH_FIRST_LEAF_PRIORITY = 100
+DEPTH_FIRST_MAX_QUEUE = 1000
+DEPTH_FIRST_MAX_HELD = 10000
+DEPTH_FIRST_SPILL_DIR = None
+
+ITEM_PIPELINES = {
+   'tfmkt.normalization.NormalizationPipeline': 600,
+   'tfmkt.pipelines.EntityStorePipeline': 700,
+   'tfmkt.pipelines.ChangeDetectionPipeline': 800,
+   'tfmkt.pipelines.ParquetExportPipeline': 950,
+   'tfmkt.pipelines.PartitionedOutputPipeline': 960,
+   'tfmkt.pipelines.NormalizedOutputPipeline': 990
+}
+
+# Only export new and changed entities, compared to the hashes kept in CHANGE_DETECTION_INDEX (see tfmkt/pipelines.py).
+# For example: -s CHANGE_DETECTION_INDEX=state/players.tsv
+CHANGE_DETECTION_INDEX = None
+CHANGE_DETECTION_TOMBSTONES = False
+CHANGE_DETECTION_IGNORED_FIELDS = ['seasoned_href']
+
+# Convert numeric and date fields from display strings to typed values (see tfmkt/normalization.py):
+# "€12.00m" -> 12000000, "90'" -> 90, "Fri, 12/18/20" -> "2020-12-18". Converters are given by name or import path.
+NORMALIZATION_ENABLED = False
+NORMALIZATION_FIELDS = {
+   'market_value': 'market_value',
+   'current_market_value': 'market_value',
+   'highest_market_value': 'market_value',
+   'total_market_value': 'market_value',
+   'attendance': 'integer',
+   'minutes_played': 'integer',
+   'age': 'integer',
+   'height': 'height',
+   'date': 'date',
+   'date_of_birth': 'date',
+   'date_of_death': 'date',
+   'halftime_score': 'score',
+   # 'result' is left as scraped: it is not always a score ("-:-", "postponed", "2:1 on pens."), and outputs are
+   # read back as parents by games_by_url and the planner, which expect the string
+}
+
+# Keep the latest version of every entity scraped in the SQLite database ENTITY_STORE (see tfmkt/store.py).
+# For example: -s ENTITY_STORE=state/entities.db
+ENTITY_STORE = None
+ENTITY_STORE_COMMIT_SIZE = 1000
+
+# Normalized output: item parents are replaced with a key, and written once to the NORMALIZED_OUTPUT_PARENTS
+# JSON lines file (see tfmkt/pipelines.py). For example: -s NORMALIZED_OUTPUT_PARENTS=games_parents.jsonl
+NORMALIZED_OUTPUT_PARENTS = None
+NORMALIZED_OUTPUT_DROPPED_FIELDS = ['seasoned_href']
+
+# Parquet output, partitioned by item type and season, written alongside the feed (see tfmkt/pipelines.py).
+# Requires pyarrow. For example: -s PARQUET_OUTPUT_DIR=warehouse/games
+PARQUET_OUTPUT_DIR = None
+PARQUET_ROW_GROUP_SIZE = 50000
+PARQUET_COMPRESSION = 'zstd'
+
+# JSON lines output partitioned by PARTITIONED_OUTPUT_TEMPLATE, written alongside the feed in rotated, compressed
+# part files listed in a manifest.json (see tfmkt/pipelines.py). For example: -s PARTITIONED_OUTPUT_DIR=output/games
+PARTITIONED_OUTPUT_DIR = None
+PARTITIONED_OUTPUT_TEMPLATE = 'type={type}/season={season}/competition={competition_code}'
+PARTITIONED_OUTPUT_MAX_ITEMS = 100000
+PARTITIONED_OUTPUT_MAX_BYTES = 256 * 2**20
+PARTITIONED_OUTPUT_MAX_OPEN_FILES = 64
+PARTITIONED_OUTPUT_COMPRESSION = 'gzip'  # 'zstd' requires zstandard, None to write plain JSON lines
+PARTITIONED_OUTPUT_COMPRESSION_LEVEL = None  # 9 for gzip, 3 for zstd
+PARTITIONED_OUTPUT_THREADS = None  # number of CPUs
+PARTITIONED_OUTPUT_INDEX = False  # write a part-NNNNN.jsonl.gz.idx index of the entity keys of every gzip or plain part
+
+# Compact request dupefilter for crawls with tens of millions of requests (see tfmkt/dupefilters.py).
+# Enable with -s DUPEFILTER_CLASS=tfmkt.dupefilters.CompactDupeFilter
+DUPEFILTER_STORE = 'hashset'  # or 'bloom'
+DUPEFILTER_DIGEST_SIZE = 16
+DUPEFILTER_INITIAL_CAPACITY = 1 << 20
+DUPEFILTER_BLOOM_ERROR_RATE = 1e-6
+DUPEFILTER_SPILL_DIR = None
+
 CLOSESPIDER_PAGECOUNT = 0
 
+# Write the start time of the crawl next to file feeds, in <path>.meta.json, for `scrapy plan` (see tfmkt/planner.py)
+OUTPUT_METADATA_ENABLED = True
+
+# Adaptive throttling (see tfmkt/throttle.py)
+# Requests are sent at THROTTLE_TARGET_RPS requests per second at most. The rate is backed off on 429/503
+# and slow responses (honouring Retry-After) and recovers gradually when the site is healthy again.
+# Disabled by default: once enabled, crawls never go faster than THROTTLE_TARGET_RPS.
+THROTTLE_ENABLED = False
+THROTTLE_TARGET_RPS = 4.0
+THROTTLE_MAX_DELAY = 120.0
+THROTTLE_BACKOFF_FACTOR = 2.0
+THROTTLE_RECOVERY_FACTOR = 0.9
+THROTTLE_SLOW_RESPONSE = 10.0
+THROTTLE_RATE_WINDOW = 60.0
+THROTTLE_LOG_INTERVAL = 60.0
+
+# Per-callback timing (see tfmkt/timing.py)
+# Wall/CPU time, response bytes, items and requests of every callback, and queue depths, are logged as a JSON
+# line every CALLBACK_TIMING_INTERVAL seconds and written to CALLBACK_TIMING_PROMETHEUS_FILE if set
+CALLBACK_TIMING_ENABLED = False
+CALLBACK_TIMING_INTERVAL = 60.0
+CALLBACK_TIMING_PROMETHEUS_FILE = None
+CALLBACK_TIMING_RESERVOIR_SIZE = 1024
+
+# Fixture recording (see tfmkt/fixtures.py)
+# Responses of the crawl are recorded to FIXTURES_RECORD_DIR with their callback and cb_kwargs, up to
+# FIXTURES_RECORD_PER_VARIANT pages per page type and variant (0 for all of them), from URLs matching
+# FIXTURES_RECORD_PATTERN if set
+FIXTURES_RECORD_DIR = None
+FIXTURES_RECORD_PER_VARIANT = 5
+FIXTURES_RECORD_PATTERN = None
+
+CONCURRENT_REQUESTS = 16
+CONCURRENT_REQUESTS_PER_DOMAIN = 8
+
+# https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#module-scrapy.downloadermiddlewares.retry
+RETRY_TIMES = 5
+RETRY_HTTP_CODES = [429, 500, 502, 503, 504, 522, 524, 408]
+
 LOG_LEVEL = 'ERROR'
 
 # HttpCacheMiddleware settings
@@ -30,3 +196,7 @@ HTTPCACHE_DIR = 'httpcache'
 
 # https://docs.scrapy.org/en/latest/topics/request-response.html?highlight=REQUEST_FINGERPRINTER_IMPLEMENTATION#std-setting-REQUEST_FINGERPRINTER_IMPLEMENTATION
 REQUEST_FINGERPRINTER_IMPLEMENTATION = '2.7'
+# To fingerprint the canonical form of URLs (see tfmkt/urls.py), so that variants of the same page share
+# one HTTP cache entry and one dupefilter slot, set REQUEST_FINGERPRINTER_CLASS to
+# 'tfmkt.urls.CanonicalRequestFingerprinter'. Fingerprints change, so existing HTTP caches and JOBDIRs are
+# not found anymore: start them afresh when switching.
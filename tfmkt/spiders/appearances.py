@@ -5,6 +5,7 @@ from urllib.parse import urlparse
 
 class AppearancesSpider(BaseSpider):
   name = 'appearances'
+  leaf_callbacks = ['parse_stats']
 
   def parse(self, response, parent):
     """Parse player profile attributes and fetch "full stats" URL
@@ -4,6 +4,7 @@ import re
 
 class ClubsSpider(BaseSpider):
     name = 'clubs'
+    leaf_callbacks = ['parse_details']
 
     def seasonize_entrypoin_href(self, item):
         """
@@ -4,6 +4,7 @@ import re
 
 from scrapy import Request
 from tfmkt.spiders.clubs import ClubsSpider
+from tfmkt.urls import entity_id, site_path
 
 
 class ClubsByUrlSpider(ClubsSpider):
@@ -30,6 +31,8 @@ class ClubsByUrlSpider(ClubsSpider):
         hrefs: Optional[str] = None,
         kind: str = "cup",
         season: Optional[int] = None,
+        entrypoints: Optional[List[Dict]] = None,
+        **kwargs,
     ):
         """
         Args
@@ -44,7 +47,7 @@ class ClubsByUrlSpider(ClubsSpider):
         self._kind = (kind or "cup").strip().lower()
         self.season = int(season) if season else None
 
-        super().__init__(base_url=base_url, parents=parents)
+        super().__init__(base_url=base_url, parents=parents, entrypoints=entrypoints, **kwargs)
 
         try:
             self.logger.info(
@@ -90,13 +93,7 @@ class ClubsByUrlSpider(ClubsSpider):
 
     def _normalize_href(self, href: str) -> str:
         """Return a site-relative href beginning with '/'. Accepts absolute URLs too."""
-        if not href:
-            return href
-        if href.startswith(("http://", "https://")):
-            parsed = urlparse(href)
-            normalized = parsed.path.rstrip("/")
-        else:
-            normalized = href.rstrip("/")
+        normalized = site_path(href)
         if normalized != href:
             try:
                 self.logger.debug("normalize_href: %s -> %s", href, normalized)
@@ -181,51 +178,57 @@ class ClubsByUrlSpider(ClubsSpider):
     def start_requests(self):
         requests_to_start: List[Request] = []
         for item in self.entrypoints:
-            base_url = self._build_competition_url(item["href"])  # cup → /teilnehmer/ variant
-            item["seasoned_href"] = base_url
-            try:
-                self.logger.info("Start request prepared: %s", base_url)
-            except Exception:
-                pass
+            requests_to_start.extend(self.entrypoint_requests(item))
 
-            # Always include the default entry
-            requests_to_start.append(
-                Request(
-                    item["seasoned_href"],
-                    cb_kwargs={"parent": item},
-                    errback=self._errback_start,
-                    meta={"handle_httpstatus_all": True},
-                )
+        return requests_to_start
+
+    def entrypoint_requests(self, item: Dict) -> List[Request]:
+        requests_to_start: List[Request] = []
+        base_url = self._build_competition_url(item["href"])  # cup → /teilnehmer/ variant
+        item["seasoned_href"] = base_url
+        try:
+            self.logger.info("Start request prepared: %s", base_url)
+        except Exception:
+            pass
+
+        # Always include the default entry
+        requests_to_start.append(
+            Request(
+                item["seasoned_href"],
+                cb_kwargs={"parent": item},
+                errback=self._errback_start,
+                meta={"handle_httpstatus_all": True},
             )
+        )
 
-            # Special-case: UEFA Youth League (19YL) → also crawl last 3 seasons participants pages
-            path = self._normalize_href(item.get("href") or "")
-            if "/pokalwettbewerb/19YL" in path:
-                # Ensure participants path
-                if "/teilnehmer/" not in path:
-                    if "/startseite/" in path:
-                        path = path.replace("/startseite/", "/teilnehmer/")
-                    elif "/plus/" in path:
-                        path = path.replace("/plus/", "/teilnehmer/")
-                    elif "/pokalwettbewerb/" in path and "/teilnehmer/pokalwettbewerb/" not in path:
-                        path = path.replace("/pokalwettbewerb/", "/teilnehmer/pokalwettbewerb/")
-
-                for season in (2025, 2024, 2023):
-                    season_path = re.sub(r"/saison_id/\d+", "", path).rstrip("/")
-                    season_path = f"{season_path}/saison_id/{season}"
-                    season_url = f"{self.base_url}{season_path}"
-                    try:
-                        self.logger.info("Start request (19YL season) prepared: %s", season_url)
-                    except Exception:
-                        pass
-                    requests_to_start.append(
-                        Request(
-                            season_url,
-                            cb_kwargs={"parent": item},
-                            errback=self._errback_start,
-                            meta={"handle_httpstatus_all": True},
-                        )
+        # Special-case: UEFA Youth League (19YL) → also crawl last 3 seasons participants pages
+        path = self._normalize_href(item.get("href") or "")
+        if "/pokalwettbewerb/19YL" in path:
+            # Ensure participants path
+            if "/teilnehmer/" not in path:
+                if "/startseite/" in path:
+                    path = path.replace("/startseite/", "/teilnehmer/")
+                elif "/plus/" in path:
+                    path = path.replace("/plus/", "/teilnehmer/")
+                elif "/pokalwettbewerb/" in path and "/teilnehmer/pokalwettbewerb/" not in path:
+                    path = path.replace("/pokalwettbewerb/", "/teilnehmer/pokalwettbewerb/")
+
+            for season in (2025, 2024, 2023):
+                season_path = re.sub(r"/saison_id/\d+", "", path).rstrip("/")
+                season_path = f"{season_path}/saison_id/{season}"
+                season_url = f"{self.base_url}{season_path}"
+                try:
+                    self.logger.info("Start request (19YL season) prepared: %s", season_url)
+                except Exception:
+                    pass
+                requests_to_start.append(
+                    Request(
+                        season_url,
+                        cb_kwargs={"parent": item},
+                        errback=self._errback_start,
+                        meta={"handle_httpstatus_all": True},
                     )
+                )
 
         return requests_to_start
 
@@ -297,8 +300,7 @@ class ClubsByUrlSpider(ClubsSpider):
             )
 
     def _extract_club_id(self, href: str) -> Optional[str]:
-        m = re.search(r"/verein/(\d+)", href)
-        return m.group(1) if m else None
+        return entity_id("club", href)
 
     def _extract_slug(self, href: str) -> Optional[str]:
         """
@@ -2,7 +2,10 @@ from io import BufferedReader
 import scrapy
 from scrapy import Request
 from scrapy.shell import inspect_response # required for debugging
-import re
+from tfmkt.fields import extract_fields, parse_fields
+from tfmkt.keys import read_keyed_lines
+from tfmkt.store import EntityStore, is_store
+from tfmkt.urls import replace_param, split_path
 import os, sys
 import json
 import gzip
@@ -26,8 +29,32 @@ def read_lines(file_name: str, reading_fn: typing.Callable[[str], BufferedReader
   
   return parents
 
+def read_store(file_name: str, entity_type: str) -> typing.List[dict]:
+  """A function that reads the entities of a type from an entity store (see tfmkt/store.py).
+
+  :param file_name: The path of the entity store.
+  :type file_name: str
+  :param entity_type: The type of the entities read, such as "club".
+  :type entity_type: str
+  :return: A list of json objects (dict)
+  :rtype: typing.List[dict]
+  """
+  if entity_type is None:
+    raise ValueError(f"Reading parents from the entity store {file_name} requires a 'parents_type' argument")
+  if not os.path.exists(file_name):
+    raise FileNotFoundError(file_name)
+  store = EntityStore(file_name)
+  try:
+    return list(store.query(entity_type=entity_type))
+  finally:
+    store.close()
+
 class BaseSpider(scrapy.Spider):
-  def __init__(self, base_url=None, parents=None):
+  def __init__(self, base_url=None, parents=None, entrypoints=None, parents_type=None, parents_keys=None, fields=None, **kwargs):
+    super().__init__(**kwargs)
+
+    # fields to extract and export, all of them when None (see tfmkt/fields.py)
+    self.fields = parse_fields(fields)
 
     if base_url is not None:
       self.base_url = base_url
@@ -44,8 +71,15 @@ class BaseSpider(scrapy.Spider):
     else:
       self.gzip_compressed = False
     
-    # load parent objects, either from stdin, a file or a zipped file
-    if parents is not None:
+    # load parent objects, either from stdin, a file, a zipped file or an entity store
+    # (or take them as they are when they are handed over in-process)
+    if entrypoints is not None:
+      parents = list(entrypoints)
+    elif parents is not None and is_store(parents):
+      parents = read_store(parents, parents_type)
+    elif parents is not None and parents_keys is not None:
+      parents = read_keyed_lines(parents, parents_keys)
+    elif parents is not None:
       if self.gzip_compressed:
         parents = read_lines(parents, gzip.open)
       else:
@@ -63,6 +97,16 @@ class BaseSpider(scrapy.Spider):
 
     self.entrypoints = parents
 
+  def extract_fields(self, field_functions):
+    """Run the field functions of the fields requested with the `fields` argument.
+
+    :param field_functions: The function extracting every field, by field name.
+    :type field_functions: typing.Dict[str, typing.Callable[[], typing.Any]]
+    :return: The values of the requested fields.
+    :rtype: dict
+    """
+    return extract_fields(field_functions, self.fields)
+
   def scrape_parents(self):
     if not os.environ.get('SCRAPY_CHECK'):
       raise Exception("Backfilling is not yet supported, please provide a 'parents' file")
@@ -70,14 +114,21 @@ class BaseSpider(scrapy.Spider):
       return []
 
   def start_requests(self):
+    return [
+      request
+      for item in self.entrypoints
+      for request in self.entrypoint_requests(item)
+    ]
 
-    applicable_items = []
-
-    for item in self.entrypoints:
-      # clubs extraction is best done on first_tier competition types only
-      item['seasoned_href'] = self.seasonize_entrypoin_href(item)
-      applicable_items.append(item)
+  def entrypoint_requests(self, item):
+    """Build the requests that start the crawl for a single parent object.
 
+    :param item: A parent object, as read from the parents file.
+    :type item: dict
+    :return: The requests for this parent.
+    :rtype: typing.List[Request]
+    """
+    item['seasoned_href'] = self.seasonize_entrypoin_href(item)
 
     return [
       Request(
@@ -86,13 +137,9 @@ class BaseSpider(scrapy.Spider):
           'parent': item
         }
       )
-      for item in applicable_items
     ]
 
 
-
-
-
   def seasonize_entrypoin_href(self, item):
       """
       Build the URL for an entrypoint by first checking if the URL already includes a season.
@@ -102,7 +149,7 @@ class BaseSpider(scrapy.Spider):
       """
 
       # Remove any existing '/saison_id/<digits>' from the URL
-      base_href = re.sub(r'/saison_id/\d+', '', item['href'])
+      base_href = replace_param(item['href'], 'saison_id', None)
 
       if item['type'] == 'club':
           # For clubs, simply append the season segment.
@@ -113,10 +160,10 @@ class BaseSpider(scrapy.Spider):
               seasonized_href = f"{self.base_url}{base_href}".replace("wettbewerb", "pokalwettbewerb")
           else:
               # For any league competition (first-tier, second-tier, etc.), ensure the plus segment is used.
-              if "/plus/" not in base_href:
-                  seasonized_href = f"{self.base_url}{base_href}/plus/"
-              else:
-                  seasonized_href = f"{self.base_url}{base_href}"
+              path = split_path(base_href)
+              if path is not None and path.param('plus') is None:
+                  base_href = path.replace_param('plus', '').href()
+              seasonized_href = f"{self.base_url}{base_href}"
       else:
           seasonized_href = f"{self.base_url}{base_href}"
 
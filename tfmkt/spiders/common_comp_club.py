@@ -7,6 +7,12 @@ import json
 import gzip
 import typing
 
+from tfmkt.fields import extract_fields, parse_fields
+from tfmkt.keys import read_keyed_lines
+from tfmkt.spiders.common import read_store
+from tfmkt.store import is_store
+from tfmkt.urls import split_path
+
 default_base_url = 'https://www.transfermarkt.co.uk'
 
 def read_lines(file_name: str, reading_fn: typing.Callable[[str], BufferedReader]) -> typing.List[dict]:
@@ -16,7 +22,12 @@ def read_lines(file_name: str, reading_fn: typing.Callable[[str], BufferedReader
     return parents
 
 class BaseSpider(scrapy.Spider):
-    def __init__(self, base_url=None, parents=None):
+    def __init__(self, base_url=None, parents=None, entrypoints=None, parents_type=None, parents_keys=None, fields=None, **kwargs):
+        super().__init__(**kwargs)
+
+        # Fields to extract and export, all of them when None (see tfmkt/fields.py).
+        self.fields = parse_fields(fields)
+
         if base_url is not None:
             self.base_url = base_url
         else:
@@ -29,8 +40,15 @@ class BaseSpider(scrapy.Spider):
         else:
             self.gzip_compressed = False
 
-        # Load parent objects either from a file, zipped file, or stdin.
-        if parents is not None:
+        # Load parent objects either from a file, zipped file, entity store, or stdin
+        # (or take them as they are when they are handed over in-process).
+        if entrypoints is not None:
+            parents = list(entrypoints)
+        elif parents is not None and is_store(parents):
+            parents = read_store(parents, parents_type)
+        elif parents is not None and parents_keys is not None:
+            parents = read_keyed_lines(parents, parents_keys)
+        elif parents is not None:
             if self.gzip_compressed:
                 parents = read_lines(parents, gzip.open)
             else:
@@ -48,6 +66,13 @@ class BaseSpider(scrapy.Spider):
 
         self.entrypoints = parents
 
+    def extract_fields(self, field_functions):
+        """
+        Run the field functions of the fields requested with the `fields` argument,
+        and return the values of the requested fields.
+        """
+        return extract_fields(field_functions, self.fields)
+
     def scrape_parents(self):
         if not os.environ.get('SCRAPY_CHECK'):
             raise Exception("Backfilling is not yet supported, please provide a 'parents' file")
@@ -55,19 +80,27 @@ class BaseSpider(scrapy.Spider):
             return []
 
     def start_requests(self):
-        applicable_items = []
-        for item in self.entrypoints:
-            # *** IMPORTANT CHANGE: Do not filter out clubs based on competition_type.
-            # This ensures we process competitions of all tiers.
-            item['seasoned_href'] = self.seasonize_entrypoin_href(item)
-            applicable_items.append(item)
+        return [
+            request
+            for item in self.entrypoints
+            for request in self.entrypoint_requests(item)
+        ]
+
+    def entrypoint_requests(self, item):
+        """
+        Build the requests that start the crawl for a single parent object.
+        Used for the parents file as well as for parents handed over in-process
+        by the stage orchestrator.
+        """
+        # *** IMPORTANT CHANGE: Do not filter out clubs based on competition_type.
+        # This ensures we process competitions of all tiers.
+        item['seasoned_href'] = self.seasonize_entrypoin_href(item)
 
         return [
             Request(
                 item['seasoned_href'],
                 cb_kwargs={'parent': item}
             )
-            for item in applicable_items
         ]
 
     def seasonize_entrypoin_href(self, item):
@@ -88,11 +121,11 @@ class BaseSpider(scrapy.Spider):
                 seasonized_href = f"{self.base_url}{base_href}".replace("wettbewerb", "pokalwettbewerb")
             else:
                 # For any league competition (first-tier, second-tier, etc.), always use the plus form.
-                if "/plus/" not in base_href:
+                path = split_path(base_href)
+                if path is not None and path.param('plus') is None:
                     # Append "/plus/" (without a trailing digit) before the season query.
-                    seasonized_href = f"{self.base_url}{base_href}/plus/"
-                else:
-                    seasonized_href = f"{self.base_url}{base_href}"
+                    base_href = path.replace_param('plus', '').href()
+                seasonized_href = f"{self.base_url}{base_href}"
         else:
             seasonized_href = f"{self.base_url}{base_href}"
         return seasonized_href
@@ -4,6 +4,9 @@ from inflection import parameterize, underscore
 
 class CompetitionsSpider(BaseSpider):
     name = 'competitions'
+    leaf_callbacks = ['parse_competitions']
+    # callbacks that can not be offloaded (see tfmkt/offload.py)
+    stateful_callbacks = ['parse_competitions']
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -5,6 +5,7 @@ from tfmkt.utils import background_position_in_px_to_minute
 
 class GameLineupsSpider(BaseSpider):
   name = 'game_lineups'
+  leaf_callbacks = ['parse_lineups']
 
   def parse(self, response, parent):
     """Parse game page.
@@ -1,10 +1,12 @@
 from tfmkt.spiders.common_comp_club import BaseSpider
 from scrapy.shell import inspect_response # required for debugging
 import re
+from tfmkt.fields import OMITTED, lazy
 from tfmkt.utils import background_position_in_px_to_minute
 
 class GamesSpider(BaseSpider):
   name = 'games'
+  leaf_callbacks = ['parse_game']
 
   def parse(self, response, parent):
     """Parse competition page. From this page follow to the games and fixutres page.
@@ -191,157 +193,147 @@ class GamesSpider(BaseSpider):
     game_box = response.css('div.box-content')
 
     # extract home and away "boxes" attributes
-    home_club_box = game_box.css('div.sb-heim')
-    away_club_box = game_box.css('div.sb-gast')
-
-    home_club_href = home_club_box.css('a::attr(href)').get()
-    away_club_href = away_club_box.css('a::attr(href)').get()
-
-    home_club_position = home_club_box[0].xpath('p/text()').get()
-    away_club_position = away_club_box[0].xpath('p/text()').get()
+    home_club_box = lazy(lambda: game_box.css('div.sb-heim'))
+    away_club_box = lazy(lambda: game_box.css('div.sb-gast'))
 
     # extract date and time "box" attributes
-    datetime_box = game_box.css('div.sb-spieldaten')[0]
-
-    text_elements = [
-      element for element in datetime_box.xpath('p//text()') 
-      if len(self.safe_strip(element.get())) > 0
-    ]
-
-    matchday = self.safe_strip(text_elements[0].get()).split("  ")[0]
-    date = self.safe_strip(datetime_box.xpath('p/a[contains(@href, "datum")]/text()').get())
-
-    # Extract ISO date from href
-    date_iso = None
-    date_href = datetime_box.xpath('p/a[contains(@href, "datum")]/@href').get()
-    if date_href:
-      # Extract date from URL like /aktuell/waspassiertheute/aktuell/new/datum/2018-09-26
-      date_match = re.search(r'/datum/(\d{4}-\d{2}-\d{2})', date_href)
-      if date_match:
-        date_iso = date_match.group(1)
-
-    # Extract kick-off time if available
-    kickoff_time = None
-    for elem in text_elements:
+    datetime_box = lazy(lambda: game_box.css('div.sb-spieldaten')[0])
+
+    @lazy
+    def text_elements():
+      return [
+        element for element in datetime_box().xpath('p//text()')
+        if len(self.safe_strip(element.get())) > 0
+      ]
+
+    def date_iso():
+      # Extract ISO date from href
+      date_href = datetime_box().xpath('p/a[contains(@href, "datum")]/@href').get()
+      if date_href:
+        # Extract date from URL like /aktuell/waspassiertheute/aktuell/new/datum/2018-09-26
+        date_match = re.search(r'/datum/(\d{4}-\d{2}-\d{2})', date_href)
+        if date_match:
+          return date_match.group(1)
+      return None
+
+    def kickoff_time():
+      # Extract kick-off time if available
+      for elem in text_elements():
         elem_text = self.safe_strip(elem.get())
         # Look for time pattern like "3:00 PM" or "15:00"
         if re.search(r'\d{1,2}:\d{2}\s*(AM|PM|am|pm)?', elem_text):
-            # Extract just the time part
-            time_match = re.search(r'(\d{1,2}:\d{2}\s*(?:AM|PM|am|pm)?)', elem_text)
-            if time_match:
-                kickoff_time = time_match.group(1).strip()
-                break
+          # Extract just the time part
+          time_match = re.search(r'(\d{1,2}:\d{2}\s*(?:AM|PM|am|pm)?)', elem_text)
+          if time_match:
+            return time_match.group(1).strip()
+      return None
 
     # extract venue "box" attributes
-    venue_box = game_box.css('p.sb-zusatzinfos')
-
-    stadium = self.safe_strip(venue_box.xpath('node()')[1].xpath('a/text()').get())
-    # Clean attendance format - remove "Attendance: " prefix
-    attendance_raw = self.safe_strip(venue_box.xpath('node()')[1].xpath('strong/text()').get())
-    attendance = attendance_raw.replace("Attendance: ", "") if attendance_raw else None
-
-    # Extract referee name and href
-    referee_element = venue_box.xpath('a[contains(@href, "schiedsrichter")]')
-    if referee_element:
-      referee_name = self.safe_strip(referee_element.xpath('./@title').get())
-      referee_href = referee_element.xpath('./@href').get()
-      referee = {
-        'name': referee_name,
-        'href': referee_href
-      } if referee_name else None
-    else:
-      referee = None
+    venue_box = lazy(lambda: game_box.css('p.sb-zusatzinfos'))
+
+    def attendance():
+      # Clean attendance format - remove "Attendance: " prefix
+      attendance_raw = self.safe_strip(venue_box().xpath('node()')[1].xpath('strong/text()').get())
+      return attendance_raw.replace("Attendance: ", "") if attendance_raw else None
+
+    def referee():
+      # Extract referee name and href
+      referee_element = venue_box().xpath('a[contains(@href, "schiedsrichter")]')
+      if referee_element:
+        referee_name = self.safe_strip(referee_element.xpath('./@title').get())
+        referee_href = referee_element.xpath('./@href').get()
+        return {
+          'name': referee_name,
+          'href': referee_href
+        } if referee_name else None
+      return None
 
     # extract results "box" attributes
-    result_box = game_box.css('div.ergebnis-wrap')
-
-    result = self.safe_strip(result_box.css('div.sb-endstand::text').get())
-
-    # Extract half-time score if available
-    halftime_score = None
-    # Get all text including text in nested elements like <span>
-    halftime_texts = result_box.css('div.sb-halbzeit *::text, div.sb-halbzeit::text').getall()
-    if halftime_texts:
-      halftime_text = self.safe_strip(''.join(halftime_texts))
-      # Extract score pattern like "0:1" or "(0:1)"
-      halftime_match = re.search(r'\(?(\d+:\d+)\)?', halftime_text)
-      if halftime_match:
-        halftime_score = halftime_match.group(1)
-
-    # extract from line-ups "box"
-    manager_rows = response.xpath(
-        "//tr[(contains(td/b/text(),'Manager')) or (contains(td/div/text(),'Manager'))]/td[2]/a"
+    result_box = lazy(lambda: game_box.css('div.ergebnis-wrap'))
+
+    def halftime_score():
+      # Get all text including text in nested elements like <span>
+      halftime_texts = result_box().css('div.sb-halbzeit *::text, div.sb-halbzeit::text').getall()
+      if halftime_texts:
+        halftime_text = self.safe_strip(''.join(halftime_texts))
+        # Extract score pattern like "0:1" or "(0:1)"
+        halftime_match = re.search(r'\(?(\d+:\d+)\)?', halftime_text)
+        if halftime_match:
+          return halftime_match.group(1)
+      return None
+
+    def events():
+      return (
+        self.extract_game_events(response, event_type="Goals") +
+        self.extract_game_events(response, event_type="Substitutions") +
+        self.extract_game_events(response, event_type="Cards") +
+        self.extract_game_events(response, event_type="Shootout")
       )
-    manager_names = [self.safe_strip(row.xpath("./text()").get()) for row in manager_rows]
-    manager_hrefs = [row.xpath("./@href").get() for row in manager_rows]
-
-    game_events = (
-      self.extract_game_events(response, event_type="Goals") +
-      self.extract_game_events(response, event_type="Substitutions") +
-      self.extract_game_events(response, event_type="Cards") +
-      self.extract_game_events(response, event_type="Shootout")
-    )
 
     # Extract player lineups from both teams
     # Note: Not all lineup sections have consistent class names, so we look for
     # large-6 columns divs that contain formation containers
-    lineup_sections = response.xpath('//div[contains(@class, "large-6") and contains(@class, "columns") and .//div[@class="formation-player-container"]]')
+    @lazy
+    def lineup_sections():
+      sections = response.xpath('//div[contains(@class, "large-6") and contains(@class, "columns") and .//div[@class="formation-player-container"]]')
+      # First section is home team, second section is away team
+      return sections if len(sections) >= 2 else None
 
-    home_starting_lineup = []
-    home_substitutes = []
-    away_starting_lineup = []
-    away_substitutes = []
+    def lineup(index, extract):
+      sections = lineup_sections()
+      return extract(sections[index]) if sections is not None else []
 
-    if len(lineup_sections) >= 2:
-      # First section is home team
-      home_starting_lineup = self.extract_starting_lineup(lineup_sections[0])
-      home_substitutes = self.extract_substitutes(lineup_sections[0])
-
-      # Second section is away team
-      away_starting_lineup = self.extract_starting_lineup(lineup_sections[1])
-      away_substitutes = self.extract_substitutes(lineup_sections[1])
+    # extract from line-ups "box"
+    @lazy
+    def managers():
+      manager_rows = response.xpath(
+          "//tr[(contains(td/b/text(),'Manager')) or (contains(td/div/text(),'Manager'))]/td[2]/a"
+        )
+      manager_names = [self.safe_strip(row.xpath("./text()").get()) for row in manager_rows]
+      manager_hrefs = [row.xpath("./@href").get() for row in manager_rows]
+      if len(manager_names) == 2 and len(manager_hrefs) == 2:
+        return [
+          {'name': name, 'href': href}
+          for name, href in zip(manager_names, manager_hrefs)
+        ]
+      return None
+
+    def manager(index):
+      return managers()[index] if managers() is not None else OMITTED
 
     item = {
       **base,
       'type': 'game',
       'game_id': game_id,
-      'home_club': {
-        'type': 'club',
-        'href': home_club_href
-      },
-      'home_club_position': home_club_position,
-      'away_club': {
-        'type': 'club',
-        'href': away_club_href
-      },
-      'away_club_position': away_club_position,
-      'result': result,
-      'halftime_score': halftime_score,
-      'matchday': matchday,
-      'date': date,
-      'date_iso': date_iso,
-      'kickoff_time': kickoff_time,
-      'stadium': stadium,
-      'attendance': attendance,
-      'referee': referee,
-      'events': game_events,
-      'home_starting_lineup': home_starting_lineup,
-      'home_substitutes': home_substitutes,
-      'away_starting_lineup': away_starting_lineup,
-      'away_substitutes': away_substitutes
+      **self.extract_fields({
+        'home_club': lambda: {
+          'type': 'club',
+          'href': home_club_box().css('a::attr(href)').get()
+        },
+        'home_club_position': lambda: home_club_box()[0].xpath('p/text()').get(),
+        'away_club': lambda: {
+          'type': 'club',
+          'href': away_club_box().css('a::attr(href)').get()
+        },
+        'away_club_position': lambda: away_club_box()[0].xpath('p/text()').get(),
+        'result': lambda: self.safe_strip(result_box().css('div.sb-endstand::text').get()),
+        'halftime_score': halftime_score,
+        'matchday': lambda: self.safe_strip(text_elements()[0].get()).split("  ")[0],
+        'date': lambda: self.safe_strip(datetime_box().xpath('p/a[contains(@href, "datum")]/text()').get()),
+        'date_iso': date_iso,
+        'kickoff_time': kickoff_time,
+        'stadium': lambda: self.safe_strip(venue_box().xpath('node()')[1].xpath('a/text()').get()),
+        'attendance': attendance,
+        'referee': referee,
+        'events': events,
+        'home_starting_lineup': lambda: lineup(0, self.extract_starting_lineup),
+        'home_substitutes': lambda: lineup(0, self.extract_substitutes),
+        'away_starting_lineup': lambda: lineup(1, self.extract_starting_lineup),
+        'away_substitutes': lambda: lineup(1, self.extract_substitutes),
+        'home_manager': lambda: manager(0),
+        'away_manager': lambda: manager(1)
+      })
     }
 
-    if len(manager_names) == 2 and len(manager_hrefs) == 2:
-      home_manager_name, away_manager_name = manager_names
-      home_manager_href, away_manager_href = manager_hrefs
-      item["home_manager"] = {
-        'name': home_manager_name,
-        'href': home_manager_href
-      }
-      item["away_manager"] = {
-        'name': away_manager_name,
-        'href': away_manager_href
-      }
-    
     yield item
  
\ No newline at end of file
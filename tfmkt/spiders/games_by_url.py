@@ -1,4 +1,16 @@
 from tfmkt.spiders.games import GamesSpider
+from tfmkt.utils import read_jsonlines
+import datetime
+import re
+
+# a final score, possibly followed by a qualifier such as "aet" or "on pens."
+FINAL_SCORE_PATTERN = re.compile(r'^\d+:\d+')
+
+
+def final_score(result):
+  """The score of a game result, or None if the result is not a final score (e.g. "-:-" or "postponed")."""
+  match = FINAL_SCORE_PATTERN.match(result or '')
+  return match.group() if match else None
 
 
 class GamesByUrlSpider(GamesSpider):
@@ -18,10 +30,57 @@ class GamesByUrlSpider(GamesSpider):
 
   The spider reuses all parsing logic from GamesSpider.parse_game() to extract
   comprehensive game data including lineups, events, managers, referee, etc.
+
+  Incremental mode:
+    scrapy crawl games_by_url -a parents=game_urls.json -a previous=games.json
+
+  With `previous` (a comma separated list of outputs of earlier runs, optionally
+  gzip compressed), games that were already scraped with a final result are
+  skipped. Only new games, games whose result in the parents (as listed by
+  games_urls) differs from the one scraped, and games played since are fetched.
+  Games that have not been played yet are skipped as well.
   """
 
   name = 'games_by_url'
 
+  def __init__(self, previous=None, **kwargs):
+    super().__init__(**kwargs)
+    self.previous_results = None
+    if previous is not None:
+      self.previous_results = {}
+      for file_name in previous.split(','):
+        for item in read_jsonlines(file_name):
+          if item.get('type') == 'game' and item.get('game_id') is not None:
+            self.previous_results[int(item['game_id'])] = item.get('result')
+
+  def needs_scraping(self, item) -> bool:
+    """Whether a game has to be scraped in incremental mode.
+
+    :param item: A game parent, as emitted by the games_urls spider.
+    :type item: dict
+    :return: False if the game is known final in the previous output, or has not been played yet.
+    :rtype: bool
+    """
+    game_id = item.get('game_id') or item['href'].rstrip('/').split('/')[-1]
+    listed_result = item.get('result')
+
+    if not listed_result:
+      date_iso = item.get('date_iso')
+      if date_iso and date_iso > datetime.date.today().isoformat():
+        return False
+
+    previous_score = final_score(self.previous_results.get(int(game_id)))
+    if previous_score is None:
+      return True
+    listed_score = final_score(listed_result)
+    return listed_score is not None and listed_score != previous_score
+
+  def entrypoint_requests(self, item):
+    if self.previous_results is not None and not self.needs_scraping(item):
+      self.crawler.stats.inc_value('incremental/skipped_games', spider=self)
+      return []
+    return super().entrypoint_requests(item)
+
   def parse(self, response, parent):
     """Parse game page directly from URL.
 
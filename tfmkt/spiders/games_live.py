@@ -0,0 +1,183 @@
+from tfmkt.fields import extract_fields
+from tfmkt.spiders.games_by_url import GamesByUrlSpider, final_score
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider
+from twisted.internet import task
+from dateutil import tz
+import datetime
+import json
+
+
+class GamesLiveSpider(GamesByUrlSpider):
+  """Long-running spider that polls the games in play and emits their new events.
+
+  Usage:
+    scrapy crawl games_urls -a parents=competitions.json > game_urls.json
+    jq -c 'select(.date_iso == "2024-09-26")' game_urls.json | scrapy crawl games_live -a interval=30
+
+  Parents are games as emitted by the games_urls spider. A game is polled every
+  `interval` seconds from `lead` minutes before its kick-off (`date_iso` and
+  `kickoff_time`, in `timezone`) until it reaches a final result, and at most
+  for `max_duration` minutes. Game pages are never read from nor stored to the
+  HTTP cache.
+
+  Events are compared with the ones seen in the previous polls of the game, and
+  only new ones are emitted, one item per event:
+    {"type": "game_event", "game_id": 4625774, "href": "...", "result": "1:0", "event": {...}, "parent": {...}}
+
+  A game is considered final once it has a score, `final_after` minutes have
+  passed since kick-off and a poll brought no change. Its full game item (as
+  emitted by games_by_url) is emitted then. The spider stops when no game is
+  left to poll.
+
+  With a `fields` argument, the fields the poller relies on (`POLLED_FIELDS`)
+  are extracted anyway, and only the emitted items are projected on the
+  requested fields.
+  """
+
+  name = 'games_live'
+  leaf_callbacks = ['parse_live']
+  # callbacks that can not be offloaded (see tfmkt/offload.py)
+  stateful_callbacks = ['parse_live']
+
+  # fields of the game items read by the poller, extracted whatever the `fields` argument
+  POLLED_FIELDS = frozenset(('href', 'result', 'events'))
+
+  def __init__(self, interval=60, lead=5, max_duration=180, final_after=110, timezone='Europe/London', **kwargs):
+    super().__init__(**kwargs)
+    self.interval = float(interval)
+    self.lead = datetime.timedelta(minutes=float(lead))
+    self.max_duration = datetime.timedelta(minutes=float(max_duration))
+    self.final_after = datetime.timedelta(minutes=float(final_after))
+    self.timezone = tz.gettz(timezone)
+    if self.timezone is None:
+      raise ValueError(f"Unknown timezone: {timezone}")
+
+    # game id -> parent, for games still to be polled
+    self.games = {}
+    # game id -> keys of the events seen so far
+    self.snapshots = {}
+    # game id -> (result, number of events) at the previous poll
+    self.previous_states = {}
+    self.in_flight = set()
+    self.poller = None
+
+  @classmethod
+  def from_crawler(cls, crawler, *args, **kwargs):
+    spider = super().from_crawler(crawler, *args, **kwargs)
+    crawler.signals.connect(spider.spider_opened, signal=signals.spider_opened)
+    crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+    crawler.signals.connect(spider.spider_closed, signal=signals.spider_closed)
+    return spider
+
+  def start_requests(self):
+    for item in self.entrypoints:
+      self.entrypoint_requests(item)
+    return []
+
+  def entrypoint_requests(self, item):
+    """Register a game to be polled. Requests are made by the poller, not here."""
+    game_id = int(item.get('game_id') or item['href'].rstrip('/').split('/')[-1])
+    self.games[game_id] = item
+    return []
+
+  def spider_opened(self, spider):
+    self.poller = task.LoopingCall(self.poll)
+    self.poller.start(self.interval, now=True)
+
+  def spider_closed(self, spider):
+    if self.poller is not None and self.poller.running:
+      self.poller.stop()
+
+  def spider_idle(self, spider):
+    if self.games:
+      raise DontCloseSpider
+
+  def kickoff(self, item):
+    """The kick-off time of a game, or midnight of its date if its time is unknown."""
+    date = datetime.date.fromisoformat(item['date_iso'])
+    kickoff_time = datetime.time(0, 0)
+    for time_format in ('%I:%M %p', '%H:%M'):
+      try:
+        kickoff_time = datetime.datetime.strptime((item.get('kickoff_time') or '').strip(), time_format).time()
+        break
+      except ValueError:
+        continue
+    return datetime.datetime.combine(date, kickoff_time, tzinfo=self.timezone)
+
+  def now(self):
+    return datetime.datetime.now(self.timezone)
+
+  def poll(self):
+    """Request the pages of the games in play that are not being fetched already."""
+    now = self.now()
+    for game_id, item in list(self.games.items()):
+      if not item.get('date_iso'):
+        self.logger.warning("Game %s has no date, it is not polled", game_id)
+        del self.games[game_id]
+        continue
+
+      kickoff = self.kickoff(item)
+      if now > kickoff + self.max_duration:
+        self.logger.info("Stopped polling game %s, it did not reach a final result in time", game_id)
+        self.crawler.stats.inc_value('live/expired_games', spider=self)
+        del self.games[game_id]
+      elif now >= kickoff - self.lead and game_id not in self.in_flight:
+        self.in_flight.add(game_id)
+        self.crawler.engine.crawl(
+          Request(
+            f"{self.base_url}{item['href']}",
+            callback=self.parse_live,
+            errback=self.poll_failed,
+            dont_filter=True,
+            meta={'dont_cache': True, 'game_id': game_id},
+            cb_kwargs={'parent': item}
+          )
+        )
+
+    if not self.games and self.poller.running:
+      self.poller.stop()
+
+  def poll_failed(self, failure):
+    self.in_flight.discard(failure.request.meta['game_id'])
+
+  def extract_fields(self, field_functions):
+    return extract_fields(field_functions, None if self.fields is None else self.fields | self.POLLED_FIELDS)
+
+  def event_key(self, event) -> str:
+    return json.dumps(event, sort_keys=True)
+
+  def parse_live(self, response, parent):
+    game_id = response.meta['game_id']
+    self.in_flight.discard(game_id)
+    self.crawler.stats.inc_value('live/polls', spider=self)
+
+    for item in self.parse(response, parent):
+      seen = self.snapshots.setdefault(game_id, set())
+      for event in item['events']:
+        key = self.event_key(event)
+        if key in seen:
+          continue
+        seen.add(key)
+        yield {
+          'type': 'game_event',
+          'game_id': game_id,
+          'href': item['href'],
+          'result': item['result'],
+          'event': event,
+          'parent': parent
+        }
+
+      state = (item['result'], len(item['events']))
+      unchanged = self.previous_states.get(game_id) == state
+      self.previous_states[game_id] = state
+      if (
+        game_id in self.games
+        and final_score(item['result']) is not None
+        and self.now() >= self.kickoff(parent) + self.final_after
+        and unchanged
+      ):
+        self.logger.info("Game %s is final (%s), stopped polling it", game_id, item['result'])
+        self.crawler.stats.inc_value('live/final_games', spider=self)
+        del self.games[game_id]
+        yield item
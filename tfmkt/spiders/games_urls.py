@@ -34,6 +34,7 @@ class GamesUrlsSpider(BaseSpider):
   """
 
   name = 'games_urls'
+  leaf_callbacks = ['extract_game_urls']
 
   def parse(self, response, parent):
     """Parse competition page and navigate to fixtures page.
@@ -2,11 +2,28 @@ from tfmkt.spiders.common import BaseSpider
 from scrapy.shell import Response
 from scrapy.shell import inspect_response # required for debugging
 from urllib.parse import unquote, urlparse
+from tfmkt.fields import OMITTED, lazy
+from tfmkt.normalization import market_value
 import re
 import json
 
+# market value in the meta description of profiles
+MARKET_VALUE_DESCRIPTION_PATTERN = re.compile(r'market value(?::| is)\s*(€[\d.,]+(?:bn|k|m)?)', re.IGNORECASE)
+
 class PlayersSpider(BaseSpider):
   name = 'players'
+  leaf_callbacks = ['parse_details']
+
+  def parse_market_value(self, text):
+    """Parse a market value such as '€25k' or '€18.00m' to a float number of euros, or None.
+
+    Whole values are converted to integers by the normalization pipeline (see tfmkt/normalization.py).
+    """
+    try:
+      value = market_value(text)
+    except ValueError:
+      return None
+    return None if value is None else float(value)
 
   def _extract_date_of_birth(self, response):
     """Safely extract date of birth from birth date element."""
@@ -96,43 +113,29 @@ class PlayersSpider(BaseSpider):
 
     # parse 'PLAYER DATA' section
 
-    attributes = {}
+    name_element = lazy(lambda: response.xpath("//h1[@class='data-header__headline-wrapper']"))
 
-    name_element = response.xpath("//h1[@class='data-header__headline-wrapper']")
-    attributes["name"] = self.safe_strip("".join(name_element.xpath("text()").getall()).strip())
-    attributes["last_name"] = self.safe_strip(name_element.xpath("strong/text()").get())
-    attributes["number"] = self.safe_strip(name_element.xpath("span/text()").get())
+    def span_after(label, path="text()"):
+      """A field function reading the span following a label, such as 'Foot:'."""
+      return lambda: response.xpath(f"//span[text()='{label}']/following::span[1]/{path}").get()
+
+    # The agent name can either be inside the anchor tag, title of the anchor tag or
+    def player_agent():
+      return {
+        'href': response.xpath("//span[text()='Player agent:']/following::span[1]/a/@href").get(),
+        'name': response.xpath("//span[text()='Player agent:']/following::span[1]/a/span[@class='cp']/@title").get() or  # Case 1: agent name in title attribute
+                response.xpath("//span[text()='Player agent:']/following::span[1]/a/text()").get() or  # Case 2: agent name in <a> text
+                response.xpath("//span[text()='Player agent:']/following::span[1]/span/text()").get()  # Case 3: agent name in <span> text without <a>
+      }
 
-    attributes['name_in_home_country'] = response.xpath("//span[text()='Name in home country:']/following::span[1]/text()").get()
-    attributes['date_of_birth'] = self._extract_date_of_birth(response)
-    attributes['place_of_birth'] = {
-      'country': response.xpath("//span[text()='Place of birth:']/following::span[1]/span/img/@title").get(),
-      'city': response.xpath("//span[text()='Place of birth:']/following::span[1]/span/text()").get()
-    }
-    attributes['age'] = self._extract_age(response)
-    attributes['height'] = response.xpath("//span[text()='Height:']/following::span[1]/text()").get()
-    attributes['citizenship'] = response.xpath("//span[text()='Citizenship:']/following::span[1]/img/@title").get()
-    attributes['position'] = self.safe_strip(response.xpath("//span[text()='Position:']/following::span[1]/text()").get())
-    
-    # The agent name can either be inside the anchor tag, title of the anchor tag or 
-    attributes['player_agent'] = {
-      'href': response.xpath("//span[text()='Player agent:']/following::span[1]/a/@href").get(),
-      'name': response.xpath("//span[text()='Player agent:']/following::span[1]/a/span[@class='cp']/@title").get() or  # Case 1: agent name in title attribute
-              response.xpath("//span[text()='Player agent:']/following::span[1]/a/text()").get() or  # Case 2: agent name in <a> text
-              response.xpath("//span[text()='Player agent:']/following::span[1]/span/text()").get()  # Case 3: agent name in <span> text without <a>
-    }
-    attributes['image_url'] = response.xpath("//img[@class='data-header__profile-image']/@src").get()
     # --- STATUS AND CURRENT CLUB ---
-    status = 'active'
-    date_of_death = self._extract_date_of_death(response)
-    if date_of_death:
-      status = 'deceased'
-      attributes['date_of_death'] = date_of_death
-    else:
-      attributes['date_of_death'] = None
-
-    # Detect retired by href or label text when not deceased
-    if status == 'active':
+    date_of_death = lazy(lambda: self._extract_date_of_death(response))
+
+    @lazy
+    def status():
+      if date_of_death():
+        return 'deceased'
+
       # Deceased without explicit date: placeholder icon/text/slug in Current club
       current_club_node = response.xpath("//span[normalize-space(text())='Current club:']/following::span[1]")
       deceased_placeholder = False
@@ -143,135 +146,107 @@ class PlayersSpider(BaseSpider):
         has_slug_placeholder = current_club_node.xpath(".//a[contains(@href,'/-tm/startseite/verein/')]").get() is not None
         deceased_placeholder = (icon_alt == '---') or has_title_placeholder or has_text_placeholder or has_slug_placeholder
       if deceased_placeholder:
-        status = 'deceased'
+        return 'deceased'
 
-    if status == 'active':
+      # Detect retired by href or label text when not deceased
       retired_href = response.xpath("//span[normalize-space(text())='Current club:']/following::span[1]//a[contains(@href,'/retired/')]/@href").get()
       current_club_text = response.xpath("normalize-space(//span[normalize-space(text())='Current club:']/following::span[1])").get()
       if retired_href or (current_club_text and 'retired' in current_club_text.lower()):
-        status = 'retired'
+        return 'retired'
+      return 'active'
 
-    if status in ['retired', 'deceased']:
-      attributes['current_club'] = None
-    else:
+    def current_club():
+      if status() in ['retired', 'deceased']:
+        return None
       club_href = response.xpath("(//span[normalize-space(text())='Current club:']/following::span[1]//a[@title and not(contains(@href,'/retired/'))]/@href)[1]").get()
-      attributes['current_club'] = {
+      return {
         'href': club_href
       }
-    attributes['status'] = status
-    attributes['foot'] = response.xpath("//span[text()='Foot:']/following::span[1]/text()").get()
-    attributes['joined'] = response.xpath("//span[text()='Joined:']/following::span[1]/text()").get()
-    attributes['contract_expires'] = self.safe_strip(response.xpath("//span[text()='Contract expires:']/following::span[1]/text()").get())
-    attributes['day_of_last_contract_extension'] = response.xpath("//span[text()='Date of last contract extension:']/following::span[1]/text()").get()
-    attributes['outfitter'] = response.xpath("//span[text()='Outfitter:']/following::span[1]/text()").get()
 
     # current_market_value_text = self.safe_strip(response.xpath("//div[@class='tm-player-market-value-development__current-value']/text()").get())
     # current_market_value_link = self.safe_strip(response.xpath("//div[@class='tm-player-market-value-development__current-value']/a/text()").get())
-    attributes['current_market_value'] = None
-    # Get the meta description content
-    meta_description = self.safe_strip(response.xpath("//meta[@name='description']/@content").get())
-    
-    # Use regex to extract the market value (e.g., €25k, €25m)
-    check_match = re.search(r'Market value: (\€[\d\.]+[km]?)', meta_description)
-    if check_match:
-        market_value_text = check_match.group(1)  # e.g., '€25k'
-        
-        # Remove the Euro symbol
-        market_value_text = market_value_text.replace('€', '').strip()
-        
-        # Handle the suffix (k = thousand, m = million)
-        if 'k' in market_value_text:
-            market_value = float(market_value_text.replace('k', '')) * 1000
-            
-        elif 'm' in market_value_text:
-            market_value = float(market_value_text.replace('m', '')) * 1000000
-        
-        attributes['current_market_value'] = market_value
-    else:
-        attributes['current_market_value'] = None
-
-    # Free agent (German path) pages often use: "market value is €..."
-    current_club_href_for_mv = attributes.get('current_club', {}).get('href') if isinstance(attributes.get('current_club'), dict) else None
-    if current_club_href_for_mv == '/vereinslos/startseite/verein/515' and attributes['current_market_value'] is None and meta_description:
-      mv_match = re.search(r'market value is\s*(\€[\d\.,]+[km]?)', meta_description, flags=re.IGNORECASE)
-      if mv_match:
-        mv_text = mv_match.group(1).replace('€', '').replace(',', '').strip()
-        if 'k' in mv_text:
-          attributes['current_market_value'] = float(mv_text.replace('k', '')) * 1000
-        elif 'm' in mv_text:
-          attributes['current_market_value'] = float(mv_text.replace('m', '')) * 1000000
-        else:
-          try:
-            attributes['current_market_value'] = float(mv_text)
-          except Exception:
-            attributes['current_market_value'] = None
-
-    # Fallback: read the value displayed in the header box if still None
-    if attributes['current_market_value'] is None:
+    def current_market_value():
+      # Get the meta description content, e.g. "... Market value: €25k ..." or, for free agents, "... market value is €25k"
+      meta_description = self.safe_strip(response.xpath("//meta[@name='description']/@content").get())
+      check_match = MARKET_VALUE_DESCRIPTION_PATTERN.search(meta_description or '')
+      if check_match:
+        value = self.parse_market_value(check_match.group(1))
+        if value is not None:
+          return value
+
+      # Fallback: read the value displayed in the header box, e.g. '€18.00' with unit 'm'
       header_mv_text = response.xpath("normalize-space(//div[contains(@class,'data-header__box--small')]//a[contains(@class,'data-header__market-value-wrapper')]/text()[1])").get()
       header_unit = response.xpath("normalize-space(//div[contains(@class,'data-header__box--small')]//a[contains(@class,'data-header__market-value-wrapper')]//span[contains(@class,'waehrung')]/text())").get()
       if header_mv_text:
-        # Example: '€18.00' with unit 'm' or '€100' with unit 'mil'
-        header_mv_text = header_mv_text.replace('€', '').strip()
-        header_mv_text = header_mv_text.replace('.', '').replace(',', '.') if header_unit and header_unit.lower() in ['mil', 'mio.', 'bn'] else header_mv_text
-        try:
-          base_value = float(header_mv_text)
-          unit = (header_unit or '').strip().lower()
-          if unit in ['m', 'mio', 'mio.', 'mil']:
-            attributes['current_market_value'] = base_value * 1_000_000
-          elif unit in ['k']:
-            attributes['current_market_value'] = base_value * 1_000
-          elif unit in ['bn', 'b']:
-            attributes['current_market_value'] = base_value * 1_000_000_000
-          else:
-            # If no unit (rare), assume raw euros
-            attributes['current_market_value'] = base_value
-        except Exception:
-          pass
-    
-    attributes['highest_market_value'] = self.safe_strip(response.xpath("//div[@class='tm-player-market-value-development__max-value']/text()").get())
-
-    social_media_value_node = response.xpath("//span[text()='Social-Media:']/following::span[1]")
-    if len(social_media_value_node) > 0:
-      attributes['social_media'] = []
-      for element in social_media_value_node.xpath('div[@class="socialmedia-icons"]/a'):
-        href = element.xpath('@href').get()
-        attributes['social_media'].append(
-          href
-        )
-
-
-
-    attributes['code'] = unquote(urlparse(base["href"]).path.split("/")[1])
+        return self.parse_market_value(f"{header_mv_text}{header_unit or ''}")
+      return None
 
-    # --- ON LOAN FROM ---
-    attributes['on_loan_from'] = None
-    on_loan_from = response.xpath(
-        "//span[normalize-space(text())='On loan from:']"
-        "/following-sibling::span[1]//a/@href"
-    ).get()
-    if on_loan_from:
-        attributes['on_loan_from'] = on_loan_from.strip()
+    def social_media():
+      social_media_value_node = response.xpath("//span[text()='Social-Media:']/following::span[1]")
+      if len(social_media_value_node) == 0:
+        return OMITTED
+      return [
+        element.xpath('@href').get()
+        for element in social_media_value_node.xpath('div[@class="socialmedia-icons"]/a')
+      ]
 
+    # --- ON LOAN FROM ---
+    def on_loan_from():
+      on_loan_from = response.xpath(
+          "//span[normalize-space(text())='On loan from:']"
+          "/following-sibling::span[1]//a/@href"
+      ).get()
+      return on_loan_from.strip() if on_loan_from else None
 
     # --- CONTRACT OPTION ---
-    attributes['contract_option'] = None
-    contract_option = response.xpath("//span[text()='Contract option:']/following::span[1]//text()").get()
-    if contract_option:
-        attributes['contract_option'] = contract_option.strip()
+    def contract_option():
+      contract_option = response.xpath("//span[text()='Contract option:']/following::span[1]//text()").get()
+      return contract_option.strip() if contract_option else None
 
     # --- CONTRACT THERE EXPIRES ---
-    attributes['contract_there_expires'] = None
-
-    contract_there_expires = response.xpath(
-        "//span[text()='Contract there expires:']/following::span[1]//text()"
-    ).get()
-
-    if contract_there_expires is not None:
+    def contract_there_expires():
+      contract_there_expires = response.xpath(
+          "//span[text()='Contract there expires:']/following::span[1]//text()"
+      ).get()
+      if contract_there_expires is not None:
         cleaned = contract_there_expires.strip()
         # Transfermarkt denotes "no data" with a dash; convert it to None
         if cleaned and cleaned != "-":
-            attributes['contract_there_expires'] = cleaned
+          return cleaned
+      return None
+
+    attributes = self.extract_fields({
+      'name': lambda: self.safe_strip("".join(name_element().xpath("text()").getall()).strip()),
+      'last_name': lambda: self.safe_strip(name_element().xpath("strong/text()").get()),
+      'number': lambda: self.safe_strip(name_element().xpath("span/text()").get()),
+      'name_in_home_country': span_after('Name in home country:'),
+      'date_of_birth': lambda: self._extract_date_of_birth(response),
+      'place_of_birth': lambda: {
+        'country': span_after('Place of birth:', 'span/img/@title')(),
+        'city': span_after('Place of birth:', 'span/text()')()
+      },
+      'age': lambda: self._extract_age(response),
+      'height': span_after('Height:'),
+      'citizenship': span_after('Citizenship:', 'img/@title'),
+      'position': lambda: self.safe_strip(span_after('Position:')()),
+      'player_agent': player_agent,
+      'image_url': lambda: response.xpath("//img[@class='data-header__profile-image']/@src").get(),
+      'date_of_death': lambda: date_of_death() or None,
+      'current_club': current_club,
+      'status': status,
+      'foot': span_after('Foot:'),
+      'joined': span_after('Joined:'),
+      'contract_expires': lambda: self.safe_strip(span_after('Contract expires:')()),
+      'day_of_last_contract_extension': span_after('Date of last contract extension:'),
+      'outfitter': span_after('Outfitter:'),
+      'current_market_value': current_market_value,
+      'highest_market_value': lambda: self.safe_strip(response.xpath("//div[@class='tm-player-market-value-development__max-value']/text()").get()),
+      'social_media': social_media,
+      'code': lambda: unquote(urlparse(base["href"]).path.split("/")[1]),
+      'on_loan_from': on_loan_from,
+      'contract_option': contract_option,
+      'contract_there_expires': contract_there_expires,
+    })
 
     yield {
       **base,
@@ -0,0 +1,141 @@
+"""A local SQLite store keeping the latest version of every entity scraped.
+
+Answering "what is the latest version of game X" from JSON dumps means reading
+them all. `EntityStore` keeps one row per entity instead, keyed by type and
+entity key (see `tfmkt.keys.ENTITY_KEY_FIELDS`): the item as last scraped,
+and when it was first and last scraped. `EntityStorePipeline` upserts every item
+into it while crawling, and the store can be queried for the parents of the next
+crawl, either by spiders or with `scrapy store`:
+
+    scrapy crawl players -a parents=clubs.json -s ENTITY_STORE=entities.db > /dev/null
+    scrapy crawl appearances -a parents=entities.db -a parents_type=player
+    scrapy store entities.db --type player --older-than 7 | scrapy crawl appearances
+
+The database is in WAL mode, so that it can be read while a crawl writes to it,
+and changes are committed in batches.
+"""
+import datetime
+import json
+import sqlite3
+import typing
+
+# extensions of the parents files read as entity stores
+STORE_EXTENSIONS = ('db', 'sqlite', 'sqlite3')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    type TEXT NOT NULL,
+    key TEXT NOT NULL,
+    parent TEXT,
+    item TEXT NOT NULL,
+    first_scraped_at TEXT NOT NULL,
+    last_scraped_at TEXT NOT NULL,
+    PRIMARY KEY (type, key)
+);
+CREATE INDEX IF NOT EXISTS entities_parent ON entities (parent);
+CREATE INDEX IF NOT EXISTS entities_last_scraped_at ON entities (type, last_scraped_at);
+"""
+
+UPSERT = """
+INSERT INTO entities (type, key, parent, item, first_scraped_at, last_scraped_at)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (type, key) DO UPDATE SET
+    parent = excluded.parent,
+    item = excluded.item,
+    last_scraped_at = excluded.last_scraped_at
+"""
+
+
+def now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+
+
+class EntityStore:
+    """The latest version of every entity, in a SQLite database.
+
+    :param path: Path to the database file, created if it does not exist.
+    :type path: str
+    :param commit_size: Number of upserts after which changes are committed.
+    :type commit_size: int
+    """
+
+    def __init__(self, path: str, commit_size: int = 1000):
+        self.path = path
+        self.commit_size = commit_size
+        self.uncommitted = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def upsert(self, entity_type: str, key, item: dict, scraped_at: str = None):
+        """Insert the row of an entity, or replace its item if it is stored already.
+
+        :param entity_type: Type of the entity, such as "game".
+        :type entity_type: str
+        :param key: Key of the entity, its game_id or href.
+        :param item: The item scraped.
+        :type item: dict
+        :param scraped_at: ISO timestamp of the scrape, defaults to now.
+        :type scraped_at: str
+        """
+        scraped_at = scraped_at or now()
+        parent = item.get('parent')
+        parent_href = parent.get('href') if isinstance(parent, dict) else None
+        self.connection.execute(
+            UPSERT, (entity_type, str(key), parent_href, json.dumps(item, default=str), scraped_at, scraped_at)
+        )
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_size:
+            self.commit()
+
+    def delete(self, entity_type: str, key):
+        self.connection.execute('DELETE FROM entities WHERE type = ? AND key = ?', (entity_type, str(key)))
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_size:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.uncommitted = 0
+
+    def get(self, entity_type: str, key) -> typing.Optional[dict]:
+        """The latest version of an entity, e.g. `store.get('game', 3426916)`, or None if it is not stored."""
+        row = self.connection.execute(
+            'SELECT item FROM entities WHERE type = ? AND key = ?', (entity_type, str(key))
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def query(self, entity_type: str = None, parent: str = None, scraped_before: str = None,
+              where: str = None) -> typing.Iterator[dict]:
+        """The latest version of the entities matching all the given conditions.
+
+        :param entity_type: Only entities of this type.
+        :param parent: Only entities with this parent href.
+        :param scraped_before: Only entities last scraped before this ISO timestamp.
+        :param where: An additional SQL condition on the `entities` table, such as
+          "json_extract(item, '$.country_name') = 'Spain'".
+        :return: An iterator over the items, ordered by type and key.
+        :rtype: typing.Iterator[dict]
+        """
+        conditions, parameters = [], []
+        for condition, value in (('type = ?', entity_type), ('parent = ?', parent), ('last_scraped_at < ?', scraped_before)):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        if where:
+            conditions.append(f"({where})")
+        sql = 'SELECT item FROM entities'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        for (item,) in self.connection.execute(sql + ' ORDER BY type, key', parameters):
+            yield json.loads(item)
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+
+def is_store(file_name: str) -> bool:
+    """Whether a parents file is an entity store, rather than JSON lines."""
+    return file_name.split('.')[-1] in STORE_EXTENSIONS
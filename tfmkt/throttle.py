@@ -0,0 +1,176 @@
+"""Adaptive request rate control tuned to Transfermarkt.
+
+Scrapy's AutoThrottle adjusts the download delay to the server latency only.
+Transfermarkt starts answering with 429 (Too Many Requests) or 503 once a
+client goes above its rate limit, and keeps doing so for a while, so a
+backfill either crawls well below the limit or gets blocked halfway through.
+
+`AdaptiveThrottle` targets a requests-per-second budget instead
+(`THROTTLE_TARGET_RPS`, per download slot, that is, per domain). The
+download delay of a slot starts at
+`1 / THROTTLE_TARGET_RPS` and
+
+* is multiplied by `THROTTLE_BACKOFF_FACTOR` on every 429/503 response, and
+  raised to the `Retry-After` header value when the server sends one,
+* is multiplied by `THROTTLE_BACKOFF_FACTOR` as well when a response takes
+  longer than `THROTTLE_SLOW_RESPONSE` seconds,
+* is multiplied by `THROTTLE_RECOVERY_FACTOR` on every healthy response, so
+  that the crawl ramps back up to the target rate once the site is healthy.
+
+The delay never goes above `THROTTLE_MAX_DELAY`. Rejected requests are
+retried by Scrapy's RetryMiddleware, which handles 429 and 503 by default.
+
+The effective request rate and the current delay are kept in the crawler
+stats (`throttle/*`) and logged every `THROTTLE_LOG_INTERVAL` seconds.
+"""
+from collections import deque
+from email.utils import parsedate_to_datetime
+import datetime
+import logging
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_STATUSES = (429, 503)
+
+
+def parse_retry_after(value) -> float:
+    """Parse the value of a `Retry-After` header.
+
+    https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Retry-After
+
+    :param value: Header value, either delay seconds or an HTTP date.
+    :type value: bytes
+    :return: The number of seconds to wait, or None if the header could not be parsed.
+    :rtype: float
+    """
+    if not value:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('latin-1')
+    value = value.strip()
+
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = datetime.datetime.now(tz=retry_at.tzinfo or datetime.timezone.utc)
+    return max(0.0, (retry_at - now).total_seconds())
+
+
+class AdaptiveThrottle:
+    """Extension that keeps the crawl at a target request rate and backs off when the site pushes back.
+
+    Enabled with the `THROTTLE_ENABLED` setting. It replaces `DOWNLOAD_DELAY`
+    and `AUTOTHROTTLE_ENABLED`, which should be left unset.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('THROTTLE_ENABLED'):
+            raise NotConfigured
+
+        self.crawler = crawler
+        self.target_rps = settings.getfloat('THROTTLE_TARGET_RPS')
+        if self.target_rps <= 0:
+            raise NotConfigured
+        self.mindelay = 1.0 / self.target_rps
+        self.maxdelay = settings.getfloat('THROTTLE_MAX_DELAY')
+        self.backoff_factor = settings.getfloat('THROTTLE_BACKOFF_FACTOR')
+        self.recovery_factor = settings.getfloat('THROTTLE_RECOVERY_FACTOR')
+        self.slow_response = settings.getfloat('THROTTLE_SLOW_RESPONSE')
+        self.log_interval = settings.getfloat('THROTTLE_LOG_INTERVAL')
+        self.window = settings.getfloat('THROTTLE_RATE_WINDOW')
+
+        self.downloaded = deque()
+        self.started = None
+        self.task = None
+
+        crawler.signals.connect(self._spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self._spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(self._response_downloaded, signal=signals.response_downloaded)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _spider_opened(self, spider):
+        self.started = time.monotonic()
+        spider.download_delay = self.mindelay
+        self.crawler.stats.set_value('throttle/target_rps', self.target_rps, spider=spider)
+        self.crawler.stats.set_value('throttle/delay', self.mindelay, spider=spider)
+        self.crawler.stats.set_value('throttle/max_delay', self.mindelay, spider=spider)
+        if self.log_interval:
+            self.task = task.LoopingCall(self.log, spider)
+            self.task.start(self.log_interval, now=False)
+
+    def _spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+
+    def _response_downloaded(self, response, request, spider):
+        now = time.monotonic()
+        self.downloaded.append(now)
+
+        key = request.meta.get('download_slot')
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is None:
+            return
+
+        latency = request.meta.get('download_latency')
+        olddelay = slot.delay
+
+        if response.status in BACKOFF_STATUSES:
+            self.crawler.stats.inc_value(f'throttle/backoff/{response.status}', spider=spider)
+            new_delay = max(slot.delay, self.mindelay) * self.backoff_factor
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                new_delay = max(new_delay, retry_after)
+        elif latency is not None and self.slow_response and latency > self.slow_response:
+            self.crawler.stats.inc_value('throttle/backoff/slow', spider=spider)
+            new_delay = max(slot.delay, self.mindelay) * self.backoff_factor
+        else:
+            new_delay = slot.delay * self.recovery_factor
+
+        slot.delay = min(max(self.mindelay, new_delay), self.maxdelay)
+        self.crawler.stats.set_value('throttle/delay', slot.delay, spider=spider)
+        self.crawler.stats.max_value('throttle/max_delay', slot.delay, spider=spider)
+        self.crawler.stats.set_value('throttle/effective_rps', self.effective_rps(now), spider=spider)
+
+        if slot.delay > olddelay:
+            logger.debug(
+                "Backing off %s after %s response from %s: delay %.2fs -> %.2fs",
+                key, response.status, request.url, olddelay, slot.delay,
+                extra={'spider': spider}
+            )
+
+    def effective_rps(self, now=None) -> float:
+        """Requests per second actually downloaded during the last `THROTTLE_RATE_WINDOW` seconds."""
+        now = now or time.monotonic()
+        while self.downloaded and self.downloaded[0] < now - self.window:
+            self.downloaded.popleft()
+        elapsed = min(self.window, now - self.started) if self.started else self.window
+        return len(self.downloaded) / elapsed if elapsed > 0 else 0.0
+
+    def log(self, spider):
+        stats = self.crawler.stats
+        stats.set_value('throttle/effective_rps', self.effective_rps(), spider=spider)
+        logger.info(
+            "Throttle: effective rate %(rate).2f req/s (target %(target).2f), delay %(delay).2fs, "
+            "backoffs 429: %(b429)d, 503: %(b503)d, slow: %(slow)d",
+            {
+                'rate': self.effective_rps(),
+                'target': self.target_rps,
+                'delay': stats.get_value('throttle/delay', 0, spider=spider),
+                'b429': stats.get_value('throttle/backoff/429', 0, spider=spider),
+                'b503': stats.get_value('throttle/backoff/503', 0, spider=spider),
+                'slow': stats.get_value('throttle/backoff/slow', 0, spider=spider),
+            },
+            extra={'spider': spider}
+        )
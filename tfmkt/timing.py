@@ -0,0 +1,343 @@
+"""Per-callback timing and throughput of a crawl.
+
+When a crawl is slow, the crawler stats do not tell whether the time goes to
+downloading, to parsing in one of the callbacks (`parse_game`,
+`parse_details`, `parse_stats`, `parse_lineups`...) or to the item pipelines.
+`CallbackTimingMiddleware` records, for every callback:
+
+* the wall and CPU time spent in the callback, including the iteration of the
+  generators it returns,
+* the download latency and the size of the responses it parses,
+* the number of items and requests it yields, and the number of errors it raises,
+
+and samples the depth of the scheduler, downloader and item processing queues.
+
+Every `CALLBACK_TIMING_INTERVAL` seconds, and when the spider closes, a JSON
+line with these figures and the p50/p95/p99 of the times of each callback is
+logged, and written in the Prometheus text format to
+`CALLBACK_TIMING_PROMETHEUS_FILE` if set, for the node exporter textfile
+collector. Percentiles are computed over a uniform sample of
+`CALLBACK_TIMING_RESERVOIR_SIZE` calls per callback.
+
+The middleware is enabled with `CALLBACK_TIMING_ENABLED`. When disabled, it is
+not part of the middleware chain and costs nothing. It should run right next
+to the spider, after every other spider middleware, so that only the callback
+is timed. Callbacks offloaded to worker processes (see `tfmkt/offload.py`) are
+reported under their own name, but only the time they take on the reactor
+thread is recorded, not the time spent parsing in the worker.
+"""
+from pathlib import Path
+import functools
+import json
+import logging
+import os
+import random
+import time
+import typing
+
+from scrapy import Request, signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+# prefix of the Prometheus metric names
+METRIC_PREFIX = 'tfmkt'
+
+
+class Reservoir:
+    """Uniform sample of a stream of values, of bounded size (Vitter's algorithm R).
+
+    :param size: Maximum number of values kept.
+    :type size: int
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.values = []
+        self.count = 0
+
+    def add(self, value: float):
+        self.count += 1
+        if len(self.values) < self.size:
+            self.values.append(value)
+        else:
+            position = random.randrange(self.count)
+            if position < self.size:
+                self.values[position] = value
+
+    def percentiles(self, percentiles: typing.Iterable[float] = PERCENTILES) -> typing.Dict[float, float]:
+        """The nearest-rank percentiles of the sample, None if it is empty."""
+        values = sorted(self.values)
+        if not values:
+            return {percentile: None for percentile in percentiles}
+        return {
+            percentile: values[min(len(values) - 1, max(0, round(percentile * len(values)) - 1))]
+            for percentile in percentiles
+        }
+
+
+class CallbackMetrics:
+    """Counters and time samples of one callback."""
+
+    def __init__(self, reservoir_size: int):
+        self.calls = 0
+        self.errors = 0
+        self.items = 0
+        self.requests = 0
+        self.response_bytes = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.download_time = 0.0
+        self.wall_times = Reservoir(reservoir_size)
+        self.cpu_times = Reservoir(reservoir_size)
+        self.download_times = Reservoir(reservoir_size)
+
+    def as_dict(self, elapsed: float) -> dict:
+        def seconds(value):
+            return None if value is None else round(value, 6)
+
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'items': self.items,
+            'requests': self.requests,
+            'response_bytes': self.response_bytes,
+            'pages_per_second': round(self.calls / elapsed, 3) if elapsed > 0 else None,
+            'items_per_second': round(self.items / elapsed, 3) if elapsed > 0 else None,
+            **{
+                f'{name}_seconds': {
+                    'sum': round(getattr(self, f'{name}_time'), 6),
+                    **{f'p{round(percentile * 100)}': seconds(value)
+                       for percentile, value in getattr(self, f'{name}_times').percentiles().items()}
+                }
+                for name in ('wall', 'cpu', 'download')
+            },
+        }
+
+
+def callback_name(response) -> str:
+    """The name of the spider callback a response is parsed by."""
+    request = response.request
+    if request is None:
+        return 'parse'
+    name = request.meta.get('offloaded_callback')
+    if name is None:
+        name = getattr(request.callback, '__name__', None) or 'parse'
+    return name
+
+
+class CallbackTimingMiddleware:
+    """Spider middleware timing spider callbacks and counting their output.
+
+    Enabled with the `CALLBACK_TIMING_ENABLED` setting.
+    """
+
+    def __init__(self, crawler, interval: float, prometheus_file: typing.Optional[str], reservoir_size: int):
+        self.crawler = crawler
+        self.interval = interval
+        self.prometheus_file = prometheus_file
+        self.reservoir_size = reservoir_size
+
+        self.callbacks: typing.Dict[str, CallbackMetrics] = {}
+        # callback name, and wall and CPU time of the callback call, by response id
+        self.calls = {}
+        self.opened = None
+        self.task = None
+
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('CALLBACK_TIMING_ENABLED'):
+            raise NotConfigured
+        return cls(
+            crawler,
+            settings.getfloat('CALLBACK_TIMING_INTERVAL'),
+            settings.get('CALLBACK_TIMING_PROMETHEUS_FILE'),
+            settings.getint('CALLBACK_TIMING_RESERVOIR_SIZE'),
+        )
+
+    def spider_opened(self, spider):
+        self.opened = time.monotonic()
+        if self.interval:
+            self.task = task.LoopingCall(self.report, spider)
+            self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        snapshot = self.report(spider)
+        stats = self.crawler.stats
+        for name, metrics in snapshot['callbacks'].items():
+            for key in ('calls', 'errors', 'items', 'requests', 'response_bytes'):
+                stats.set_value(f'callback_timing/{name}/{key}', metrics[key], spider=spider)
+            for key in ('wall', 'cpu'):
+                for percentile in ('p50', 'p95', 'p99'):
+                    stats.set_value(f'callback_timing/{name}/{key}_{percentile}',
+                                    metrics[f'{key}_seconds'][percentile], spider=spider)
+
+    def metrics(self, name: str) -> CallbackMetrics:
+        metrics = self.callbacks.get(name)
+        if metrics is None:
+            metrics = self.callbacks[name] = CallbackMetrics(self.reservoir_size)
+        return metrics
+
+    def process_spider_input(self, response, spider):
+        # Scrapy calls the callback a scheduling delay after the spider middlewares
+        # have processed the response, so the call itself is timed by a wrapper
+        request = response.request
+        name = callback_name(response)
+        callback = request.callback or spider._parse
+        key = id(response)
+
+        @functools.wraps(callback)
+        def timed_callback(response, **kwargs):
+            wall_started, cpu_started = time.perf_counter(), time.thread_time()
+            try:
+                return callback(response, **kwargs)
+            finally:
+                self.calls[key] = (name, time.perf_counter() - wall_started, time.thread_time() - cpu_started)
+
+        request.callback = timed_callback
+
+    def process_spider_output(self, response, result, spider):
+        # time spent calling the callback, before its output is iterated
+        name, wall_time, cpu_time = self.calls.pop(id(response), (callback_name(response), 0.0, 0.0))
+        items = requests = 0
+        failed = False
+        iterator = iter(result)
+        try:
+            while True:
+                wall_started, cpu_started = time.perf_counter(), time.thread_time()
+                try:
+                    element = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    wall_time += time.perf_counter() - wall_started
+                    cpu_time += time.thread_time() - cpu_started
+                if isinstance(element, Request):
+                    requests += 1
+                else:
+                    items += 1
+                yield element
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.record(name, response, wall_time, cpu_time, items, requests, failed)
+
+    def process_spider_exception(self, response, exception, spider):
+        # the callback raised before returning its output
+        call = self.calls.pop(id(response), None)
+        if call is not None:
+            name, wall_time, cpu_time = call
+            self.record(name, response, wall_time, cpu_time, 0, 0, True)
+
+    def record(self, name: str, response, wall_time: float, cpu_time: float, items: int, requests: int, failed: bool):
+        metrics = self.metrics(name)
+        metrics.calls += 1
+        metrics.errors += failed
+        metrics.items += items
+        metrics.requests += requests
+        metrics.response_bytes += len(response.body)
+        metrics.wall_time += wall_time
+        metrics.cpu_time += cpu_time
+        metrics.wall_times.add(wall_time)
+        metrics.cpu_times.add(cpu_time)
+        download_time = response.meta.get('download_latency')
+        if download_time is not None:
+            metrics.download_time += download_time
+            metrics.download_times.add(download_time)
+
+    def queue_depths(self) -> typing.Dict[str, int]:
+        """Number of requests waiting in the scheduler, being downloaded, and of responses and items being processed."""
+        engine = self.crawler.engine
+        depths = {}
+        if engine is None:
+            return depths
+        if engine.slot is not None:
+            depths['scheduler'] = len(engine.slot.scheduler)
+            depths['inprogress'] = len(engine.slot.inprogress)
+        depths['downloader'] = len(engine.downloader.active)
+        scraper_slot = engine.scraper.slot
+        if scraper_slot is not None:
+            depths['scraper'] = len(scraper_slot.active)
+            depths['items'] = scraper_slot.itemproc_size
+        return depths
+
+    def snapshot(self, spider) -> dict:
+        elapsed = time.monotonic() - self.opened if self.opened else 0.0
+        return {
+            'spider': spider.name,
+            'elapsed': round(elapsed, 3),
+            'queues': self.queue_depths(),
+            'callbacks': {name: metrics.as_dict(elapsed) for name, metrics in sorted(self.callbacks.items())},
+        }
+
+    def report(self, spider) -> dict:
+        snapshot = self.snapshot(spider)
+        logger.info("Callback timing: %s", json.dumps(snapshot), extra={'spider': spider})
+        if self.prometheus_file:
+            write_prometheus(self.prometheus_file, snapshot)
+        return snapshot
+
+
+def prometheus_lines(snapshot: dict) -> typing.Iterator[str]:
+    """A callback timing snapshot in the Prometheus text exposition format."""
+    spider = snapshot['spider']
+
+    def labels(**values):
+        return '{' + ','.join(f'{key}="{value}"' for key, value in values.items()) + '}'
+
+    counters = (
+        ('calls', 'Responses parsed'),
+        ('errors', 'Responses whose callback raised an exception'),
+        ('items', 'Items yielded'),
+        ('requests', 'Requests yielded'),
+        ('response_bytes', 'Bytes of the responses parsed'),
+    )
+    for key, description in counters:
+        name = f'{METRIC_PREFIX}_callback_{key}_total'
+        yield f'# HELP {name} {description}, by callback.'
+        yield f'# TYPE {name} counter'
+        for callback, metrics in snapshot['callbacks'].items():
+            yield f'{name}{labels(spider=spider, callback=callback)} {metrics[key]}'
+
+    summaries = (
+        ('wall', 'Wall time spent in the callback'),
+        ('cpu', 'CPU time spent in the callback'),
+        ('download', 'Download latency of the responses parsed'),
+    )
+    for key, description in summaries:
+        name = f'{METRIC_PREFIX}_callback_{key}_seconds'
+        yield f'# HELP {name} {description}, by callback.'
+        yield f'# TYPE {name} summary'
+        for callback, metrics in snapshot['callbacks'].items():
+            seconds = metrics[f'{key}_seconds']
+            for percentile in PERCENTILES:
+                value = seconds[f'p{round(percentile * 100)}']
+                if value is not None:
+                    yield f'{name}{labels(spider=spider, callback=callback, quantile=percentile)} {value}'
+            yield f'{name}_sum{labels(spider=spider, callback=callback)} {seconds["sum"]}'
+            yield f'{name}_count{labels(spider=spider, callback=callback)} {metrics["calls"]}'
+
+    name = f'{METRIC_PREFIX}_queue_depth'
+    yield f'# HELP {name} Requests, responses or items waiting in a crawler queue.'
+    yield f'# TYPE {name} gauge'
+    for queue, depth in snapshot['queues'].items():
+        yield f'{name}{labels(spider=spider, queue=queue)} {depth}'
+
+
+def write_prometheus(file_name: str, snapshot: dict):
+    """Write a snapshot to a Prometheus textfile, atomically so that the collector never reads half of it."""
+    path = Path(file_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'.{path.name}.{os.getpid()}')
+    temporary.write_text('\n'.join(prometheus_lines(snapshot)) + '\n', encoding='utf-8')
+    os.replace(temporary, path)
@@ -0,0 +1,236 @@
+"""Canonical forms of Transfermarkt URLs.
+
+The same page reaches the crawler through many URL variants. Transfermarkt
+paths read
+
+    /{slug}/{view}/{segment}/{id}[/{parameter}/{value}...]
+
+and the slug (`/fc-liverpool`) is ignored by the site, it may even be missing.
+Parents files also mix absolute URLs and site-relative hrefs, with or without
+trailing slashes.
+
+`canonical_url` maps all variants of a page to a single URL, which
+`CanonicalRequestFingerprinter` uses to fingerprint requests, so that they share
+one HTTP cache entry and one dupefilter slot. The view, the parameters and the
+query string are kept, as they select different pages: `/startseite/verein/31`
+and `/kader/verein/31` are different pages of the same club, and so are the
+`/plus/1` and `/saison_id/2020` variants (no `saison_id` means the current
+season, whichever it is). Parameters without a value are markers selecting a
+page as well: `/plus/` asks for the detailed view of a competition.
+
+`entity_key` identifies the entity behind a URL regardless of its view, season
+or slug, e.g. "club:31".
+"""
+from urllib.parse import urlsplit, urlunsplit
+from weakref import WeakKeyDictionary
+import re
+import typing
+
+from scrapy.utils.request import RequestFingerprinter
+from w3lib.url import canonicalize_url
+
+# path segment preceding the id of an entity -> entity type
+ENTITY_SEGMENTS = {
+    'wettbewerb': 'competition',
+    'pokalwettbewerb': 'competition',
+    'verein': 'club',
+    'spieler': 'player',
+    'spielbericht': 'game',
+    'trainer': 'coach',
+}
+
+# confederation pages have no entity segment, e.g. /wettbewerbe/europa
+CONFEDERATION_PATTERN = re.compile(r'^/wettbewerbe/([^/]+)$')
+
+# placeholder for the slug in canonical URLs
+CANONICAL_SLUG = '-'
+
+
+class TransfermarktPath(typing.NamedTuple):
+    """The parts of a Transfermarkt entity path, see `split_path`."""
+
+    slug: typing.Optional[str]
+    view: typing.Optional[str]
+    segment: str
+    entity_id: str
+    parameters: typing.Tuple[typing.Tuple[str, str], ...]
+
+    @property
+    def entity_type(self) -> str:
+        return ENTITY_SEGMENTS[self.segment]
+
+    def param(self, name: str) -> typing.Optional[str]:
+        """The value of a path parameter, or None if it is not set."""
+        return next((value for key, value in self.parameters if key == name), None)
+
+    def replace_param(self, name: str, value: typing.Optional[str]) -> 'TransfermarktPath':
+        """Set a path parameter, appending it if missing, or remove it when `value` is None."""
+        parameters = [(key, v) for key, v in self.parameters if key != name or value is not None]
+        if value is not None:
+            if any(key == name for key, _ in parameters):
+                parameters = [(key, str(value) if key == name else v) for key, v in parameters]
+            else:
+                parameters.append((name, str(value)))
+        return self._replace(parameters=tuple(parameters))
+
+    def href(self) -> str:
+        """Join the parts back into a site-relative href."""
+        segments = [segment for segment in (self.slug, self.view) if segment]
+        segments += [self.segment, self.entity_id]
+        for name, value in self.parameters:
+            segments += [name, value]
+        return '/' + '/'.join(segments)
+
+
+def site_path(href: str) -> str:
+    """The path of an href or absolute URL, without host, query string and trailing slash.
+
+    :param href: An absolute URL or a site-relative href.
+    :type href: str
+    :return: The site-relative path, beginning with '/'.
+    :rtype: str
+    """
+    if not href:
+        return href
+    path = urlsplit(href).path.rstrip('/')
+    return path if path.startswith('/') else '/' + path
+
+
+def split_path(href: str) -> typing.Optional[TransfermarktPath]:
+    """Split a Transfermarkt href into slug, view, entity and parameters.
+
+    The entity segment is looked for in the first three segments, so that
+    slugs looking like one (a player named "verein") are not mistaken for it.
+
+    :param href: An absolute URL or a site-relative href.
+    :type href: str
+    :return: The parts of the path, or None if it does not point to an entity page.
+    :rtype: TransfermarktPath
+    """
+    segments = (site_path(href) or '').strip('/').split('/')
+    index = next(
+        (i for i, segment in enumerate(segments[:3]) if segment in ENTITY_SEGMENTS and i + 1 < len(segments)),
+        None
+    )
+    if index is None:
+        return None
+
+    prefix = segments[:index]
+    rest = segments[index + 2:]
+    parameters = list(zip(rest[0::2], rest[1::2]))
+    if len(rest) % 2:
+        parameters.append((rest[-1], ''))
+    return TransfermarktPath(
+        slug=prefix[-2] if len(prefix) > 1 else None,
+        view=prefix[-1] if prefix else None,
+        segment=segments[index],
+        entity_id=segments[index + 1],
+        parameters=tuple(parameters),
+    )
+
+
+def canonical_url(url: str, base_url: str = None) -> str:
+    """The canonical form of a Transfermarkt URL, shared by all its variants.
+
+    The slug is replaced with a placeholder, parameters are sorted, those
+    without a value (markers such as `/plus/`) kept after the others, and
+    trailing slashes removed. The query string is canonicalized as well, and the fragment
+    dropped. URLs that do not point to an entity page only get the last two
+    steps.
+
+    :param url: An absolute URL, or a site-relative href if `base_url` is given.
+    :type url: str
+    :param base_url: The scheme and host to resolve site-relative hrefs against.
+    :type base_url: str
+    :return: The canonical URL.
+    :rtype: str
+    """
+    if base_url is not None and not urlsplit(url).scheme:
+        url = base_url.rstrip('/') + '/' + url.lstrip('/')
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        return url
+
+    path = split_path(parts.path)
+    if path is not None:
+        # parameters with a value sorted, then markers, so that canonical URLs split back the same way
+        markers = sorted(name for name, value in path.parameters if not value)
+        canonical_path = path._replace(
+            slug=CANONICAL_SLUG if path.view else None,
+            parameters=tuple(sorted((name, value) for name, value in path.parameters if value))
+        ).href() + ''.join(f'/{name}' for name in markers)
+    else:
+        canonical_path = parts.path.rstrip('/') or '/'
+    return canonicalize_url(urlunsplit((parts.scheme, parts.netloc.lower(), canonical_path, parts.query, '')))
+
+
+def entity_key(href: str) -> typing.Optional[str]:
+    """The key of the entity a Transfermarkt URL is about, whatever its view, season or slug.
+
+    :param href: An absolute URL or a site-relative href.
+    :type href: str
+    :return: A key such as "club:31", "competition:GB1" or "confederation:europa",
+      or None if the URL is not about an entity.
+    :rtype: str
+    """
+    path = split_path(href)
+    if path is not None:
+        return f"{path.entity_type}:{path.entity_id}"
+    match = CONFEDERATION_PATTERN.match(site_path(href) or '')
+    return f"confederation:{match.group(1)}" if match else None
+
+
+def entity_id(entity_type: str, href: str) -> typing.Optional[str]:
+    """Extract the id of an entity of a given type from one of its hrefs.
+
+    :param entity_type: An entity type, e.g. "competition", "club" or "player".
+    :type entity_type: str
+    :param href: An href of the entity, for any of its views and seasons.
+    :type href: str
+    :return: The id, or None if the href is not about an entity of that type.
+    :rtype: str
+    """
+    key = entity_key(href)
+    if key is None:
+        return None
+    key_type, key_id = key.split(':', 1)
+    return key_id if key_type == entity_type else None
+
+
+def replace_param(href: str, name: str, value: typing.Optional[str]) -> str:
+    """Set or remove (with a `value` of None) a path parameter of an href, such as "saison_id".
+
+    Hrefs that do not point to an entity page are returned unchanged.
+
+    :param href: A site-relative href.
+    :type href: str
+    :return: The href with the parameter replaced.
+    :rtype: str
+    """
+    path = split_path(href)
+    return path.replace_param(name, value).href() if path is not None else href
+
+
+class CanonicalRequestFingerprinter(RequestFingerprinter):
+    """Request fingerprinter hashing the canonical form of request URLs.
+
+    Equivalent URLs (see `canonical_url`) get the same fingerprint, and thus
+    share their HTTP cache entry and dupefilter slot. Opt-in, with
+    `REQUEST_FINGERPRINTER_CLASS = 'tfmkt.urls.CanonicalRequestFingerprinter'`:
+    fingerprints differ from Scrapy's, so that an HTTP cache or a `JOBDIR` left
+    by runs with the default fingerprinter is not found anymore.
+
+    https://docs.scrapy.org/en/latest/topics/request-response.html#request-fingerprinter-class
+    """
+
+    def __init__(self, crawler=None):
+        super().__init__(crawler)
+        self.cache = WeakKeyDictionary()
+
+    def fingerprint(self, request):
+        if request not in self.cache:
+            canonical = canonical_url(request.url)
+            self.cache[request] = super().fingerprint(
+                request.replace(url=canonical) if canonical != request.url else request
+            )
+        return self.cache[request]
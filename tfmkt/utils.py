@@ -1,3 +1,7 @@
+import gzip
+import json
+import typing
+
 def uri_params(params, spider):
     """uri_params is used by scrapy to generate additional parameters for URI generation.
 
@@ -49,3 +53,45 @@ def background_position_in_px_to_minute(px_x: int, px_y: int) -> int:
     y = int(y) + y_offset
 
     return matrix[y][x]
+
+
+def read_jsonlines(file_name: str) -> typing.Iterator[dict]:
+    """Read the objects of a JSON lines file, such as the output of a spider, one by one.
+
+    :param file_name: Path to the file. Files ending with ".gz" are decompressed on the fly.
+    :type file_name: str
+    :return: An iterator over the objects in the file.
+    :rtype: typing.Iterator[dict]
+    """
+    opener = gzip.open if file_name.endswith('.gz') else open
+    with opener(file_name, 'rt') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def pause_engine(crawler):
+    """Pause the engine of a crawler, on behalf of one of the components that may hold it paused.
+
+    The feed writers and the orchestrator pause engines independently: pauses
+    are counted on the crawler, and the engine is only resumed once every
+    component that paused it called `unpause_engine`.
+
+    :param crawler: The crawler whose engine is paused.
+    :type crawler: scrapy.crawler.Crawler
+    """
+    crawler.engine_pauses = getattr(crawler, 'engine_pauses', 0) + 1
+    if crawler.engine_pauses == 1:
+        crawler.engine.pause()
+
+
+def unpause_engine(crawler):
+    """Release a pause taken with `pause_engine`, and resume the engine if it was the last one.
+
+    :param crawler: The crawler whose engine was paused.
+    :type crawler: scrapy.crawler.Crawler
+    """
+    crawler.engine_pauses -= 1
+    if crawler.engine_pauses == 0:
+        crawler.engine.unpause()